@@ -0,0 +1,505 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/kadenbilyeu.com) (https://kadenbilyeu.com)
+## Use of this source code is governed by an GNU Affero General Public License v3.0
+## license that can be found in the LICENSE file.
+
+## Load benchmarks for the backend. Not part of the image, run it from the backend directory:
+## python benchmark.py sqlite-profile --concurrency 32 --duration 10
+## python benchmark.py backup --size-mb 512
+## python benchmark.py compression --posts 300 --concurrency 8 --duration 5 --view-rate 20
+
+## built-in libraries
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARK_ENV = {
+    "ADMIN_USER": "admin",
+    "ADMIN_PASS_HASH": "$2b$12$MlPMcgDvVCU.s10xcB2fneIjZ/ymgz5O52yH5pshAFF5.bwPq4SMq",
+    "TOTP_SECRET": "JBSWY3DPEHPK3PXP",
+    "ENVIRONMENT": "development",
+    "ACCESS_TOKEN_SECRET": "secret",
+    "REFRESH_TOKEN_SECRET": "secret",
+    "ENCRYPTION_KEY": "password",
+    "SMTP_SERVER": "localhost",
+    "SMTP_PORT": "1",
+    "SMTP_USER": "none",
+    "SMTP_PASSWORD": "none",
+    "FROM_EMAIL": "none",
+    "TO_EMAIL": "none",
+    ## All the load comes from one client IP, so its rate limit is lifted to measure the server itself
+    "RATE_LIMIT_RATE": "1000000",
+    "RATE_LIMIT_BURST": "1000000",
+    "METRICS_TOKEN": "benchmark"
+}
+
+SEED_SCRIPT = """
+import sys, json
+sys.path.insert(0, {backend_dir!r})
+import main
+db = main.SessionLocal()
+ids = []
+for i in range({posts}):
+    post = main.BlogPostModel(title=f"Benchmark post {{i}}", content="lorem ipsum dolor sit amet " * {words}, author="benchmark", view_count=0)
+    ids.append(str(main.func_create_blog_post(db, post).id))
+db.close()
+print(json.dumps(ids))
+"""
+
+BACKUP_SCRIPT = """
+import sys, os, time, json, resource
+sys.path.insert(0, {backend_dir!r})
+import main
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+start = time.perf_counter()
+main.write_encrypted_backup(main.DATABASE_PATH, "benchmark.db", "benchmark.db.zip.pgp", "benchmark")
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "database_bytes": os.path.getsize(main.DATABASE_PATH),
+    "output_bytes": os.path.getsize("benchmark.db.zip.pgp"),
+    "seconds": seconds,
+    "rss_before_bytes": rss_before,
+    "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+}}))
+"""
+
+VOCABULARY = ["sqlite", "backup", "blog", "post", "python", "fastapi", "react", "query", "index", "cache", "worker", "request", "latency", "page", "the", "a", "of", "and", "to", "in"]
+
+##-------------------start-of-setup-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def create_workspace(posts:int, words:int) -> typing.Tuple[str, typing.List[str]]:
+
+    """
+
+    Create a temporary working directory with a .env and a seeded database.
+
+    Args:
+    posts (int): The number of blog posts to create
+    words (int): The number of words (times five) in each post
+
+    Returns:
+    str: The path to the working directory
+    typing.List[str]: The IDs of the created blog posts
+
+    """
+
+    workspace = tempfile.mkdtemp(prefix="blog-benchmark-")
+
+    with open(os.path.join(workspace, ".env"), "w") as f:
+        for key, value in BENCHMARK_ENV.items():
+            f.write(f"{key}={value}\n")
+
+    output = subprocess.check_output(
+        [sys.executable, "-c", SEED_SCRIPT.format(backend_dir=current_dir, posts=posts, words=words)],
+        cwd=workspace,
+        stderr=subprocess.DEVNULL
+    )
+
+    return workspace, json.loads(output.decode().strip().splitlines()[-1])
+
+def get_free_port() -> int:
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(workspace:str, env:typing.Dict[str, str], workers:int = 1) -> typing.Tuple[subprocess.Popen, int]:
+
+    """
+
+    Start uvicorn in the working directory and wait until it answers.
+
+    Args:
+    workspace (str): The working directory
+    env (typing.Dict[str, str]): Extra environment variables for the server
+    workers (int): The number of uvicorn workers
+
+    Returns:
+    subprocess.Popen: The server process
+    int: The port it listens on
+
+    """
+
+    port = get_free_port()
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=workspace,
+        env={**os.environ, **env, "PYTHONPATH": current_dir},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + 60
+
+    while(time.monotonic() < deadline):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/")
+            connection.getresponse().read()
+            connection.close()
+            return process, port
+
+        except OSError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+def stop_server(process:subprocess.Popen) -> None:
+
+    process.terminate()
+
+    try:
+        process.wait(timeout=15)
+
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+##-------------------start-of-load-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def run_load(port:int, make_request:typing.Callable[[random.Random], typing.Tuple[str, str, typing.Optional[bytes], typing.Dict[str, str]]], concurrency:int, duration:float) -> typing.Dict[str, float]:
+
+    """
+
+    Send requests from concurrent keep-alive clients for the given duration.
+
+    Args:
+    port (int): The port of the server
+    make_request (typing.Callable): Returns the method, path, body and headers of the next request
+    concurrency (int): The number of concurrent clients
+    duration (float): How long to send requests for, in seconds
+
+    Returns:
+    typing.Dict[str, float]: Request count, requests per second, latency percentiles in milliseconds, error count and bytes received
+
+    """
+
+    latencies:typing.List[float] = []
+    errors = [0]
+    received = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(seed:int) -> None:
+
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local_latencies = []
+        local_errors = 0
+        local_received = 0
+
+        while(time.monotonic() < deadline):
+            method, path, body, headers = make_request(rng)
+            start = time.perf_counter()
+
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = response.read()
+
+                local_received += len(payload)
+
+                if(response.status >= 400):
+                    local_errors += 1
+
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+
+            local_latencies.append(time.perf_counter() - start)
+
+        connection.close()
+
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+            received[0] += local_received
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+
+    def percentile(fraction:float) -> float:
+        return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / duration,
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+        "errors": errors[0],
+        "bytes_received": received[0]
+    }
+
+def get_cpu_seconds(pid:int) -> float:
+
+    """
+
+    Get the user and system CPU time a process has used so far, from /proc.
+
+    Args:
+    pid (int): The process
+
+    Returns:
+    float: The CPU time in seconds
+
+    """
+
+    with open(f"/proc/{pid}/stat", "r") as f:
+        fields = f.read().rpartition(")")[2].split()
+
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def get_metric_values(port:int, name:str) -> typing.Dict[str, float]:
+
+    """
+
+    Read the samples of one metric from /metrics, summed over the workers by the server.
+
+    Args:
+    port (int): The port of the server
+    name (str): The sample name, such as response_store_build_duration_seconds_sum
+
+    Returns:
+    typing.Dict[str, float]: The values keyed by their label set, "" for a sample without labels
+
+    """
+
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    try:
+        connection.request("GET", "/metrics", headers={"Authorization": f"Bearer {BENCHMARK_ENV['METRICS_TOKEN']}"})
+        text = connection.getresponse().read().decode()
+
+    finally:
+        connection.close()
+
+    values = {}
+
+    for line in text.splitlines():
+        sample, _, value = line.rpartition(" ")
+
+        if(sample == name or sample.startswith(name + "{")):
+            values[sample[len(name):]] = float(value)
+
+    return values
+
+def run_viewer(port:int, ids:typing.List[str], rate:float, stop_event:threading.Event) -> None:
+
+    """
+
+    Read random posts at a fixed rate until stopped, so the workers keep flushing view counts during a run.
+
+    Args:
+    port (int): The port of the server
+    ids (typing.List[str]): The IDs of the blog posts
+    rate (float): Views per second
+    stop_event (threading.Event): Set to stop viewing
+
+    """
+
+    rng = random.Random(0)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    while(not stop_event.wait(1 / rate)):
+        try:
+            connection.request("GET", f"/blog/{rng.choice(ids)}", headers={"CF-Connecting-IP": "10.0.0.1"})
+            connection.getresponse().read()
+
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    connection.close()
+
+def print_results(label:str, results:typing.Dict[str, float]) -> None:
+
+    print(f"{label:<28} {results['requests_per_second']:>10.1f} req/s   p50 {results['p50_ms']:>8.2f} ms   p99 {results['p99_ms']:>8.2f} ms   errors {int(results['errors'])}")
+
+##-------------------start-of-scenarios-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def benchmark_sqlite_profile(args:argparse.Namespace) -> None:
+
+    """
+
+    Compare the SQLite defaults the backend used to run with against the tuned profile, with two workers reading and writing at once.
+
+    Every view is flushed straight away, so each read is followed by a view count write from one of the workers.
+
+    """
+
+    profiles = {
+        "before (rollback journal)": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT": "5000", "SQLITE_CACHE_SIZE": "-2000", "SQLITE_MMAP_SIZE": "0", "SQLITE_TEMP_STORE": "DEFAULT"},
+        "after (WAL profile)": {}
+    }
+
+    for label, profile in profiles.items():
+        workspace, ids = create_workspace(args.posts, args.words)
+
+        def make_request(rng:random.Random) -> typing.Tuple[str, str, typing.Optional[bytes], typing.Dict[str, str]]:
+            return "GET", f"/blog/{rng.choice(ids)}", None, {}
+
+        try:
+            process, port = start_server(workspace, {**profile, "BLOG_CACHE_SIZE": "0", "VIEW_COUNT_FLUSH_THRESHOLD": "1", "VIEW_COUNT_FLUSH_INTERVAL": "0.05"}, workers=2)
+
+            try:
+                results = run_load(port, make_request, args.concurrency, args.duration)
+
+            finally:
+                stop_server(process)
+
+            ## Views that never made it to disk were lost to lock errors
+            with sqlite3.connect(os.path.join(workspace, "database", "blog.db")) as connection:
+                recorded = connection.execute("SELECT COALESCE(SUM(view_count), 0) FROM blog_posts").fetchone()[0]
+
+            print_results(label, results)
+            print(f"{'':<28} views recorded {recorded} of {int(results['requests'])}")
+
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+def benchmark_backup(args:argparse.Namespace) -> None:
+
+    """
+
+    Time the single-pass backup pipeline (snapshot, zip and encrypt) on a database of about --size-mb megabytes.
+
+    """
+
+    workspace, _ = create_workspace(0, 0)
+
+    try:
+        rng = random.Random(0)
+        database_path = os.path.join(workspace, "database", "blog.db")
+
+        with sqlite3.connect(database_path) as connection:
+            for i in range(max(args.size_mb * 4, 1)):
+                content = " ".join(rng.choice(VOCABULARY) for _ in range(45000))
+                connection.execute(
+                    "INSERT INTO blog_posts (id, title, slug, content, excerpt, word_count, author, created_at, updated_at, view_count) VALUES (?, ?, ?, ?, ?, ?, 'benchmark', datetime('now'), datetime('now'), 0)",
+                    (os.urandom(16).hex(), f"Large post {i}", f"large-post-{i}", content, content[:200], 45000)
+                )
+
+        output = subprocess.check_output(
+            [sys.executable, "-c", BACKUP_SCRIPT.format(backend_dir=current_dir)],
+            cwd=workspace,
+            env={**os.environ, "BACKUP_COMPRESSION_LEVEL": str(args.compression_level)},
+            stderr=subprocess.DEVNULL
+        )
+
+        results = json.loads(output.decode().strip().splitlines()[-1])
+        megabytes = results["database_bytes"] / (1024 * 1024)
+
+        print(f"database        {megabytes:>10.1f} MB")
+        print(f"backup          {results['seconds']:>10.2f} s   {megabytes / results['seconds']:>8.1f} MB/s")
+        print(f"output          {results['output_bytes'] / (1024 * 1024):>10.1f} MB")
+        print(f"peak RSS        {results['peak_rss_bytes'] / (1024 * 1024):>10.1f} MB   ({results['rss_before_bytes'] / (1024 * 1024):.1f} MB before the backup)")
+
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def benchmark_compression(args:argparse.Namespace) -> None:
+
+    """
+
+    Measure bytes on the wire and server CPU per request for the list endpoints under each Accept-Encoding.
+
+    The full lists are served from pre-compressed variants, the cursor page is compressed per request. Posts are viewed at
+    --view-rate while the lists are read and views are flushed every second, so the CPU per request includes rebuilding
+    the stored variants after each flush. One worker, so its CPU time is the server's.
+
+    """
+
+    workspace, ids = create_workspace(args.posts, args.words)
+
+    routes = ["/all-blogs", "/all-blog-summaries", "/latest-blogs", "/latest-blog-summaries", "/all-blogs?cursor="]
+    encodings = ["identity", "gzip", "br"]
+
+    try:
+        process, port = start_server(workspace, {"VIEW_COUNT_FLUSH_INTERVAL": "1"})
+
+        try:
+            for path in routes:
+                for encoding in encodings:
+
+                    ## The list rate limit is per IP and has its own rule, so every request comes from a new address
+                    def make_request(rng:random.Random) -> typing.Tuple[str, str, typing.Optional[bytes], typing.Dict[str, str]]:
+                        return "GET", path, None, {"Accept-Encoding": encoding, "CF-Connecting-IP": ".".join(str(rng.randrange(256)) for _ in range(4))}
+
+                    stop_event = threading.Event()
+                    viewer = threading.Thread(target=run_viewer, args=(port, ids, args.view_rate, stop_event))
+
+                    cpu_before = get_cpu_seconds(process.pid)
+                    viewer.start()
+
+                    try:
+                        results = run_load(port, make_request, args.concurrency, args.duration)
+
+                    finally:
+                        stop_event.set()
+                        viewer.join()
+
+                    cpu_per_request = (get_cpu_seconds(process.pid) - cpu_before) / max(results["requests"], 1)
+
+                    print_results(f"{path} {encoding}", results)
+                    print(f"{'':<28} {results['bytes_received'] / max(results['requests'], 1):>10.0f} bytes/response   cpu {cpu_per_request * 1000:>6.3f} ms/request")
+
+            build_seconds = get_metric_values(port, "response_store_build_duration_seconds_sum")
+            build_counts = get_metric_values(port, "response_store_build_duration_seconds_count")
+
+            for labels, count in sorted(build_counts.items()):
+                print(f"store builds {labels:<15} {int(count):>10}   {build_seconds.get(labels, 0) / max(count, 1) * 1000:>8.2f} ms each   {build_seconds.get(labels, 0):>8.2f} s total")
+
+        finally:
+            stop_server(process)
+
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+SCENARIOS:typing.Dict[str, typing.Callable[[argparse.Namespace], None]] = {
+    "sqlite-profile": benchmark_sqlite_profile,
+    "backup": benchmark_backup,
+    "compression": benchmark_compression
+}
+
+##-------------------start-of-main()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Load benchmarks for the backend")
+    parser.add_argument("scenario", choices=SCENARIOS.keys())
+    parser.add_argument("--posts", type=int, default=200, help="Number of blog posts to seed")
+    parser.add_argument("--words", type=int, default=400, help="Words per post, times five")
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per run")
+    parser.add_argument("--size-mb", type=int, default=256, help="Approximate database size for the backup scenario")
+    parser.add_argument("--compression-level", type=int, default=6, help="BACKUP_COMPRESSION_LEVEL for the backup scenario")
+    parser.add_argument("--view-rate", type=float, default=20, help="Post views per second during the compression scenario")
+
+    args = parser.parse_args()
+
+    SCENARIOS[args.scenario](args)
+
+if(__name__ == "__main__"):
+    main()
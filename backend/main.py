@@ -7,10 +7,32 @@ from uuid import UUID as schemaUUID, uuid4
 from datetime import datetime, timedelta, timezone
 
 import typing
+import abc
+import contextlib
+import asyncio
 import os
 import time
 import threading
 import shutil
+import sqlite3
+import re
+import json
+import base64
+import hashlib
+import hmac
+import gzip
+import fcntl
+import struct
+import zlib
+import mmap
+import math
+import bisect
+import random
+import functools
+import contextvars
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import zipfile
 import smtplib
@@ -19,17 +41,24 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
+from email.utils import format_datetime, parsedate_to_datetime
+from xml.sax.saxutils import escape as xml_escape
 
 ## third-party libraries
 from fastapi import FastAPI, HTTPException, status, Cookie, Depends, File, UploadFile, Request, Header
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import  HTTPBasicCredentials, HTTPBasic, OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+
+import fastapi.routing
 
 from pydantic import BaseModel
 
-from sqlalchemy import create_engine, Engine, Column, String, Text, DateTime, inspect, Inspector, Integer, text
-from sqlalchemy.orm import sessionmaker, close_all_sessions, Session
+from sqlalchemy import create_engine, event, Engine, Column, String, Text, DateTime, inspect, Inspector, Integer, Float, text, update, bindparam, func, Index, or_, and_, literal_column, select, Select
+from sqlalchemy.orm import sessionmaker, close_all_sessions, Session, load_only
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta
 from sqlalchemy.dialects.postgresql import UUID as modelUUID
 
@@ -40,9 +69,19 @@ from jwt import PyJWTError
 
 import pyotp
 import jwt
-import atexit
 import shelve
 
+## optional third-party libraries
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
 ##-----------------------------------------start-of-pydantic-models----------------------------------------------------------------------------------------------------------------------------------------------------------
 
 class LoginModel(BaseModel):
@@ -76,10 +115,57 @@ class BlogPostRead(BlogPostBase):
     created_at:datetime
     updated_at:datetime
     view_count:int
+    slug:typing.Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class BlogPostPage(BaseModel):
+    items:typing.List[BlogPostRead]
+    next_cursor:typing.Optional[str] = None
+
+class BlogPostSummary(BaseModel):
+    id:schemaUUID
+    title:str
+    slug:typing.Optional[str] = None
+    author:str
+    created_at:datetime
+    updated_at:datetime
+    view_count:int
+    excerpt:typing.Optional[str] = None
+    word_count:typing.Optional[int] = None
 
     class Config:
         from_attributes = True
 
+class BlogPostSummaryPage(BaseModel):
+    items:typing.List[BlogPostSummary]
+    next_cursor:typing.Optional[str] = None
+
+class BlogPostSearchResult(BlogPostSummary):
+    snippet:str
+    rank:float
+
+class BlogPostSearchResults(BaseModel):
+    query:str
+    total:int
+    items:typing.List[BlogPostSearchResult]
+
+class JobRead(BaseModel):
+    id:str
+    kind:str
+    trigger:str
+    status:str
+    stage:typing.Optional[str] = None
+    progress:float
+    stages:typing.Dict[str, float]
+    error:typing.Optional[str] = None
+    size:typing.Optional[int] = None
+    duration:typing.Optional[float] = None
+    created_at:datetime
+    started_at:typing.Optional[datetime] = None
+    finished_at:typing.Optional[datetime] = None
+
 ##-----------------------------------------start-of-constants----------------------------------------------------------------------------------------------------------------------------------------------------------
 
 def get_env_variables() -> None:
@@ -100,8 +186,6 @@ def get_env_variables() -> None:
 
 get_env_variables()
 
-maintenance_mode = False
-maintenance_lock = threading.Lock()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -117,6 +201,97 @@ ENVIRONMENT = os.environ.get("ENVIRONMENT", "development")
 
 TOKEN_ALGORITHM = "HS256"
 TOKEN_EXPIRE_MINUTES = 1440
+## Verified access tokens are remembered until they expire, so admin requests skip jwt.decode
+TOKEN_CACHE_SIZE = 256
+
+## Failed logins allowed per client IP and per username in the window before bcrypt is no longer even tried
+LOGIN_MAX_FAILURES = int(os.environ.get("LOGIN_MAX_FAILURES", 5))
+LOGIN_FAILURE_WINDOW = float(os.environ.get("LOGIN_FAILURE_WINDOW", 300))
+LOGIN_MAX_PASSWORD_LENGTH = 1024
+
+## Every client IP gets RATE_LIMIT_RATE requests per second with bursts of RATE_LIMIT_BURST, shared by both workers
+RATE_LIMIT_RATE = float(os.environ.get("RATE_LIMIT_RATE", 10))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 40))
+## Tighter budgets for the expensive routes, on top of the overall one: (name, path prefix, requests per second, burst)
+RATE_LIMIT_RULES:typing.List[typing.Tuple[str, str, float, float]] = [
+    ("search", "/blog/search", 2, 10),
+    ("lists", "/all-blog", 2, 10),
+    ("lists", "/latest-blog", 2, 10),
+    ("login", "/login", 0.2, 5),
+    ("admin", "/replace-database", 0.1, 2)
+]
+RATE_LIMIT_SLOTS = 8192
+
+## Requests a worker works on at once, matching the threadpool the sync endpoints run on, and how many more may wait for a slot
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 40))
+ADMISSION_MAX_QUEUED = int(os.environ.get("ADMISSION_MAX_QUEUED", 100))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 5))
+
+## SQLite tuning profile, applied to every connection by create_database_engine
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -16000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 134217728))
+SQLITE_TEMP_STORE = os.environ.get("SQLITE_TEMP_STORE", "MEMORY")
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+SQLITE_POOL_OVERFLOW = int(os.environ.get("SQLITE_POOL_OVERFLOW", 8))
+## Seconds a write waits for the single writer connection before failing
+SQLITE_WRITER_TIMEOUT = float(os.environ.get("SQLITE_WRITER_TIMEOUT", 30))
+
+## Pages read per backup step, and seconds slept between steps so live traffic gets the disk
+BACKUP_STEP_PAGES = int(os.environ.get("BACKUP_STEP_PAGES", 256))
+BACKUP_STEP_SLEEP = float(os.environ.get("BACKUP_STEP_SLEEP", 0.01))
+BACKUP_SNAPSHOT_ATTEMPTS = 5
+## zlib level for the backup archive, 1 is several times faster than the default 6 on large databases
+BACKUP_COMPRESSION_LEVEL = int(os.environ.get("BACKUP_COMPRESSION_LEVEL", 6))
+
+## "full" mails the whole database on every scheduled backup, "incremental" only mails the page chunks that changed since the last one
+BACKUP_MODE = os.environ.get("BACKUP_MODE", "full")
+BACKUP_CHUNK_PAGES = int(os.environ.get("BACKUP_CHUNK_PAGES", 64))
+## Every this many scheduled backups all chunks are sent again, so a restore chain never grows past it
+BACKUP_FULL_EVERY = int(os.environ.get("BACKUP_FULL_EVERY", 28))
+BACKUP_INTERVAL = timedelta(hours=6)
+## How often a worker that is not the scheduler leader checks whether the leader is gone
+SCHEDULER_LEADER_RETRY = float(os.environ.get("SCHEDULER_LEADER_RETRY", 10))
+
+## How often each worker checks whether another one wants it in maintenance, and how long a restore waits for them all
+MAINTENANCE_POLL_INTERVAL = float(os.environ.get("MAINTENANCE_POLL_INTERVAL", 0.2))
+MAINTENANCE_TIMEOUT = float(os.environ.get("MAINTENANCE_TIMEOUT", 30))
+
+## Stored in PRAGMA user_version by migrate_database, restores refuse databases from a newer schema
+SCHEMA_VERSION = 1
+
+## How often each worker writes its metrics for /metrics to add up, and how long the metrics of an exited worker are kept
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 2))
+METRICS_RETENTION = float(os.environ.get("METRICS_RETENTION", 86400))
+## A long-lived bearer token for the Prometheus scraper, which cannot log in with a TOTP code. Unset, /metrics takes only admin tokens
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or ""
+METRICS_REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+METRICS_BACKUP_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+## Opt-in request tracing. A traced request is written to TRACE_LOG_PATH when it took TRACE_SLOW_THRESHOLD seconds or more, or when it is sampled at TRACE_SAMPLE_RATE
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SLOW_THRESHOLD = float(os.environ.get("TRACE_SLOW_THRESHOLD", 0.5))
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+TRACE_LOG_MAX_BYTES = int(os.environ.get("TRACE_LOG_MAX_BYTES", 50 * 1024 * 1024))
+TRACE_PLAN_CACHE_SIZE = 256
+TRACE_SERVICE_NAME = "kadenbilyeu-backend"
+## The FastAPI release whose private request handler functions install_fastapi_tracing wraps, and the spans they become
+TRACE_FASTAPI_VERSION = "0.110."
+TRACE_FASTAPI_FUNCTIONS = {"solve_dependencies": "dependencies", "run_endpoint_function": "endpoint", "serialize_response": "serialize response"}
+
+VIEW_COUNT_FLUSH_INTERVAL = float(os.environ.get("VIEW_COUNT_FLUSH_INTERVAL", 5))
+VIEW_COUNT_FLUSH_THRESHOLD = int(os.environ.get("VIEW_COUNT_FLUSH_THRESHOLD", 100))
+VIEW_COUNT_SLOTS = 4096
+
+ALL_BLOGS_PAGE_SIZE = 50
+
+## The slug of a post whose title has no characters a slug can keep, numbered like any other when it is taken
+UNTITLED_SLUG = "post"
+
+EXCERPT_LENGTH = 200
 
 if(not os.path.exists("database") and ADMIN_USER == "admin"):
     os.makedirs("database", exist_ok=True)
@@ -125,10 +300,59 @@ elif(not os.path.exists("database") and ADMIN_USER != "admin"):
     raise NotImplementedError("Database volume not attached and running in production mode, please exit and attach the volume")
 
 DATABASE_URL: str = "sqlite:///./database/blog.db"
+READ_ONLY_DATABASE_URL: str = "sqlite:///file:./database/blog.db?mode=ro&uri=true"
 DATABASE_PATH: str = "database/blog.db"
 BACKUP_LOGS_DIR = 'database/logs'
+JOBS_DATABASE_URL: str = "sqlite:///./database/logs/jobs.db"
+BACKUP_SCHEDULER_SHELVE_PATH = 'database/logs/backup_scheduler.db'
+BACKUP_LOCK_PATH = 'database/logs/backup.lock'
+SCHEDULER_LOCK_PATH = 'database/logs/scheduler.lock'
+MAINTENANCE_PATH = 'database/logs/maintenance'
+WORKERS_DIR = 'database/logs/workers'
+## Restores are unpacked next to the database, so the swap is a rename on the same filesystem
+RESTORE_DATABASE_PATH: str = "database/blog.db.restore"
+RATE_LIMIT_PATH = 'database/logs/rate_limit'
+METRICS_DIR = 'database/logs/metrics'
+TRACE_LOG_PATH = 'database/logs/traces.jsonl'
+TRACE_LOCK_PATH = 'database/logs/traces.lock'
+CACHE_GENERATION_PATH = 'database/cache_generation'
+VIEW_GENERATION_PATH = 'database/view_generation'
+VIEW_COUNTS_PATH = 'database/view_counts'
+
+BLOG_CACHE_SIZE = int(os.environ.get("BLOG_CACHE_SIZE", 512))
+BLOG_CACHE_TTL = float(os.environ.get("BLOG_CACHE_TTL", 60))
+
+## Posts are always revalidated so every view still reaches the origin and gets counted
+POST_CACHE_CONTROL = "public, no-cache"
+LIST_CACHE_CONTROL = f"public, max-age={int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))}"
+
+## Only the whole archive and the default limit of the latest endpoints are stored, other limits are read through the cache
+RESPONSE_STORE_LIMITS = (None, 5)
+RESPONSE_STORE_MAX_BODY_SIZE = int(os.environ.get("RESPONSE_STORE_MAX_BODY_SIZE", 32 * 1024 * 1024))
+RESPONSE_STORE_CHECK_INTERVAL = float(os.environ.get("RESPONSE_STORE_CHECK_INTERVAL", 5))
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
+## Stored variants are rebuilt after every view flush, so they only get a little more than the per-request settings
+COMPRESSION_STORED_GZIP_LEVEL = int(os.environ.get("COMPRESSION_STORED_GZIP_LEVEL", 6))
+COMPRESSION_STORED_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_STORED_BROTLI_QUALITY", 5))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_THREADPOOL_SIZE = 256 * 1024
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/xml", "application/rss+xml", "text/")
+
+SITE_DOMAINS = ["https://kadenbilyeu.com", "https://bikatr7.com"]
+SITEMAP_STATIC_PAGES = [
+    ("/", "1.0", "weekly"),
+    ("/portfolio", "0.9", "monthly"),
+    ("/blog", "0.8", "daily"),
+    ("/blog/directory", "0.7", "daily")
+]
+FEED_TITLE = "Kaden Bilyeu's Blog"
+FEED_DESCRIPTION = "Blog posts by Kaden Bilyeu (Bikatr7) about software engineering and technology."
+FEED_ITEM_LIMIT = 50
 
 Base:DeclarativeMeta = declarative_base()
+JobsBase:DeclarativeMeta = declarative_base()
 
 security = HTTPBasic()
 
@@ -141,6 +365,10 @@ assert TOTP_SECRET, "TOTP_SECRET environment variable not set"
 assert ACCESS_TOKEN_SECRET, "ACCESS_TOKEN_SECRET environment variable not set"
 assert REFRESH_TOKEN_SECRET, "REFRESH_TOKEN_SECRET environment variable not set"
 assert ENCRYPTION_KEY, "ENCRYPTION_KEY environment variable not set"
+assert SQLITE_JOURNAL_MODE.upper() in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"), "SQLITE_JOURNAL_MODE is not a valid journal mode"
+assert SQLITE_SYNCHRONOUS.upper() in ("OFF", "NORMAL", "FULL", "EXTRA"), "SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA"
+assert BACKUP_MODE in ("full", "incremental"), "BACKUP_MODE must be full or incremental"
+assert SQLITE_TEMP_STORE.upper() in ("DEFAULT", "FILE", "MEMORY"), "SQLITE_TEMP_STORE must be DEFAULT, FILE or MEMORY"
 ##----------------------------------/----------------------------------##
 
 class BlogPostModel(Base):
@@ -149,827 +377,5992 @@ class BlogPostModel(Base):
     title = Column(String, index=True)
     content = Column(Text, nullable=False)
     author = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     view_count = Column(Integer, default=0)
+    slug = Column(String, unique=True, index=True)
+    excerpt = Column(String)
+    word_count = Column(Integer)
 
-##-----------------------------------------start-of-migrations----------------------------------------------------------------------------------------------------------------------------------------------------------
+    __table_args__ = (
+        Index("ix_blog_posts_created_at_id", "created_at", "id"),
+    )
 
-def migrate_database(engine:Engine) -> None:
+## Columns needed for listings, loaded without the content blob
+summary_columns = load_only(
+    BlogPostModel.id,
+    BlogPostModel.title,
+    BlogPostModel.slug,
+    BlogPostModel.author,
+    BlogPostModel.created_at,
+    BlogPostModel.updated_at,
+    BlogPostModel.view_count,
+    BlogPostModel.excerpt,
+    BlogPostModel.word_count
+)
 
-    """
+class BackupJobModel(JobsBase):
+    __tablename__ = "backup_jobs"
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)
+    trigger = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    stage = Column(String)
+    progress = Column(Float, default=0.0)
+    stages = Column(Text)
+    error = Column(Text)
+    size = Column(Integer)
+    duration = Column(Float)
+    manifest = Column(Text)
+    pid = Column(Integer)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_backup_jobs_kind_created_at", "kind", "created_at"),
+    )
+
+##----------------------------------/----------------------------------##
+
+def create_slug(title:str) -> str:
 
-    Performs database migrations if needed.
-    
     """
 
-    inspector = inspect(engine)
+    Create a URL slug from the given title. Must match createSlug() in the frontend utils.
 
-    inspector.clear_cache()
+    Args:
+    title (str): The title to create the slug from
 
-    columns = [col['name'] for col in inspector.get_columns('blog_posts')]
-    
-    ## Migration 1 (2024-08-14) (Addition of view_count to blog_posts)
-    try:
-        columns = [col['name'].lower() for col in inspector.get_columns('blog_posts')]
+    Returns:
+    str: The slug
 
-        print(f"Current columns in blog_posts: {columns}")
+    """
 
-        if('view_count' not in columns):
-            print("view_count column not found. Attempting to add it.")
-            with engine.connect() as connection:
-                connection.execute(text("ALTER TABLE blog_posts ADD COLUMN view_count INTEGER DEFAULT 0"))
-                connection.commit()
+    result = re.sub(r'[^\w\s-]', '', title.lower())
+    result = re.sub(r'\s+', '-', result)
+    result = re.sub(r'--+', '-', result)
+    return result.strip().strip('-')
 
-            print("Added view_count column to blog_posts table")
-        else:
-            print("view_count column already exists in blog_posts table")
-        
-        inspector.clear_cache()
-        columns = [col['name'].lower() for col in inspector.get_columns('blog_posts')]
-        
-    except Exception as e:
-        print(f"Error during migration: {str(e)}")
-        pass
+def create_excerpt(content:str) -> str:
 
-##----------------------------------/----------------------------------##
+    """
 
-engine:Engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal:sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Create a short plain excerpt from the start of the given content.
 
-def create_tables_if_not_exist(engine, base:DeclarativeMeta) -> None:
-    inspector:Inspector = inspect(engine)
-    for table_name in base.metadata.tables.keys():
-        if(not inspector.has_table(table_name)):
-            base.metadata.tables[table_name].create(engine)
+    Args:
+    content (str): The content of the blog post
 
-create_tables_if_not_exist(engine, Base)
+    Returns:
+    str: The excerpt, cut at a word boundary
 
-migrate_database(engine)
+    """
 
-##----------------------------------/----------------------------------##
+    collapsed = " ".join(content.split())
 
-def get_envs() -> typing.Tuple[str, str, int, str, str, str, str]:
+    if(len(collapsed) <= EXCERPT_LENGTH):
+        return collapsed
 
-    """
-    
-    Get the environment variables from the .env file
+    return collapsed[:EXCERPT_LENGTH].rsplit(" ", 1)[0] + "..."
 
-    Returns:
-    ENCRYPTION_KEY (str): The encryption key to encrypt/decrypt the database
-    SMTP_SERVER (str): The SMTP server to send the email
-    SMTP_PORT (int): The SMTP port to send the email
-    SMTP_USER (str): The SMTP user to send the email
-    SMTP_PASSWORD (str): The SMTP password to send the email
-    FROM_EMAIL (str): The email address to send the email from
-    TO_EMAIL (str): The email address to send the email to
+def count_words(content:str) -> int:
 
     """
 
-    if(os.path.exists(".env")):
-        with open(".env", "r") as f:
-            for line in f:
-                key, value = line.strip().split("=")
-                os.environ[key] = value
+    Count the whitespace separated words in the given content.
 
-    ENCRYPTION_KEY:str = os.getenv('ENCRYPTION_KEY') or ""
-    SMTP_SERVER:str = os.getenv('SMTP_SERVER') or ""
-    SMTP_PORT:int = int(os.getenv('SMTP_PORT') or 0)
-    SMTP_USER = os.getenv('SMTP_USER') or ""
-    SMTP_PASSWORD = os.getenv('SMTP_PASSWORD') or ""
-    FROM_EMAIL = os.getenv('FROM_EMAIL') or ""
-    TO_EMAIL = os.getenv('TO_EMAIL') or ""
+    Args:
+    content (str): The content of the blog post
 
-    assert(ENCRYPTION_KEY != ""), "ENCRYPTION_KEY is required"
-    assert(SMTP_SERVER != ""), "SMTP_SERVER is required"
-    assert(SMTP_PORT != 0), "SMTP_PORT is required"
-    assert(SMTP_USER != ""), "SMTP_USER is required"
-    assert(SMTP_PASSWORD != ""), "SMTP_PASSWORD is required"
-    assert(FROM_EMAIL != ""), "FROM_EMAIL is required"
-    assert(TO_EMAIL != ""), "TO_EMAIL is required"
+    Returns:
+    int: The number of words
 
-    return ENCRYPTION_KEY, SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL, TO_EMAIL
+    """
 
-##-----------------------------------------start-of-backup----------------------------------------------------------------------------------------------------------------------------------------------------------
+    return len(content.split())
 
-def export_db(db_path:str, export_path:str) -> str:
+def create_base_slug(title:str) -> str:
 
     """
 
-    Export the SQLite database to a new file
+    Create the slug a title starts from before it is made unique. Titles with nothing to slug, like "!!!", get UNTITLED_SLUG
+    so that every post stays reachable through /blog/slug/{slug}.
 
     Args:
-    db_path (str): The path to the SQLite database file
-    export_path (str): The path to the exported SQLite database file
+    title (str): The title to create the slug from
 
     Returns:
-    export_path (str): The path to the exported SQLite database file
+    str: The slug, never empty
 
     """
 
-    shutil.copy(db_path, export_path)
-    return export_path
-
-##----------------------------------/----------------------------------##
+    return create_slug(title) or UNTITLED_SLUG
 
-def encrypt_file(file_path:str, passphrase:str) -> str:
+def create_unique_slug(title:str, taken_slugs:typing.Iterable[str]) -> str:
 
     """
 
-    Encrypt the file using the GPG encryption algorithm
+    Create a slug from the given title that does not collide with any of the taken slugs.
 
     Args:
-    file_path (str): The path to the file to encrypt
-    passphrase (str): The passphrase to encrypt the file with
+    title (str): The title to create the slug from
+    taken_slugs (typing.Iterable[str]): The slugs already in use
 
     Returns:
-    encrypted_path (str): The path to the encrypted file
+    str: The unique slug
 
     """
 
-    gpg = GPG()
-    encrypted_path = file_path + '.pgp'
-    
-    with open(file_path, 'rb') as f:
-        status = gpg.encrypt_file(
-            f, 
-            recipients=None, 
-            symmetric=True, 
-            passphrase=passphrase, 
-            output=encrypted_path
-        )
-        
-    if(not status.ok):
-        raise ValueError(f'Failed to encrypt the file: {status.stderr}')
+    taken_slugs = set(taken_slugs)
+    base_slug = create_base_slug(title)
+    slug = base_slug
+    suffix = 2
 
-    return encrypted_path
+    while(slug in taken_slugs):
+        slug = f"{base_slug}-{suffix}"
+        suffix += 1
 
-def decrypt_file(file_path:str, passphrase:str) -> str:
+    return slug
 
-    """
+##-----------------------------------------start-of-metrics----------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    Decrypt the file using the GPG encryption algorithm
+MetricKey = typing.Tuple[str, typing.Tuple[typing.Tuple[str, str], ...]]
 
-    Args:
-    file_path (str): The path to the file to decrypt
+class MetricsRegistry:
 
-    Returns:
-    decrypted_path (str): The path to the decrypted file
+    """
+
+    Counters, gauges and histograms in the Prometheus text format, added up across the uvicorn workers.
+
+    Every worker keeps its own values and writes them to a file named after its pid in directory every flush_interval, and /metrics adds up the files of all workers.
+    Counters of a worker that has exited are kept for retention seconds so totals do not drop when one is replaced, gauges only count workers that wrote recently.
 
     """
 
-    gpg = GPG()
-    decrypted_path = file_path.replace('.pgp', '')
-    
-    with open(file_path, 'rb') as f:
-        status = gpg.decrypt_file(
-            f, 
-            passphrase=passphrase, 
-            output=decrypted_path
-        )
-        
-    if(not status.ok):
-        raise ValueError(f'Failed to decrypt the file: {status.stderr}')
+    def __init__(self, directory:str, flush_interval:float, retention:float) -> None:
 
-    return decrypted_path
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.retention = retention
 
-##----------------------------------/----------------------------------##
+        self._definitions:typing.Dict[str, typing.Tuple[str, str, typing.Tuple[float, ...]]] = {}
+        self._values:typing.Dict[MetricKey, float] = {}
+        self._histograms:typing.Dict[MetricKey, typing.List[float]] = {}
+        self._collectors:typing.List[typing.Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread:typing.Optional[threading.Thread] = None
 
-def compress_file(file_path:str) -> str:
+    def define(self, name:str, kind:str, description:str, buckets:typing.Tuple[float, ...] = ()) -> None:
 
-    """
+        """
 
-    Compress the file into a zip archive
+        Declare a metric, which has to happen before it is recorded.
 
-    Args:
-    file_path (str): The path to the file to compress
+        Args:
+        name (str): The metric name
+        kind (str): "counter", "gauge" or "histogram"
+        description (str): The HELP text
+        buckets (typing.Tuple[float, ...]): The upper bounds of a histogram's buckets
 
-    Returns:
-    compressed_path (str): The path to the compressed file
+        """
 
-    """
+        self._definitions[name] = (kind, description, tuple(buckets))
 
-    compressed_path = file_path + '.zip'
+    def add_collector(self, collector:typing.Callable[[], None]) -> None:
 
-    with zipfile.ZipFile(compressed_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(file_path, os.path.basename(file_path))
+        """
 
-    return compressed_path
+        Register a function that sets the values this worker samples instead of counting, called before every snapshot.
 
-def decompress_file(file_path:str, decompressed_path:str) -> str:
+        Args:
+        collector (typing.Callable[[], None]): The function
 
-    """
+        """
 
-    Decompress the file from a zip archive
+        self._collectors.append(collector)
 
-    Args:
-    file_path (str): The path to the file to decompress
+    def inc(self, name:str, labels:typing.Optional[typing.Dict[str, str]] = None, amount:float = 1.0) -> None:
 
-    Returns:
-    decompressed_path (str): The path to the decompressed file
+        key = (name, tuple(sorted((labels or {}).items())))
 
-    """
-    
-    with zipfile.ZipFile(file_path, 'r') as zipf:
-        
-        ## Extract all files to a temporary directory
-        temp_dir = os.path.join(os.getcwd(), "temp_extracted")
-        os.makedirs(temp_dir, exist_ok=True)
-        zipf.extractall(temp_dir)
-        
-        extracted_files = os.listdir(temp_dir)
-        
-        if(not extracted_files):
-            raise FileNotFoundError("No files found in the zip archive")
-        
-        extracted_file = extracted_files[0]
-        extracted_file_path = os.path.join(temp_dir, extracted_file)
-        
-        shutil.move(extracted_file_path, decompressed_path)
-    
-        shutil.rmtree(temp_dir)
-        
-    return decompressed_path
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
 
-##----------------------------------/----------------------------------##
+    def set(self, name:str, value:float, labels:typing.Optional[typing.Dict[str, str]] = None) -> None:
 
-def send_email(subject:str, body:str, to_email:str, attachment_path:str, from_email:str, smtp_server:str, smtp_port:int, smtp_user:str, smtp_password:str) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
 
-    """
+        with self._lock:
+            self._values[key] = float(value)
 
-    Send an email with an attachment
+    def observe(self, name:str, value:float, labels:typing.Optional[typing.Dict[str, str]] = None) -> None:
 
-    Args:
-    subject (str): The subject of the email
-    body (str): The body of the email
-    to_email (str): The email address to send the email to
-    attachment_path (str): The path to the attachment to send
-    from_email (str): The email address to send the email from
-    smtp_server (str): The SMTP server to send the email
-    smtp_port (int): The SMTP port to send the email
-    smtp_user (str): The SMTP user to send the email
-    smtp_password (str): The SMTP password to send the email
+        """
 
-    """
+        Record a value in a histogram.
 
+        Args:
+        name (str): The metric name
+        value (float): The observed value
+        labels (typing.Optional[typing.Dict[str, str]]): The label values
 
-    msg = MIMEMultipart()
-    msg['Subject'] = subject
-    msg['From'] = from_email
-    msg['To'] = to_email
+        """
 
-    msg.attach(MIMEText(body, 'plain'))
+        buckets = self._definitions[name][2]
+        key = (name, tuple(sorted((labels or {}).items())))
 
-    with open(attachment_path, 'rb') as f:
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(f.read())
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_path)}')
-        msg.attach(part)
+        with self._lock:
+            histogram = self._histograms.get(key)
 
-    try:
+            ## One count per bucket, one for +Inf, then the sum
+            if(histogram is None):
+                histogram = self._histograms[key] = [0.0] * (len(buckets) + 2)
 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls() 
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
-            server.quit()
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
 
-    except Exception as e:
-        print(f"Error: {e}")
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
 
-##----------------------------------/----------------------------------##
+        """
 
-def perform_backup() -> None:
+        Get this worker's values, after running the collectors.
 
-    """
+        Returns:
+        typing.Dict[str, typing.Any]: The values and histograms, as JSON-serializable lists
 
-    Perform the backup process
+        """
 
-    """
+        for collector in self._collectors:
+            try:
+                collector()
 
-    ENCRYPTION_KEY, SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL, TO_EMAIL = get_envs()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
 
-    timestamp = datetime.now().strftime("%Y-%m-%d %H_%M_%S")
+        with self._lock:
+            return {
+                "values": [[name, labels, value] for (name, labels), value in self._values.items()],
+                "histograms": [[name, labels, histogram] for (name, labels), histogram in self._histograms.items()]
+            }
 
-    db:Session = SessionLocal()
+    def write_snapshot(self) -> None:
 
-    number_of_blog_posts = db.query(BlogPostModel).count()
+        os.makedirs(self.directory, exist_ok=True)
 
-    export_path = f'exported_db_{timestamp}.db'
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
 
-    export_db(DATABASE_PATH, export_path)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.snapshot(), f)
 
-    compressed_path = compress_file(export_path)
-    os.remove(export_path)
+        os.replace(f"{path}.tmp", path)
 
-    encrypted_path = encrypt_file(compressed_path, ENCRYPTION_KEY)
-    os.remove(compressed_path)
+    def collect(self) -> typing.Tuple[typing.Dict[MetricKey, float], typing.Dict[MetricKey, typing.List[float]]]:
 
-    send_email(
-        subject=f'SQLite Database Backup ({timestamp})',
-        body='Please find the attached encrypted and compressed SQLite database backup. This email was sent automatically. Do not reply.\n\nNumber of blog posts: ' + str(number_of_blog_posts),
-        to_email=TO_EMAIL,
-        attachment_path=encrypted_path,
-        from_email=FROM_EMAIL,
-        smtp_server=SMTP_SERVER,
-        smtp_port=SMTP_PORT,
-        smtp_user=SMTP_USER,
-        smtp_password=SMTP_PASSWORD
-    )
+        """
 
-    os.remove(encrypted_path)
+        Add up the snapshots of every worker, writing this worker's first so it is current.
 
-    try:
+        Returns:
+        typing.Dict[MetricKey, float]: The counter and gauge values
+        typing.Dict[MetricKey, typing.List[float]]: The histogram bucket counts and sums
 
-        os.remove(export_path)
-        os.remove(compressed_path)
-        os.remove(encrypted_path)
+        """
 
-    except Exception:
-        pass
+        self.write_snapshot()
 
-    finally:
-        try:
-            os.remove(export_path)
-            os.remove(compressed_path)
-            os.remove(encrypted_path)
+        values:typing.Dict[MetricKey, float] = {}
+        histograms:typing.Dict[MetricKey, typing.List[float]] = {}
+        now = time.time()
 
-        except:
-            pass
+        for entry in os.scandir(self.directory):
+            if(not entry.name.endswith(".json")):
+                continue
 
-##----------------------------------/----------------------------------##
+            try:
+                age = now - entry.stat().st_mtime
 
-def perform_backup_scheduled() -> None:
+                if(age > self.retention):
+                    os.remove(entry.path)
+                    continue
 
-    """
+                with open(entry.path, "r") as f:
+                    snapshot = json.load(f)
 
-    Perform the backup process on a scheduled interval
+            ## Removed or replaced by another worker in the meantime
+            except (OSError, ValueError):
+                continue
 
-    """
+            alive = age < max(5, self.flush_interval * 5)
 
-    with shelve.open(os.path.join(BACKUP_LOGS_DIR, 'backup_scheduler.db')) as db:
-        perform_backup()
-        db['last_run'] = datetime.now()
+            for name, labels, value in snapshot["values"]:
+                definition = self._definitions.get(name)
 
-##----------------------------------/----------------------------------##
+                if(definition is None or (definition[0] == "gauge" and not alive)):
+                    continue
 
-def start_scheduler():
-    max_retries = 5
-    retry_delay = 3
+                key = (name, tuple(tuple(pair) for pair in labels))
+                values[key] = values.get(key, 0.0) + value
 
-    for _ in range(max_retries):
-        try:
-            with shelve.open(os.path.join(BACKUP_LOGS_DIR, 'backup_scheduler.db')) as db:
-                last_run = db.get('last_run', None)
+            for name, labels, histogram in snapshot["histograms"]:
+                definition = self._definitions.get(name)
 
-                should_run_initial = True
-                if(last_run):
-                    time_since_last_run = datetime.now() - last_run
-                    if(time_since_last_run < timedelta(hours=6)):
-                        should_run_initial = False
+                ## Written by a worker that had other buckets
+                if(definition is None or len(histogram) != len(definition[2]) + 2):
+                    continue
 
-            break
+                merged = histograms.setdefault((name, tuple(tuple(pair) for pair in labels)), [0.0] * len(histogram))
 
-        except Exception as e:
-            if("Resource temporarily unavailable" in str(e)):
-                time.sleep(retry_delay)
-            else:
-                raise
-    else:
-        print("Failed to initialize scheduler after multiple attempts")
-        return
+                for index, count in enumerate(histogram):
+                    merged[index] += count
 
-    if(should_run_initial):
-        perform_backup_scheduled()
+        return values, histograms
 
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(perform_backup_scheduled, 'interval', hours=6)
-    scheduler.start()
+    def render(self, values:typing.Dict[MetricKey, float], histograms:typing.Dict[MetricKey, typing.List[float]]) -> str:
 
-    atexit.register(lambda: scheduler.shutdown())
+        """
 
-##-----------------------------------------start-of-auth----------------------------------------------------------------------------------------------------------------------------------------------------------
+        Format values and histograms in the Prometheus text exposition format.
 
-def create_access_token(data:dict, expires_delta:typing.Optional[timedelta] = None) -> str:
+        Args:
+        values (typing.Dict[MetricKey, float]): The counter and gauge values
+        histograms (typing.Dict[MetricKey, typing.List[float]]): The histogram bucket counts and sums
 
-    """
-    
-    Create an access token with the given data and expiration time
+        Returns:
+        str: The exposition
 
-    Args:
-    data (dict): The data to encode into the token
-    expires_delta (timedelta): The time until the token expires
+        """
 
-    Returns:
-    encoded_jwt (str): The encoded JWT token
+        lines:typing.List[str] = []
 
-    """
+        for name, (kind, description, buckets) in sorted(self._definitions.items()):
+            if(kind == "histogram"):
+                series = sorted((labels, histogram) for (metric_name, labels), histogram in histograms.items() if metric_name == name)
 
-    to_encode = data.copy()
+            else:
+                series = sorted((labels, value) for (metric_name, labels), value in values.items() if metric_name == name)
 
-    if(expires_delta):
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+            if(not series):
+                continue
 
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, ACCESS_TOKEN_SECRET, algorithm=TOKEN_ALGORITHM) # type: ignore
-    return encoded_jwt
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
 
-def create_refresh_token(data:dict, expires_delta:typing.Optional[timedelta] = None) -> str:
+            for labels, value in series:
+                if(kind != "histogram"):
+                    lines.append(f"{name}{format_metric_labels(labels)} {format_metric_value(value)}")
+                    continue
 
-    """
+                cumulative = 0.0
 
-    Create a refresh token with the given data and expiration time
+                for bound, count in zip(buckets + (math.inf,), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_metric_labels(labels + (('le', format_metric_value(bound)),))} {format_metric_value(cumulative)}")
 
-    Args:
-    data (dict): The data to encode into the token
-    expires_delta (timedelta): The time until the token expires
+                lines.append(f"{name}_sum{format_metric_labels(labels)} {format_metric_value(value[-1])}")
+                lines.append(f"{name}_count{format_metric_labels(labels)} {format_metric_value(cumulative)}")
 
-    Returns:
-    encoded_jwt (str): The encoded JWT token
+        return "\n".join(lines) + "\n"
 
-    """
+    def _run(self) -> None:
 
-    to_encode = data.copy()
+        while(not self._stop_event.wait(self.flush_interval)):
+            try:
+                self.write_snapshot()
 
-    if(expires_delta):
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(days=1)
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
 
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, REFRESH_TOKEN_SECRET, algorithm=TOKEN_ALGORITHM) # type: ignore
-    return encoded_jwt
+    def start(self) -> None:
 
-def verify_token(token:str) -> TokenData:
-    
         """
 
-        Verify the given token and return the data
+        Start the background thread that writes this worker's snapshot.
 
-        Args:    
-        token (str): The token to verify
+        """
 
-        Returns:
-        TokenData: The data from the token
+        if(self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
 
         """
 
-        try:
-            payload = jwt.decode(token, ACCESS_TOKEN_SECRET, algorithms=[TOKEN_ALGORITHM]) # type: ignore
-            username:str = payload.get("sub")
+        Stop the background thread and write a last snapshot, so the counters of this worker outlive it.
 
-            if(username is None):
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-            
-            return TokenData(username=username)
-        
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-        
-        except PyJWTError:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        """
 
+        self._stop_event.set()
 
-def verify_credentials(credentials:HTTPBasicCredentials) -> None:
+        if(self._thread is not None):
+            self._thread.join(timeout=5)
+            self._thread = None
 
-    """
-    
-    Verify the given credentials
+        self.write_snapshot()
 
-    Args:
-    credentials (HTTPBasicCredentials): The credentials to verify
+def format_metric_value(value:float) -> str:
 
-    """
+    if(math.isinf(value)):
+        return "+Inf" if value > 0 else "-Inf"
 
-    if(not(credentials.username == ADMIN_USER and pwd_context.verify(credentials.password, ADMIN_PASS_HASH))):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Unauthorized",
-            headers={"WWW-Authenticate": "Basic"},
-        )
+    if(value == int(value)):
+        return str(int(value))
 
-def verify_totp(totp_code:str) -> None:
+    return repr(value)
+
+def format_metric_labels(labels:typing.Tuple[typing.Tuple[str, str], ...]) -> str:
+
+    if(not labels):
+        return ""
+
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+def get_statement_operation(statement:str) -> str:
 
     """
 
-    Verify the given TOTP code
+    Get the kind of a SQL statement for the operation label, so the label values stay few.
 
     Args:
-    totp_code (str): The TOTP code to verify
+    statement (str): The SQL statement
+
+    Returns:
+    str: The first keyword, lowercased, or "other"
 
     """
 
-    totp = pyotp.TOTP(TOTP_SECRET) # type: ignore
+    operation = statement.lstrip()[:8].split(None, 1)[0].lower() if statement.strip() else ""
 
-    if(not totp.verify(totp_code)):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-    
-def get_current_user(token:str = Depends(oauth2_scheme)):
+    return operation if operation in ("select", "insert", "update", "delete", "pragma", "with", "begin", "commit", "create", "alter", "drop") else "other"
+
+def instrument_engine(engine:Engine, name:str) -> None:
 
     """
 
-    Get the current user from the given token
+    Time every statement the engine runs into db_query_duration_seconds, and into the trace of a traced request.
 
     Args:
-    token (str): The token to get the user from
+    engine (Engine): The engine, the sync_engine of an async one
+    name (str): The engine label
 
-    Returns:
-    str: The username of the user
+    """
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+        duration = time.perf_counter() - connection.info["query_start"].pop()
+        operation = get_statement_operation(statement)
+
+        metrics.observe("db_query_duration_seconds", duration, {"engine": name, "operation": operation})
+        record_sql_span(connection, statement, parameters, executemany, name, operation, duration)
+
+    def handle_error(exception_context) -> None:
+        connection = exception_context.connection
+
+        if(connection is not None and connection.info.get("query_start")):
+            connection.info["query_start"].pop()
+
+        metrics.inc("db_query_errors_total", {"engine": name})
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+metrics = MetricsRegistry(METRICS_DIR, METRICS_FLUSH_INTERVAL, METRICS_RETENTION)
+
+metrics.define("http_requests_total", "counter", "HTTP requests by route, method and status.")
+metrics.define("http_request_duration_seconds", "histogram", "Time from receiving a request to the end of its response body, by route and method.", METRICS_REQUEST_BUCKETS)
+metrics.define("http_requests_in_flight", "gauge", "Requests being handled right now.")
+metrics.define("http_requests_queued", "gauge", "Requests waiting for an admission slot.")
+metrics.define("db_query_duration_seconds", "histogram", "Time spent in SQL statements, by engine and operation.", METRICS_QUERY_BUCKETS)
+metrics.define("db_query_errors_total", "counter", "SQL statements that raised, by engine.")
+metrics.define("view_count_flushes_total", "counter", "View count flushes that wrote to the database.")
+metrics.define("view_count_flush_errors_total", "counter", "View count flushes that failed and were retried.")
+metrics.define("view_count_flushed_views_total", "counter", "Views written to the database by flushes.")
+metrics.define("view_count_flush_duration_seconds", "histogram", "Time taken by view count flushes.", METRICS_QUERY_BUCKETS)
+metrics.define("view_count_pending", "gauge", "Views buffered and not yet flushed.")
+metrics.define("backup_jobs_total", "counter", "Finished backup jobs, by kind and status.")
+metrics.define("backup_stage_duration_seconds", "histogram", "Time taken by each stage of a backup job, by kind and stage.", METRICS_BACKUP_BUCKETS)
+metrics.define("backup_last_success_timestamp_seconds", "gauge", "When the last successful backup job finished, by kind.")
+metrics.define("backup_pages_copied_total", "counter", "Database pages read by backup snapshots.")
+metrics.define("backup_step_duration_seconds", "histogram", "Time taken by each BACKUP_STEP_PAGES read of a backup snapshot, including writing out its chunks.", METRICS_QUERY_BUCKETS)
+metrics.define("blog_cache_hits_total", "counter", "Blog post cache hits.")
+metrics.define("blog_cache_misses_total", "counter", "Blog post cache misses.")
+metrics.define("blog_cache_evictions_total", "counter", "Blog post cache entries evicted for space.")
+metrics.define("blog_cache_invalidations_total", "counter", "Times the blog post cache was cleared.")
+metrics.define("blog_cache_entries", "gauge", "Blog posts in the cache.")
+metrics.define("token_cache_entries", "gauge", "Verified access tokens in the cache.")
+metrics.define("rate_limit_admitted_total", "counter", "Requests let through by the rate limiter.")
+metrics.define("rate_limit_limited_total", "counter", "Requests rejected by the rate limiter with a 429.")
+metrics.define("admission_shed_total", "counter", "Requests rejected with a 503 because the admission queue was full.")
+metrics.define("response_store_builds_total", "counter", "Builds of the stored list responses, by kind.")
+metrics.define("response_store_build_duration_seconds", "histogram", "Time taken to build and compress the stored list responses, by kind.", METRICS_REQUEST_BUCKETS)
+metrics.define("process_cpu_seconds_total", "counter", "CPU time used by the workers.")
+metrics.define("process_workers", "gauge", "Workers that wrote their metrics recently.")
+
+##-----------------------------------------start-of-tracing----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class RequestTrace:
 
     """
 
-    try:
-        token_data = verify_token(token)
-        return token_data.username
-    except HTTPException as e:
-        raise e
+    The spans of one request, written out as an OTLP/JSON ExportTraceServiceRequest so anything that reads OTLP files can load the log.
 
-def get_current_active_user(current_user:str = Depends(get_current_user)):
+    Spans are added from the request's task and from the threadpool threads its sync dependencies and endpoints run on, so adding one is locked.
 
     """
 
-    Get the current active user
+    def __init__(self, name:str, attributes:typing.Dict[str, typing.Any]) -> None:
 
-    Args:
-    current_user (str): The current user
+        self.trace_id = os.urandom(16).hex()
+        self.spans:typing.List[typing.Dict[str, typing.Any]] = []
+        self._lock = threading.Lock()
 
-    Returns:
-    str: The username of the user
+        self.root = self.start_span(name, attributes, parent_id=None)
 
-    """
+    @property
+    def duration(self) -> float:
+        return ((self.root["end"] or time.time_ns()) - self.root["start"]) / 1_000_000_000
 
-    if(current_user != ADMIN_USER):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-    return current_user
+    def start_span(self, name:str, attributes:typing.Optional[typing.Dict[str, typing.Any]], parent_id:typing.Optional[str]) -> typing.Dict[str, typing.Any]:
 
-##-----------------------------------------start-of-database----------------------------------------------------------------------------------------------------------------------------------------------------------
+        """
 
-def replace_sqlite_db(extracted_db_path:str, current_db_path:str) -> None:
+        Start a span, which is ended by setting its end.
 
-    """
+        Args:
+        name (str): The span name
+        attributes (typing.Optional[typing.Dict[str, typing.Any]]): The span attributes
+        parent_id (typing.Optional[str]): The span ID of the parent, None for the root
 
-    Replace the current SQLite database with the extracted SQLite database.
+        Returns:
+        typing.Dict[str, typing.Any]: The span
 
-    Args:
-    extracted_db_path (str): The path to the extracted SQLite database
+        """
 
-    current_db_path (str): The path to the current SQLite database
-    
-    """
+        span = {
+            "spanId": os.urandom(8).hex(),
+            "parentSpanId": parent_id,
+            "name": name,
+            "start": time.time_ns(),
+            "end": None,
+            "attributes": dict(attributes or {}),
+            "error": None
+        }
 
-    global engine, SessionLocal
+        with self._lock:
+            self.spans.append(span)
 
-    close_all_sessions()
-    
-    engine.dispose()
-    
-    shutil.move(extracted_db_path, current_db_path)
+        return span
 
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def add_span(self, name:str, start:int, end:int, attributes:typing.Dict[str, typing.Any], parent_id:typing.Optional[str]) -> None:
 
-    migrate_database(engine)
+        span = self.start_span(name, attributes, parent_id)
+        span["start"] = start
+        span["end"] = end
+
+    def to_otlp(self) -> typing.Dict[str, typing.Any]:
+
+        """
+
+        Format the trace as OTLP/JSON.
+
+        Returns:
+        typing.Dict[str, typing.Any]: The ExportTraceServiceRequest
+
+        """
+
+        now = time.time_ns()
+        spans = []
+
+        with self._lock:
+            for span in self.spans:
+                otlp_span = {
+                    "traceId": self.trace_id,
+                    "spanId": span["spanId"],
+                    "name": span["name"],
+                    ## SPAN_KIND_SERVER for the request, SPAN_KIND_INTERNAL for the rest
+                    "kind": 2 if span is self.root else 1,
+                    "startTimeUnixNano": str(span["start"]),
+                    "endTimeUnixNano": str(span["end"] or now),
+                    "attributes": format_otlp_attributes(span["attributes"]),
+                    "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 0}
+                }
+
+                if(span["parentSpanId"] is not None):
+                    otlp_span["parentSpanId"] = span["parentSpanId"]
+
+                spans.append(otlp_span)
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": format_otlp_attributes({"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()})},
+                "scopeSpans": [{"scope": {"name": "main"}, "spans": spans}]
+            }]
+        }
+
+current_trace:contextvars.ContextVar[typing.Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+current_span_id:contextvars.ContextVar[typing.Optional[str]] = contextvars.ContextVar("current_span_id", default=None)
+
+query_plans:typing.Dict[str, str] = {}
+
+def format_otlp_attributes(attributes:typing.Dict[str, typing.Any]) -> typing.List[typing.Dict[str, typing.Any]]:
+
+    formatted = []
+
+    for key, value in attributes.items():
+        if(isinstance(value, bool)):
+            formatted.append({"key": key, "value": {"boolValue": value}})
+
+        elif(isinstance(value, int)):
+            formatted.append({"key": key, "value": {"intValue": str(value)}})
+
+        elif(isinstance(value, float)):
+            formatted.append({"key": key, "value": {"doubleValue": value}})
+
+        else:
+            formatted.append({"key": key, "value": {"stringValue": str(value)}})
+
+    return formatted
+
+@contextlib.contextmanager
+def trace_span(name:str, attributes:typing.Optional[typing.Dict[str, typing.Any]] = None) -> typing.Iterator[typing.Optional[typing.Dict[str, typing.Any]]]:
 
-def get_db() -> typing.Generator[Session, None, None]:
-    
     """
 
-    Get the database session.
+    Record the block as a span of the current request's trace, doing nothing outside a traced request.
+
+    Args:
+    name (str): The span name
+    attributes (typing.Optional[typing.Dict[str, typing.Any]]): The span attributes
 
     Returns:
-    typing.Generator[Session, None, None]: The database session
+    typing.Iterator[typing.Optional[typing.Dict[str, typing.Any]]]: The span, or None when the request is not traced
 
     """
 
-    db:Session = SessionLocal()
-    
+    trace = current_trace.get()
+
+    if(trace is None):
+        yield None
+        return
+
+    span = trace.start_span(name, attributes, current_span_id.get())
+    token = current_span_id.set(span["spanId"])
+
     try:
-        yield db
-    
+        yield span
+
+    except BaseException as e:
+        span["error"] = repr(e)
+        raise
+
     finally:
-        db.close()
+        span["end"] = time.time_ns()
+        current_span_id.reset(token)
+
+def trace_coroutine(name:str, func:typing.Callable[..., typing.Awaitable[typing.Any]]) -> typing.Callable[..., typing.Awaitable[typing.Any]]:
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with trace_span(name):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+def traced_middleware(name:str) -> typing.Callable:
 
-def func_get_blog_posts(db:Session, skip:int=0, limit:int=10) -> typing.List[BlogPostModel]:
-    
     """
-    
-    Get the blog posts from the database with the given skip and limit.
+
+    Record a middleware as a span, left unwrapped when tracing is off.
 
     Args:
-    db (Session): The SQLAlchemy session
-    skip (int): The number of blog posts to skip
-    limit (int): The number of blog posts to get
+    name (str): The middleware name
 
     Returns:
-    typing.List[BlogPostModel]: The list of blog posts
+    typing.Callable: The decorator
 
     """
 
-    return db.query(BlogPostModel).offset(skip).limit(limit).all()
+    def decorator(middleware:typing.Callable) -> typing.Callable:
 
-def func_get_all_blog_posts(db:Session) -> typing.List[BlogPostModel]:
+        if(not TRACING_ENABLED):
+            return middleware
+
+        return trace_coroutine(f"middleware {name}", middleware)
+
+    return decorator
+
+def get_query_plan(connection, statement:str, parameters) -> str:
 
     """
 
-    Get all the blog posts from the database in descending order.
+    Get the EXPLAIN QUERY PLAN of a statement on the connection that ran it, once per statement.
 
     Args:
-    db (Session): The SQLAlchemy session
-    skip (int): The number of blog posts to skip
-    limit (int): The number of blog posts to get
+    connection: The SQLAlchemy connection
+    statement (str): The SQL statement
+    parameters: The DBAPI parameters it ran with
 
     Returns:
-    typing.List[BlogPostModel]: The list of blog posts
+    str: The plan, one indented line per step
 
     """
 
-    return db.query(BlogPostModel).order_by(BlogPostModel.created_at.desc()).all()
+    plan = query_plans.get(statement)
 
-def func_get_recent_blog_posts(db:Session, skip:int=0, limit:int=10) -> typing.List[BlogPostModel]:
+    if(plan is not None):
+        return plan
+
+    try:
+        ## The raw DBAPI cursor keeps the EXPLAIN itself out of the metrics and the trace
+        cursor = connection.connection.cursor()
+
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            rows = cursor.fetchall()
+
+        finally:
+            cursor.close()
+
+        depths:typing.Dict[int, int] = {}
+        lines = []
+
+        for step_id, parent_id, _, detail in rows:
+            depths[step_id] = depths.get(parent_id, -1) + 1
+            lines.append("  " * depths[step_id] + detail)
+
+        plan = "\n".join(lines)
+
+    except Exception as e:
+        plan = f"Unavailable: {e}"
+
+    if(len(query_plans) >= TRACE_PLAN_CACHE_SIZE):
+        query_plans.clear()
+
+    query_plans[statement] = plan
+
+    return plan
+
+def record_sql_span(connection, statement:str, parameters, executemany:bool, engine_name:str, operation:str, duration:float) -> None:
 
     """
 
-    Get the recent blog posts from the database with the given skip and limit.
+    Add a finished statement to the current request's trace, with its query plan if it reads.
 
     Args:
-    db (Session): The SQLAlchemy session
-    skip (int): The number of blog posts to skip
-    limit (int): The number of blog posts to get
-
-    Returns:
-    typing.List[BlogPostModel]: The list of blog posts
+    connection: The SQLAlchemy connection
+    statement (str): The SQL statement
+    parameters: The DBAPI parameters it ran with
+    executemany (bool): Whether it ran once per parameter set
+    engine_name (str): The engine label
+    operation (str): The statement kind from get_statement_operation()
+    duration (float): How long it ran, in seconds
 
     """
 
-    return db.query(BlogPostModel).order_by(BlogPostModel.created_at.desc()).offset(skip).limit(limit).all()
+    trace = current_trace.get()
 
-def func_get_blog_post(db:Session, blog_post_id:schemaUUID) -> BlogPostModel:
+    if(trace is None):
+        return
+
+    end = time.time_ns()
+    attributes = {"db.system": "sqlite", "db.name": engine_name, "db.operation": operation, "db.statement": statement}
+
+    if(operation in ("select", "with") and not executemany):
+        attributes["db.query_plan"] = get_query_plan(connection, statement, parameters)
+
+    trace.add_span(f"sql {operation}", end - int(duration * 1_000_000_000), end, attributes, current_span_id.get())
+
+def write_trace(trace:RequestTrace) -> None:
 
     """
 
-    Get the blog post from the database with the given ID.
+    Append a trace to TRACE_LOG_PATH as one line of OTLP/JSON, rotating the file to .1 when it outgrows TRACE_LOG_MAX_BYTES.
 
     Args:
-    db (Session): The SQLAlchemy session
-    blog_post_id (UUID): The ID of the blog post
+    trace (RequestTrace): The finished trace
 
-    Returns:
-    BlogPostModel: The blog post
+    """
+
+    line = json.dumps(trace.to_otlp(), separators=(",", ":")) + "\n"
+
+    ## Both workers append to the same file
+    with open(TRACE_LOCK_PATH, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            if(os.path.exists(TRACE_LOG_PATH) and os.path.getsize(TRACE_LOG_PATH) + len(line) > TRACE_LOG_MAX_BYTES):
+                os.replace(TRACE_LOG_PATH, f"{TRACE_LOG_PATH}.1")
+
+            with open(TRACE_LOG_PATH, "a") as f:
+                f.write(line)
+
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def install_fastapi_tracing() -> None:
 
     """
 
-    return db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
+    Record dependency resolution, the endpoint and response serialization of every request as spans.
 
-def func_get_blog_post_by_slug(db:Session, slug:str) -> typing.Optional[BlogPostModel]:
+    FastAPI has no hooks around these steps, so the module-level functions its request handler calls are wrapped. They are
+    private and may change in any release, so tracing refuses to start on a FastAPI version it was not checked against.
 
     """
 
-    Get the blog post from the database with the given slug.
+    if(not fastapi.__version__.startswith(TRACE_FASTAPI_VERSION)):
+        raise RuntimeError(f"Tracing wraps private functions of FastAPI {TRACE_FASTAPI_VERSION}x but {fastapi.__version__} is installed, check them and update TRACE_FASTAPI_VERSION or set TRACING_ENABLED=false")
 
-    Args:
-    db (Session): The SQLAlchemy session
-    slug (str): The slug of the blog post
+    for function_name, span_name in TRACE_FASTAPI_FUNCTIONS.items():
+        function = getattr(fastapi.routing, function_name, None)
 
-    Returns:
-    typing.Optional[BlogPostModel]: The blog post or None if not found
+        if(function is None or not asyncio.iscoroutinefunction(function)):
+            raise RuntimeError(f"fastapi.routing.{function_name} is missing or no longer a coroutine function, tracing cannot wrap it")
+
+        setattr(fastapi.routing, function_name, trace_coroutine(span_name, function))
+
+if(TRACING_ENABLED):
+    install_fastapi_tracing()
+
+##-----------------------------------------start-of-migrations----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def migrate_database(engine:Engine) -> None:
 
     """
 
-    import re
-    
-    def create_slug(title: str) -> str:
-        result = re.sub(r'[^\w\s-]', '', title.lower())
-        result = re.sub(r'\s+', '-', result)
-        result = re.sub(r'--+', '-', result)
-        return result.strip().strip('-')
-    
-    all_posts = db.query(BlogPostModel).all()
+    Performs database migrations if needed.
     
-    for post in all_posts:
-        post_slug = create_slug(str(post.title))
-        if post_slug == slug:
-            return post
+    """
+
+    inspector = inspect(engine)
+
+    inspector.clear_cache()
+
+    columns = [col['name'] for col in inspector.get_columns('blog_posts')]
     
-    return None
+    ## Migration 1 (2024-08-14) (Addition of view_count to blog_posts)
+    try:
+        columns = [col['name'].lower() for col in inspector.get_columns('blog_posts')]
 
-def func_create_blog_post(db:Session, db_blog_post:BlogPostModel) -> BlogPostModel:
+        print(f"Current columns in blog_posts: {columns}")
 
-    """
+        if('view_count' not in columns):
+            print("view_count column not found. Attempting to add it.")
+            with engine.connect() as connection:
+                connection.execute(text("ALTER TABLE blog_posts ADD COLUMN view_count INTEGER DEFAULT 0"))
+                connection.commit()
 
-    Create a blog post in the database.
+            print("Added view_count column to blog_posts table")
+        else:
+            print("view_count column already exists in blog_posts table")
+        
+        inspector.clear_cache()
+        columns = [col['name'].lower() for col in inspector.get_columns('blog_posts')]
+        
+    except Exception as e:
+        print(f"Error during migration: {str(e)}")
+        pass
 
-    Args:
-    db (Session): The SQLAlchemy session
-    db_blog_post (BlogPostModel): The blog post to create
+    ## Migration 2 (2026-10-18) (Addition of indexed slug to blog_posts)
+    try:
+        if('slug' not in columns):
+            print("slug column not found. Attempting to add it.")
+            with engine.connect() as connection:
+                connection.execute(text("ALTER TABLE blog_posts ADD COLUMN slug VARCHAR"))
+                connection.commit()
 
-    Returns:
-    BlogPostModel: The created blog post
+            print("Added slug column to blog_posts table")
+        else:
+            print("slug column already exists in blog_posts table")
 
-    """
+        ## Backfill in creation order so the oldest post keeps the bare slug, same as the old first-match lookup
+        with engine.connect() as connection:
+            rows = connection.execute(text("SELECT id, title, slug FROM blog_posts ORDER BY created_at ASC")).fetchall()
+            taken_slugs:typing.Set[str] = {row.slug for row in rows if row.slug}
 
-    db.add(db_blog_post)
-    db.commit()
-    db.refresh(db_blog_post)
+            ## Empty slugs came from titles like "!!!" before they fell back to UNTITLED_SLUG
+            missing = [row for row in rows if not row.slug]
 
-    return db_blog_post
+            for row in missing:
+                slug = create_unique_slug(str(row.title or ""), taken_slugs)
+                taken_slugs.add(slug)
+                connection.execute(text("UPDATE blog_posts SET slug = :slug WHERE id = :id"), {"slug": slug, "id": row.id})
 
-def func_update_blog_post(db:Session, blog_post_id:schemaUUID, blog_post:BlogPostUpdate) -> BlogPostModel:
+            connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_blog_posts_slug ON blog_posts (slug)"))
+            connection.commit()
 
-    """
+        if(missing):
+            print(f"Backfilled slug for {len(missing)} blog posts")
+
+        inspector.clear_cache()
+        columns = [col['name'].lower() for col in inspector.get_columns('blog_posts')]
+
+    except Exception as e:
+        print(f"Error during migration: {str(e)}")
+        pass
+
+    ## Migration 3 (2026-10-18) (Addition of (created_at, id) index to blog_posts for keyset pagination)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_blog_posts_created_at_id ON blog_posts (created_at, id)"))
+            connection.commit()
+
+    except Exception as e:
+        print(f"Error during migration: {str(e)}")
+        pass
+
+    ## Migration 4 (2026-10-18) (Addition of excerpt and word_count to blog_posts so listings never read content)
+    try:
+        with engine.connect() as connection:
+            for column, column_type in [("excerpt", "VARCHAR"), ("word_count", "INTEGER")]:
+                if(column not in columns):
+                    connection.execute(text(f"ALTER TABLE blog_posts ADD COLUMN {column} {column_type}"))
+                    print(f"Added {column} column to blog_posts table")
+
+            rows = connection.execute(text("SELECT id, content FROM blog_posts WHERE excerpt IS NULL OR word_count IS NULL")).fetchall()
+
+            for row in rows:
+                connection.execute(
+                    text("UPDATE blog_posts SET excerpt = :excerpt, word_count = :word_count WHERE id = :id"),
+                    {"excerpt": create_excerpt(row.content or ""), "word_count": count_words(row.content or ""), "id": row.id}
+                )
+
+            connection.commit()
+
+        if(rows):
+            print(f"Backfilled excerpt and word_count for {len(rows)} blog posts")
+
+        inspector.clear_cache()
+        columns = [col['name'].lower() for col in inspector.get_columns('blog_posts')]
+
+    except Exception as e:
+        print(f"Error during migration: {str(e)}")
+        pass
+
+    ## Migration 5 (2026-10-18) (Addition of blog_posts_fts full-text index, rebuilt when created or found inconsistent)
+    try:
+        with engine.connect() as connection:
+            is_new_index = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blog_posts_fts'")).first() is None
+
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS blog_posts_fts USING fts5("
+                "title, content, author, content='blog_posts', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+            ))
+
+            connection.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS blog_posts_fts_insert AFTER INSERT ON blog_posts BEGIN "
+                "INSERT INTO blog_posts_fts(rowid, title, content, author) VALUES (new.rowid, new.title, new.content, new.author); "
+                "END"
+            ))
+
+            connection.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS blog_posts_fts_delete AFTER DELETE ON blog_posts BEGIN "
+                "INSERT INTO blog_posts_fts(blog_posts_fts, rowid, title, content, author) VALUES ('delete', old.rowid, old.title, old.content, old.author); "
+                "END"
+            ))
+
+            ## Only fires for the indexed columns, so view count flushes never touch the index
+            connection.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS blog_posts_fts_update AFTER UPDATE OF title, content, author ON blog_posts BEGIN "
+                "INSERT INTO blog_posts_fts(blog_posts_fts, rowid, title, content, author) VALUES ('delete', old.rowid, old.title, old.content, old.author); "
+                "INSERT INTO blog_posts_fts(rowid, title, content, author) VALUES (new.rowid, new.title, new.content, new.author); "
+                "END"
+            ))
+
+            connection.commit()
+
+        ## A restored database is a page copy with its own consistent index, so only a new index or one that disagrees with
+        ## blog_posts is rebuilt, rank 1 makes the check compare against the content table
+        with engine.connect() as connection:
+            try:
+                if(not is_new_index):
+                    connection.execute(text("INSERT INTO blog_posts_fts(blog_posts_fts, rank) VALUES ('integrity-check', 1)"))
+
+            except Exception as e:
+                print(f"blog_posts_fts failed its integrity check, rebuilding it: {e}")
+                connection.rollback()
+                is_new_index = True
+
+            if(is_new_index):
+                connection.execute(text("INSERT INTO blog_posts_fts(blog_posts_fts) VALUES ('rebuild')"))
+
+            connection.commit()
+
+    except Exception as e:
+        print(f"Error during migration: {str(e)}")
+        pass
+
+    ## Migration 6 (2026-10-18) (Schema version in PRAGMA user_version)
+    try:
+        with engine.connect() as connection:
+            if(connection.execute(text("PRAGMA user_version")).scalar() < SCHEMA_VERSION):
+                connection.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+                connection.commit()
+
+    except Exception as e:
+        print(f"Error during migration: {str(e)}")
+        pass
+
+##----------------------------------/----------------------------------##
+
+def set_sqlite_pragmas(dbapi_connection, pragmas:typing.List[typing.Tuple[str, typing.Any]]) -> None:
+
+    """
+
+    Apply the SQLite tuning profile and the given pragmas to a new DBAPI connection.
+
+    Args:
+    dbapi_connection: The raw sqlite3 connection
+    pragmas (typing.List[typing.Tuple[str, typing.Any]]): Extra pragma names and values for this kind of connection
+
+    """
+
+    cursor = dbapi_connection.cursor()
+
+    try:
+        for name, value in [("busy_timeout", SQLITE_BUSY_TIMEOUT)] + pragmas + [("cache_size", SQLITE_CACHE_SIZE), ("mmap_size", SQLITE_MMAP_SIZE), ("temp_store", SQLITE_TEMP_STORE)]:
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+    finally:
+        cursor.close()
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+
+    ## journal_mode is stored in the database file, so only the writer sets it
+    set_sqlite_pragmas(dbapi_connection, [("journal_mode", SQLITE_JOURNAL_MODE), ("synchronous", SQLITE_SYNCHRONOUS)])
+
+def apply_sqlite_read_only_pragmas(dbapi_connection, connection_record) -> None:
+
+    set_sqlite_pragmas(dbapi_connection, [("query_only", "ON")])
+
+def create_database_engine(read_only:bool = False) -> Engine:
+
+    """
+
+    Create an engine for the blog database with the SQLite tuning profile.
+
+    The writer engine has a single connection, so admin writes and view count flushes queue up in the pool instead of fighting over the SQLite write lock.
+    The read-only engine opens the file with mode=ro and query_only, and pools as many connections as there are concurrent public reads.
+    In WAL mode its readers never wait on the writer.
+
+    Args:
+    read_only (bool): Whether to create the read-only engine for public reads
+
+    Returns:
+    Engine: The engine
+
+    """
+
+    if(read_only):
+        engine = create_engine(
+            READ_ONLY_DATABASE_URL,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000},
+            poolclass=QueuePool,
+            pool_size=SQLITE_POOL_SIZE,
+            max_overflow=SQLITE_POOL_OVERFLOW
+        )
+
+        event.listen(engine, "connect", apply_sqlite_read_only_pragmas)
+        instrument_engine(engine, "reader")
+
+        return engine
+
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000},
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=SQLITE_WRITER_TIMEOUT
+    )
+
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    instrument_engine(engine, "writer")
+
+    return engine
+
+engine:Engine = create_database_engine()
+SessionLocal:sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def create_tables_if_not_exist(engine, base:DeclarativeMeta) -> None:
+    inspector:Inspector = inspect(engine)
+    for table_name in base.metadata.tables.keys():
+        if(not inspector.has_table(table_name)):
+            base.metadata.tables[table_name].create(engine)
+
+create_tables_if_not_exist(engine, Base)
+
+migrate_database(engine)
+
+## The read-only engines need the file and its -shm to exist, so they are created after the writer has migrated the database
+read_engine:Engine = create_database_engine(read_only=True)
+ReadSessionLocal:sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+## Job history has its own file, so it survives a database replace, stays out of the backups and never waits on the blog writer
+jobs_engine:Engine = create_engine(JOBS_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000})
+event.listen(jobs_engine, "connect", apply_sqlite_pragmas)
+instrument_engine(jobs_engine, "jobs")
+JobsSessionLocal:sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=jobs_engine)
+
+create_tables_if_not_exist(jobs_engine, JobsBase)
+
+##----------------------------------/----------------------------------##
+
+def get_envs() -> typing.Tuple[str, str, int, str, str, str, str, typing.List[str]]:
+
+    """
+    
+    Get the environment variables from the .env file
+
+    The SMTP variables are only required when the smtp backup sink is selected.
+
+    Returns:
+    ENCRYPTION_KEY (str): The encryption key to encrypt/decrypt the database
+    SMTP_SERVER (str): The SMTP server to send the email
+    SMTP_PORT (int): The SMTP port to send the email
+    SMTP_USER (str): The SMTP user to send the email
+    SMTP_PASSWORD (str): The SMTP password to send the email
+    FROM_EMAIL (str): The email address to send the email from
+    TO_EMAIL (str): The email address to send the email to
+    BACKUP_SINKS (typing.List[str]): Where backups are sent, any of "smtp", "local" and "s3"
+
+    """
+
+    if(os.path.exists(".env")):
+        with open(".env", "r") as f:
+            for line in f:
+                key, value = line.strip().split("=")
+                os.environ[key] = value
+
+    ENCRYPTION_KEY:str = os.getenv('ENCRYPTION_KEY') or ""
+    SMTP_SERVER:str = os.getenv('SMTP_SERVER') or ""
+    SMTP_PORT:int = int(os.getenv('SMTP_PORT') or 0)
+    SMTP_USER = os.getenv('SMTP_USER') or ""
+    SMTP_PASSWORD = os.getenv('SMTP_PASSWORD') or ""
+    FROM_EMAIL = os.getenv('FROM_EMAIL') or ""
+    TO_EMAIL = os.getenv('TO_EMAIL') or ""
+    BACKUP_SINKS = [sink.strip() for sink in (os.getenv('BACKUP_SINKS') or "smtp").split(",") if sink.strip()]
+
+    assert(ENCRYPTION_KEY != ""), "ENCRYPTION_KEY is required"
+    assert(BACKUP_SINKS), "BACKUP_SINKS is required"
+
+    if("smtp" in BACKUP_SINKS):
+        assert(SMTP_SERVER != ""), "SMTP_SERVER is required"
+        assert(SMTP_PORT != 0), "SMTP_PORT is required"
+        assert(SMTP_USER != ""), "SMTP_USER is required"
+        assert(SMTP_PASSWORD != ""), "SMTP_PASSWORD is required"
+        assert(FROM_EMAIL != ""), "FROM_EMAIL is required"
+        assert(TO_EMAIL != ""), "TO_EMAIL is required"
+
+    return ENCRYPTION_KEY, SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL, TO_EMAIL, BACKUP_SINKS
+
+##-----------------------------------------start-of-backup----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+snapshot_file:typing.Optional[typing.Tuple[int, int]] = None
+snapshot_file_lock = threading.Lock()
+
+def get_snapshot_fd(db_path:str) -> int:
+
+    """
+
+    Get a read-only descriptor for the database file that stays open for the life of the process.
+
+    Closing any descriptor for a file drops every POSIX lock the process holds on it, SQLite's included, so the descriptor is only closed once the file it points to has been replaced.
+
+    Args:
+    db_path (str): The path to the SQLite database file
+
+    Returns:
+    int: The file descriptor
+
+    """
+
+    global snapshot_file
+
+    with snapshot_file_lock:
+        if(snapshot_file is not None and snapshot_file[1] == os.stat(db_path).st_ino):
+            return snapshot_file[0]
+
+        if(snapshot_file is not None):
+            os.close(snapshot_file[0])
+
+        fd = os.open(db_path, os.O_RDONLY)
+        snapshot_file = (fd, os.fstat(fd).st_ino)
+
+        return fd
+
+@contextlib.contextmanager
+def open_snapshot(db_path:str) -> typing.Iterator[typing.Tuple[int, int, int]]:
+
+    """
+
+    Freeze the database file in a consistent state for as long as the context is open.
+
+    The WAL is checkpointed and truncated, then a read transaction is started. If the -wal file is still empty, that transaction reads nothing but the main file.
+    SQLite will not checkpoint into the main file while such a reader is open, so the file can be read directly while writers carry on in the WAL.
+    In rollback journal mode the read transaction's shared lock does the same, but writers wait on it.
+
+    Args:
+    db_path (str): The path to the SQLite database file
+
+    Returns:
+    typing.Iterator[typing.Tuple[int, int, int]]: A file descriptor for the database file, its page size and its page count
+
+    """
+
+    for attempt in range(BACKUP_SNAPSHOT_ATTEMPTS):
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT / 1000)
+
+        try:
+            source.execute("BEGIN")
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+            page_count = source.execute("PRAGMA page_count").fetchone()[0]
+
+            if(not os.path.exists(f"{db_path}-wal") or os.path.getsize(f"{db_path}-wal") == 0):
+                yield get_snapshot_fd(db_path), page_size, page_count
+                return
+
+        finally:
+            source.close()
+
+        ## A write landed between the checkpoint and the read transaction
+        time.sleep(0.1 * (attempt + 1))
+
+    raise RuntimeError("Could not take a consistent snapshot of the database")
+
+def read_snapshot(fd:int, page_size:int, page_count:int, pages_per_chunk:int, progress:typing.Optional[typing.Callable[[int, int], None]] = None) -> typing.Iterator[bytes]:
+
+    """
+
+    Read a frozen database file about BACKUP_STEP_PAGES pages at a time, sleeping BACKUP_STEP_SLEEP between reads so live traffic gets the disk.
+
+    Each read is handed out in chunks of pages_per_chunk pages. Progress is reported after every read, and only the total is printed.
+
+    Args:
+    fd (int): The file descriptor from open_snapshot
+    page_size (int): The page size of the database
+    page_count (int): The number of pages in the database
+    pages_per_chunk (int): The number of pages in each chunk
+    progress (typing.Optional[typing.Callable[[int, int], None]]): Called with the pages copied so far and the page count after each read
+
+    Returns:
+    typing.Iterator[bytes]: The pages, pages_per_chunk at a time
+
+    """
+
+    start = time.perf_counter()
+
+    ## A whole number of chunks per read, so no chunk spans two reads
+    pages_per_read = max(pages_per_chunk, BACKUP_STEP_PAGES - BACKUP_STEP_PAGES % pages_per_chunk)
+    chunk_size = pages_per_chunk * page_size
+
+    for first_page in range(0, page_count, pages_per_read):
+        step_start = time.perf_counter()
+        pages = min(pages_per_read, page_count - first_page)
+        data = os.pread(fd, pages * page_size, first_page * page_size)
+
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
+        metrics.observe("backup_step_duration_seconds", time.perf_counter() - step_start)
+        metrics.inc("backup_pages_copied_total", amount=pages)
+
+        if(progress is not None):
+            progress(first_page + pages, page_count)
+
+        time.sleep(BACKUP_STEP_SLEEP)
+
+    print(f"Backup of {page_count} pages finished in {time.perf_counter() - start:.3f}s")
+
+def write_encrypted_archive(output_path:str, passphrase:str, write_entries:typing.Callable[[zipfile.ZipFile], None]) -> str:
+
+    """
+
+    Write a zip archive and GPG encrypt it into output_path in a single pass.
+
+    The archive is written into a pipe while gpg reads the other end, so memory stays bounded and only the ciphertext ever reaches the disk.
+
+    Args:
+    output_path (str): The path to write the encrypted archive to
+    passphrase (str): The passphrase to encrypt the archive with
+    write_entries (typing.Callable[[zipfile.ZipFile], None]): Writes the entries into the archive, runs on its own thread
+
+    Returns:
+    output_path (str): The path to the encrypted archive
+
+    """
+
+    read_fd, write_fd = os.pipe()
+    errors:typing.List[Exception] = []
+
+    def write_archive() -> None:
+
+        try:
+            with os.fdopen(write_fd, "wb") as pipe:
+                with zipfile.ZipFile(pipe, "w", zipfile.ZIP_DEFLATED, compresslevel=BACKUP_COMPRESSION_LEVEL) as archive:
+                    write_entries(archive)
+
+        except Exception as e:
+            errors.append(e)
+
+    archiver = threading.Thread(target=write_archive, name="backup-archiver", daemon=True)
+    archiver.start()
+
+    ## The archive is already deflated, so gpg only encrypts. Closing the read end once gpg is done also unblocks the archiver if gpg quit early
+    with os.fdopen(read_fd, "rb") as pipe:
+        status = GPG().encrypt_file(
+            pipe,
+            recipients=None,
+            symmetric=True,
+            passphrase=passphrase,
+            output=output_path,
+            extra_args=["--compress-level", "0"]
+        )
+
+    archiver.join()
+
+    if(errors or not status.ok):
+        if(os.path.exists(output_path)):
+            os.remove(output_path)
+
+        raise ValueError(f'Failed to write the encrypted backup: {errors[0] if errors else status.stderr}')
+
+    return output_path
+
+def write_encrypted_backup(db_path:str, archive_name:str, output_path:str, passphrase:str, progress:typing.Optional[typing.Callable[[int, int], None]] = None) -> str:
+
+    """
+
+    Snapshot, zip and GPG encrypt the whole database into output_path in a single pass.
+
+    Args:
+    db_path (str): The path to the SQLite database file
+    archive_name (str): The name of the database file inside the zip archive
+    output_path (str): The path to write the encrypted archive to
+    passphrase (str): The passphrase to encrypt the archive with
+    progress (typing.Optional[typing.Callable[[int, int], None]]): Called with the pages copied so far and the page count
+
+    Returns:
+    output_path (str): The path to the encrypted archive
+
+    """
+
+    def write_entries(archive:zipfile.ZipFile) -> None:
+
+        with open_snapshot(db_path) as (fd, page_size, page_count):
+            with archive.open(archive_name, "w", force_zip64=page_size * page_count >= zipfile.ZIP64_LIMIT) as entry:
+                for data in read_snapshot(fd, page_size, page_count, BACKUP_STEP_PAGES, progress):
+                    entry.write(data)
+
+    return write_encrypted_archive(output_path, passphrase, write_entries)
+
+def write_incremental_backup(db_path:str, backup_id:str, output_path:str, passphrase:str, previous_manifest:typing.Optional[typing.Dict[str, typing.Any]], progress:typing.Optional[typing.Callable[[int, int], None]] = None) -> typing.Dict[str, typing.Any]:
+
+    """
+
+    Snapshot the database as content-addressed chunks of BACKUP_CHUNK_PAGES pages, and encrypt the ones missing from previous_manifest into output_path.
+
+    The archive holds manifest.json, which lists every chunk of the snapshot in order, and a chunks/<sha256> entry for each new chunk.
+    A database can be rebuilt from the archives from the base (full) backup up to the wanted one, see restore_backup.py.
+
+    Args:
+    db_path (str): The path to the SQLite database file
+    backup_id (str): The ID of this backup
+    output_path (str): The path to write the encrypted archive to
+    passphrase (str): The passphrase to encrypt the archive with
+    previous_manifest (typing.Optional[typing.Dict[str, typing.Any]]): The manifest of the last backup that was sent, or None to send every chunk
+    progress (typing.Optional[typing.Callable[[int, int], None]]): Called with the pages copied so far and the page count
+
+    Returns:
+    typing.Dict[str, typing.Any]: The manifest of this backup
+
+    """
+
+    manifest:typing.Dict[str, typing.Any] = {}
+
+    def write_entries(archive:zipfile.ZipFile) -> None:
+
+        with open_snapshot(db_path) as (fd, page_size, page_count):
+            is_full = (previous_manifest is None
+                       or previous_manifest["sequence"] + 1 >= BACKUP_FULL_EVERY
+                       or previous_manifest["page_size"] != page_size
+                       or previous_manifest["chunk_pages"] != BACKUP_CHUNK_PAGES)
+
+            sent_chunks:typing.Set[str] = set() if is_full else set(previous_manifest["chunks"]) # type: ignore
+            chunks:typing.List[str] = []
+            new_chunks = 0
+            digest = hashlib.sha256()
+
+            for data in read_snapshot(fd, page_size, page_count, BACKUP_CHUNK_PAGES, progress):
+                chunk_hash = hashlib.sha256(data).hexdigest()
+                chunks.append(chunk_hash)
+                digest.update(data)
+
+                if(chunk_hash not in sent_chunks):
+                    archive.writestr(f"chunks/{chunk_hash}", data)
+                    sent_chunks.add(chunk_hash)
+                    new_chunks += 1
+
+        manifest.update({
+            "format": "sqlite-chunks-1",
+            "backup_id": backup_id,
+            "base_id": backup_id if is_full else previous_manifest["base_id"], # type: ignore
+            "previous_id": None if is_full else previous_manifest["backup_id"], # type: ignore
+            "sequence": 0 if is_full else previous_manifest["sequence"] + 1, # type: ignore
+            "page_size": page_size,
+            "page_count": page_count,
+            "chunk_pages": BACKUP_CHUNK_PAGES,
+            "chunks": chunks,
+            "new_chunks": new_chunks,
+            "sha256": digest.hexdigest()
+        })
+
+        archive.writestr("manifest.json", json.dumps(manifest))
+
+    write_encrypted_archive(output_path, passphrase, write_entries)
+
+    return manifest
+
+class ZipEntryExtractor:
+
+    """
+
+    Writes the first entry of a zip archive to a file as the archive's bytes are fed in, so a backup can be unpacked straight out of gpg.
+
+    Only the local header is read, so the archive never has to be seekable or on disk. Entries written to a pipe have no sizes in their header, but deflate marks its own end.
+    Errors are kept for check() instead of raised, since feed() runs on python-gnupg's reader thread and raising there would stall gpg.
+
+    """
+
+    def __init__(self, output:typing.BinaryIO) -> None:
+
+        self.output = output
+
+        self._buffer = b""
+        self._header:typing.Optional[typing.Tuple[int, int, int, int]] = None
+        self._decompressor:typing.Any = None
+        self._remaining = 0
+        self._crc = 0
+        self._done = False
+        self._error:typing.Optional[str] = None
+
+    def _read_header(self) -> None:
+
+        if(len(self._buffer) < 30):
+            return
+
+        signature, _, flags, method, _, _, crc, compressed_size, uncompressed_size, name_length, extra_length = struct.unpack("<IHHHHHIIIHH", self._buffer[:30])
+
+        if(signature != 0x04034b50):
+            raise ValueError("The backup is not a zip archive")
+
+        if(len(self._buffer) < 30 + name_length + extra_length):
+            return
+
+        name = self._buffer[30:30 + name_length].decode("utf-8", errors="replace")
+
+        if(name == "manifest.json" or name.startswith("chunks/")):
+            raise ValueError("Incremental backups are restored with restore_backup.py")
+
+        if(flags & 0x1):
+            raise ValueError("Encrypted zip entries are not supported")
+
+        ## Zip64 entries move the sizes that do not fit in the header into an extra field, in a fixed order
+        if(compressed_size == 0xFFFFFFFF):
+            extra = self._buffer[30 + name_length:30 + name_length + extra_length]
+            offset = 0
+
+            while(offset + 4 <= len(extra)):
+                header_id, data_size = struct.unpack("<HH", extra[offset:offset + 4])
+
+                if(header_id == 0x0001):
+                    skip = 8 if uncompressed_size == 0xFFFFFFFF else 0
+                    compressed_size = struct.unpack("<Q", extra[offset + 4 + skip:offset + 12 + skip])[0]
+                    break
+
+                offset += 4 + data_size
+
+            else:
+                raise ValueError("The zip64 entry has no zip64 extra field")
+
+        if(method == zipfile.ZIP_DEFLATED):
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        elif(method == zipfile.ZIP_STORED and not flags & 0x8):
+            self._remaining = compressed_size
+
+        else:
+            raise ValueError(f"Unsupported zip compression method {method}")
+
+        self._header = (flags, method, crc, compressed_size)
+        self._buffer = self._buffer[30 + name_length + extra_length:]
+
+    def _write(self, data:bytes) -> None:
+
+        self._crc = zlib.crc32(data, self._crc)
+        self.output.write(data)
+
+    def _read_data(self) -> None:
+
+        flags, method, crc, _ = self._header # type: ignore
+
+        if(method == zipfile.ZIP_DEFLATED and not self._decompressor.eof):
+            self._write(self._decompressor.decompress(self._buffer))
+            self._buffer = self._decompressor.unused_data
+
+            if(not self._decompressor.eof):
+                return
+
+        elif(method == zipfile.ZIP_STORED and self._remaining > 0):
+            data = self._buffer[:self._remaining]
+            self._write(data)
+            self._remaining -= len(data)
+            self._buffer = self._buffer[len(data):]
+
+            if(self._remaining > 0):
+                return
+
+        ## The data descriptor after the entry holds the CRC when the header could not, its signature is optional
+        if(flags & 0x8):
+            if(len(self._buffer) < 8):
+                return
+
+            offset = 4 if struct.unpack("<I", self._buffer[:4])[0] == 0x08074b50 else 0
+            crc = struct.unpack("<I", self._buffer[offset:offset + 4])[0]
+
+        if(crc != self._crc):
+            raise ValueError("The backup failed its CRC check")
+
+        self._done = True
+
+    def feed(self, data:bytes) -> bool:
+
+        """
+
+        Take the next bytes of the archive. An empty chunk marks the end of it.
+
+        Args:
+        data (bytes): The next bytes
+
+        Returns:
+        bool: Always False, which tells python-gnupg not to keep its own copy of the data
+
+        """
+
+        if(self._done or self._error is not None or not data):
+            return False
+
+        try:
+            self._buffer += data
+
+            if(self._header is None):
+                self._read_header()
+
+            if(self._header is not None):
+                self._read_data()
+
+        except Exception as e:
+            self._error = str(e)
+
+        return False
+
+    def check(self) -> None:
+
+        """
+
+        Raise if the archive was bad or ended before its first entry did.
+
+        """
+
+        if(self._error is not None):
+            raise ValueError(self._error)
+
+        if(not self._done):
+            raise ValueError("The backup ended before the database did")
+
+def extract_backup(encrypted_file:typing.BinaryIO, output_path:str, passphrase:str) -> str:
+
+    """
+
+    Decrypt an encrypted backup and unzip the database in it into output_path in a single pass, without the plaintext archive touching the disk.
+
+    Args:
+    encrypted_file (typing.BinaryIO): The encrypted backup
+    output_path (str): The path to write the database to
+    passphrase (str): The passphrase the backup was encrypted with
+
+    Returns:
+    output_path (str): The path to the database
+
+    """
+
+    with open(output_path, "wb") as output:
+        extractor = ZipEntryExtractor(output)
+
+        gpg = GPG()
+        gpg.on_data = extractor.feed
+
+        status = gpg.decrypt_file(encrypted_file, passphrase=passphrase)
+
+    if(not status.ok):
+        raise ValueError(f'Failed to decrypt the backup: {status.status}')
+
+    extractor.check()
+
+    return output_path
+
+def validate_database(db_path:str) -> None:
+
+    """
+
+    Check that a database is intact and has a schema this version can migrate, before it replaces the live one.
+
+    Args:
+    db_path (str): The path to the SQLite database file
+
+    """
+
+    connection = sqlite3.connect(db_path, isolation_level=None)
+
+    try:
+        try:
+            result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"The backup is not a SQLite database: {e}")
+
+        if(result != "ok"):
+            raise ValueError(f"The backup failed the integrity check: {result}")
+
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(blog_posts)")}
+        missing = [column for column in ("id", "title", "content", "author", "created_at", "updated_at") if column not in columns]
+
+        if(missing):
+            raise ValueError(f"The backup has no blog_posts table or is missing its {', '.join(missing)} columns")
+
+        user_version = connection.execute("PRAGMA user_version").fetchone()[0]
+
+        if(user_version > SCHEMA_VERSION):
+            raise ValueError(f"The backup has schema version {user_version}, newer than this server's {SCHEMA_VERSION}")
+
+    finally:
+        connection.close()
+
+##----------------------------------/----------------------------------##
+
+def send_email(subject:str, body:str, to_email:str, attachment_path:str, from_email:str, smtp_server:str, smtp_port:int, smtp_user:str, smtp_password:str) -> bool:
+
+    """
+
+    Send an email with an attachment
+
+    Args:
+    subject (str): The subject of the email
+    body (str): The body of the email
+    to_email (str): The email address to send the email to
+    attachment_path (str): The path to the attachment to send
+    from_email (str): The email address to send the email from
+    smtp_server (str): The SMTP server to send the email
+    smtp_port (int): The SMTP port to send the email
+    smtp_user (str): The SMTP user to send the email
+    smtp_password (str): The SMTP password to send the email
+
+    Returns:
+    bool: Whether the email was sent
+
+    """
+
+
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = from_email
+    msg['To'] = to_email
+
+    msg.attach(MIMEText(body, 'plain'))
+
+    with open(attachment_path, 'rb') as f:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(f.read())
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_path)}')
+        msg.attach(part)
+
+    try:
+
+        with smtplib.SMTP(smtp_server, smtp_port) as server:
+            server.starttls() 
+            server.login(smtp_user, smtp_password)
+            server.send_message(msg)
+            server.quit()
+
+        return True
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+##-----------------------------------------start-of-backup-sinks----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class BackupSink(abc.ABC):
+
+    """
+
+    A destination for encrypted backups.
+
+    """
+
+    @abc.abstractmethod
+    def send(self, file_path:str, subject:str, body:str) -> bool:
+
+        """
+
+        Send the backup. Errors are printed, not raised, so one failing sink does not stop the others.
+
+        Args:
+        file_path (str): The path to the encrypted backup
+        subject (str): A one line description of the backup
+        body (str): A longer description of the backup
+
+        Returns:
+        bool: Whether the backup was sent
+
+        """
+
+class SmtpBackupSink(BackupSink):
+
+    """
+
+    Mails the backup as an attachment. The whole file is read into memory and base64 encoded, so it is refused above max_bytes.
+
+    """
+
+    def __init__(self, smtp_server:str, smtp_port:int, smtp_user:str, smtp_password:str, from_email:str, to_email:str, max_bytes:int) -> None:
+
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.smtp_user = smtp_user
+        self.smtp_password = smtp_password
+        self.from_email = from_email
+        self.to_email = to_email
+        self.max_bytes = max_bytes
+
+    def send(self, file_path:str, subject:str, body:str) -> bool:
+
+        size = os.path.getsize(file_path)
+
+        if(size > self.max_bytes):
+            print(f"Error: {os.path.basename(file_path)} is {size} bytes, over the {self.max_bytes} byte attachment limit")
+            return False
+
+        return send_email(
+            subject=subject,
+            body=body,
+            to_email=self.to_email,
+            attachment_path=file_path,
+            from_email=self.from_email,
+            smtp_server=self.smtp_server,
+            smtp_port=self.smtp_port,
+            smtp_user=self.smtp_user,
+            smtp_password=self.smtp_password
+        )
+
+class LocalDirectoryBackupSink(BackupSink):
+
+    """
+
+    Copies the backup into a directory and deletes all but the newest keep backups there.
+
+    In incremental mode keep should cover at least BACKUP_FULL_EVERY backups, or the oldest chain loses its base.
+
+    """
+
+    def __init__(self, directory:str, keep:int) -> None:
+
+        assert keep > 0, "BACKUP_LOCAL_KEEP must be positive"
+
+        self.directory = directory
+        self.keep = keep
+
+    def send(self, file_path:str, subject:str, body:str) -> bool:
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            target_path = os.path.join(self.directory, os.path.basename(file_path))
+
+            ## Copied under a temporary name so a crash never leaves a truncated backup that looks complete
+            shutil.copyfile(file_path, f"{target_path}.tmp")
+            os.replace(f"{target_path}.tmp", target_path)
+
+            backups = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".zip.pgp")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+
+            for entry in backups[:-self.keep]:
+                os.remove(entry.path)
+
+            print(f"Copied backup to {target_path}, removed {max(len(backups) - self.keep, 0)} old backups")
+
+            return True
+
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+
+class S3BackupSink(BackupSink):
+
+    """
+
+    Uploads the backup to an S3-compatible bucket with a multipart upload.
+
+    Parts are read and uploaded concurrency at a time, so at most concurrency parts are ever held in memory.
+
+    """
+
+    def __init__(self, bucket:str, prefix:str, endpoint_url:typing.Optional[str], region:str, access_key:typing.Optional[str], secret_key:typing.Optional[str], part_size:int, concurrency:int) -> None:
+
+        assert boto3 is not None, "boto3 is required for the s3 backup sink"
+        assert bucket, "BACKUP_S3_BUCKET is required for the s3 backup sink"
+        assert part_size >= 5 * 1024 * 1024, "BACKUP_S3_PART_SIZE must be at least 5 MiB"
+        assert concurrency > 0, "BACKUP_S3_CONCURRENCY must be positive"
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.concurrency = concurrency
+
+        ## Without explicit keys boto3 falls back to its usual credential chain
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+
+    def _upload_part(self, key:str, upload_id:str, part_number:int, data:bytes) -> typing.Dict[str, typing.Any]:
+
+        response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def send(self, file_path:str, subject:str, body:str) -> bool:
+
+        key = f"{self.prefix}{os.path.basename(file_path)}"
+        upload_id = None
+
+        try:
+            start = time.perf_counter()
+            upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType="application/pgp-encrypted")["UploadId"]
+
+            slots = threading.BoundedSemaphore(self.concurrency)
+            futures = []
+
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backup-s3") as executor, open(file_path, "rb") as f:
+                part_number = 1
+
+                while(True):
+                    slots.acquire()
+                    data = f.read(self.part_size)
+
+                    ## The first part is always sent, even when empty, since an upload needs at least one
+                    if(not data and part_number > 1):
+                        slots.release()
+                        break
+
+                    future = executor.submit(self._upload_part, key, upload_id, part_number, data)
+                    future.add_done_callback(lambda _: slots.release())
+                    futures.append(future)
+
+                    part_number += 1
+
+                    if(len(data) < self.part_size):
+                        break
+
+            parts = [future.result() for future in futures]
+
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+
+            print(f"Uploaded backup to s3://{self.bucket}/{key} in {len(parts)} parts in {time.perf_counter() - start:.3f}s")
+
+            return True
+
+        except Exception as e:
+            print(f"Error: {e}")
+
+            if(upload_id is not None):
+                try:
+                    self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+                except Exception:
+                    pass
+
+            return False
+
+def get_backup_sinks() -> typing.Tuple[str, typing.List[BackupSink]]:
+
+    """
+
+    Get the encryption key and the backup sinks selected by BACKUP_SINKS.
+
+    Returns:
+    str: The encryption key
+    typing.List[BackupSink]: The sinks to send backups to
+
+    """
+
+    ENCRYPTION_KEY, SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL, TO_EMAIL, BACKUP_SINKS = get_envs()
+
+    sinks:typing.List[BackupSink] = []
+
+    for sink in BACKUP_SINKS:
+        if(sink == "smtp"):
+            ## Most providers cap a message at 25 MB, and base64 grows the attachment by a third
+            sinks.append(SmtpBackupSink(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL, TO_EMAIL, int(os.getenv('BACKUP_SMTP_MAX_BYTES') or 18 * 1024 * 1024)))
+
+        elif(sink == "local"):
+            sinks.append(LocalDirectoryBackupSink(os.getenv('BACKUP_LOCAL_DIR') or "database/backups", int(os.getenv('BACKUP_LOCAL_KEEP') or 56)))
+
+        elif(sink == "s3"):
+            sinks.append(S3BackupSink(
+                bucket=os.getenv('BACKUP_S3_BUCKET') or "",
+                prefix=os.getenv('BACKUP_S3_PREFIX') or "",
+                endpoint_url=os.getenv('BACKUP_S3_ENDPOINT_URL') or None,
+                region=os.getenv('BACKUP_S3_REGION') or "us-east-1",
+                access_key=os.getenv('BACKUP_S3_ACCESS_KEY') or None,
+                secret_key=os.getenv('BACKUP_S3_SECRET_KEY') or None,
+                part_size=int(os.getenv('BACKUP_S3_PART_SIZE') or 8 * 1024 * 1024),
+                concurrency=int(os.getenv('BACKUP_S3_CONCURRENCY') or 4)
+            ))
+
+        else:
+            raise ValueError(f"Unknown backup sink: {sink}")
+
+    return ENCRYPTION_KEY, sinks
+
+def send_backup(sinks:typing.List[BackupSink], file_path:str, subject:str, body:str) -> bool:
+
+    """
+
+    Send the backup to every sink, even if an earlier one failed.
+
+    Args:
+    sinks (typing.List[BackupSink]): The sinks to send the backup to
+    file_path (str): The path to the encrypted backup
+    subject (str): A one line description of the backup
+    body (str): A longer description of the backup
+
+    Returns:
+    bool: Whether every sink got the backup
+
+    """
+
+    sent = True
+
+    for sink in sinks:
+        sent = sink.send(file_path, subject, body) and sent
+
+    return sent
+
+##----------------------------------/----------------------------------##
+
+##-----------------------------------------start-of-backup-jobs----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class BackupJob:
+
+    """
+
+    The status of one backup, saved as a row of backup_jobs so every worker can report on it and the history stays queryable.
+
+    The kind is "full" for a full backup, or "scheduled" for one that follows BACKUP_MODE and the schedule. Without a session_factory the job is not saved.
+
+    """
+
+    def __init__(self, kind:str, trigger:str, session_factory:typing.Optional[sessionmaker] = None) -> None:
+
+        self.session_factory = session_factory
+        self._last_saved = 0.0
+
+        self.record:typing.Dict[str, typing.Any] = {
+            "id": uuid4().hex,
+            "kind": kind,
+            "trigger": trigger,
+            "status": "queued",
+            "stage": None,
+            "progress": 0.0,
+            "stages": {},
+            "error": None,
+            "size": None,
+            "duration": None,
+            "manifest": None,
+            "pid": os.getpid(),
+            "created_at": datetime.now(timezone.utc),
+            "started_at": None,
+            "finished_at": None
+        }
+
+    @property
+    def id(self) -> str:
+        return self.record["id"]
+
+    @property
+    def kind(self) -> str:
+        return self.record["kind"]
+
+    def save(self) -> None:
+
+        if(self.session_factory is None):
+            return
+
+        with self.session_factory() as db:
+            db.merge(BackupJobModel(**{
+                **self.record,
+                "stages": json.dumps(self.record["stages"]),
+                "manifest": json.dumps(self.record["manifest"]) if self.record["manifest"] is not None else None
+            }))
+            db.commit()
+
+        self._last_saved = time.monotonic()
+
+    @contextlib.contextmanager
+    def stage(self, name:str) -> typing.Iterator[None]:
+
+        """
+
+        Time a stage of the job into its stages.
+
+        Args:
+        name (str): The name of the stage
+
+        """
+
+        self.record["stage"] = name
+        self.save()
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.record["stages"][name] = round(time.perf_counter() - start, 3)
+            metrics.observe("backup_stage_duration_seconds", time.perf_counter() - start, {"kind": self.kind, "stage": name})
+
+    def progress(self, done:int, total:int) -> None:
+
+        """
+
+        Record how far the snapshot has been copied, saving at most twice a second.
+
+        Args:
+        done (int): The pages copied so far
+        total (int): The page count
+
+        """
+
+        self.record["progress"] = round(done / total, 4) if total else 1.0
+
+        if(done == total or time.monotonic() - self._last_saved >= 0.5):
+            self.save()
+
+    def start(self) -> None:
+        self.record["status"] = "running"
+        self.record["started_at"] = datetime.now(timezone.utc)
+        self.save()
+
+    def finish(self, status:str, error:typing.Optional[str] = None) -> None:
+        self.record["status"] = status
+        self.record["stage"] = None
+        self.record["error"] = error
+        self.record["finished_at"] = datetime.now(timezone.utc)
+
+        if(self.record["started_at"] is not None):
+            self.record["duration"] = round((self.record["finished_at"] - self.record["started_at"]).total_seconds(), 3)
+
+        metrics.inc("backup_jobs_total", {"kind": self.kind, "status": status})
+
+        self.save()
+
+class BackupJobRunner:
+
+    """
+
+    Runs backups on a background thread, one at a time across every worker, and keeps their history in backup_jobs.
+
+    The job holds an flock on BACKUP_LOCK_PATH until it finishes, and the lock file holds its ID so a second request gets the running job back instead of starting another.
+    The kernel drops the lock if the worker dies, so a crashed backup never blocks the next one.
+
+    run returns the final status of a job, and raises if it failed.
+
+    """
+
+    def __init__(self, session_factory:sessionmaker, lock_path:str, run:typing.Callable[[BackupJob], str]) -> None:
+
+        self.session_factory = session_factory
+        self.lock_path = lock_path
+        self.run = run
+
+    def submit(self, kind:str, trigger:str) -> typing.Tuple[typing.Optional[typing.Dict[str, typing.Any]], bool]:
+
+        """
+
+        Start a backup job unless one is already running in any worker.
+
+        Args:
+        kind (str): The kind of backup, see BackupJob
+        trigger (str): What started the job
+
+        Returns:
+        typing.Optional[typing.Dict[str, typing.Any]]: The new job, or the running one (None if it could not be read)
+        bool: Whether a new job was started
+
+        """
+
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except BlockingIOError:
+            running_id = os.pread(lock_fd, 64, 0).decode(errors="ignore").strip()
+            os.close(lock_fd)
+
+            return (self.get(running_id) if running_id else None), False
+
+        job = BackupJob(kind, trigger, self.session_factory)
+
+        try:
+            os.ftruncate(lock_fd, 0)
+            os.pwrite(lock_fd, job.id.encode(), 0)
+            job.save()
+
+            threading.Thread(target=self._run, args=(job, lock_fd), name=f"backup-job-{job.id[:8]}", daemon=True).start()
+
+        except Exception:
+            os.close(lock_fd)
+            raise
+
+        return job.record, True
+
+    def _run(self, job:BackupJob, lock_fd:int) -> None:
+
+        try:
+            job.start()
+
+            try:
+                job.finish(self.run(job))
+
+            except Exception as e:
+                print(f"Backup job {job.id} failed: {e}")
+                job.finish("failed", str(e))
+
+            print(f"Backup job {job.id} {job.record['status']} in {job.record['duration']}s, stages: {job.record['stages']}")
+
+        finally:
+            os.ftruncate(lock_fd, 0)
+            os.close(lock_fd)
+
+    def _to_dict(self, db_job:BackupJobModel) -> typing.Dict[str, typing.Any]:
+
+        record = {column.name: getattr(db_job, column.name) for column in BackupJobModel.__table__.columns}
+        record["stages"] = json.loads(record["stages"] or "{}")
+        record["manifest"] = json.loads(record["manifest"]) if record["manifest"] else None
+
+        ## A worker that died mid-job never got to record it, the kernel only released its lock
+        if(record["status"] in ("queued", "running")):
+            try:
+                os.kill(record["pid"], 0)
+
+            except ProcessLookupError:
+                record["status"] = "failed"
+                record["error"] = "The worker running the job exited"
+
+            except PermissionError:
+                pass
+
+        return record
+
+    def get(self, job_id:str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+
+        """
+
+        Get a job by ID from any worker.
+
+        Args:
+        job_id (str): The ID of the job
+
+        Returns:
+        typing.Optional[typing.Dict[str, typing.Any]]: The job, or None if there is no such job
+
+        """
+
+        with self.session_factory() as db:
+            db_job = db.get(BackupJobModel, job_id)
+
+            return self._to_dict(db_job) if db_job else None
+
+    def history(self, kind:typing.Optional[str] = None, status:typing.Optional[str] = None, limit:int = 50) -> typing.List[typing.Dict[str, typing.Any]]:
+
+        """
+
+        Get the newest jobs first.
+
+        Args:
+        kind (typing.Optional[str]): Only jobs of this kind
+        status (typing.Optional[str]): Only jobs with this status
+        limit (int): The number of jobs to get
+
+        Returns:
+        typing.List[typing.Dict[str, typing.Any]]: The jobs
+
+        """
+
+        with self.session_factory() as db:
+            query = db.query(BackupJobModel)
+
+            if(kind is not None):
+                query = query.filter(BackupJobModel.kind == kind)
+
+            if(status is not None):
+                query = query.filter(BackupJobModel.status == status)
+
+            return [self._to_dict(db_job) for db_job in query.order_by(BackupJobModel.created_at.desc()).limit(limit).all()]
+
+    def get_last_run(self) -> typing.Optional[datetime]:
+
+        """
+
+        Get when the last scheduled backup finished, whatever its outcome.
+
+        Returns:
+        typing.Optional[datetime]: The time in UTC, or None if no scheduled backup has finished
+
+        """
+
+        with self.session_factory() as db:
+            last_run = db.query(func.max(BackupJobModel.finished_at)).filter(BackupJobModel.kind == "scheduled").scalar()
+
+        return last_run.replace(tzinfo=timezone.utc) if last_run else None
+
+    def get_last_manifest(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+
+        """
+
+        Get the manifest of the last incremental backup that reached every sink.
+
+        Returns:
+        typing.Optional[typing.Dict[str, typing.Any]]: The manifest, or None if there is none
+
+        """
+
+        with self.session_factory() as db:
+            manifest = (db.query(BackupJobModel.manifest)
+                        .filter(BackupJobModel.manifest.isnot(None))
+                        .order_by(BackupJobModel.finished_at.desc())
+                        .limit(1)
+                        .scalar())
+
+        return json.loads(manifest) if manifest else None
+
+    def import_shelve_state(self, shelve_path:str) -> None:
+
+        """
+
+        Carry last_run and chunk_manifest over from the shelf the scheduler used to keep, so an upgrade neither backs up early nor restarts an incremental chain.
+
+        Args:
+        shelve_path (str): The path the shelf was opened with
+
+        """
+
+        with self.session_factory() as db:
+            if(db.query(BackupJobModel.id).limit(1).scalar() is not None):
+                return
+
+        try:
+            with shelve.open(shelve_path, flag="r") as db:
+                last_run = db.get('last_run', None)
+                manifest = db.get('chunk_manifest', None)
+
+        except Exception:
+            return
+
+        if(last_run is None):
+            return
+
+        job = BackupJob("scheduled", "shelve", self.session_factory)
+
+        ## The shelf stored naive local times
+        job.record["started_at"] = job.record["finished_at"] = job.record["created_at"] = last_run.astimezone(timezone.utc)
+        job.record["status"] = "succeeded"
+        job.record["manifest"] = manifest
+        job.save()
+
+        print(f"Imported the last backup run ({last_run}) from {shelve_path}")
+
+##----------------------------------/----------------------------------##
+
+def perform_backup(job:typing.Optional[BackupJob] = None) -> bool:
+
+    """
+
+    Perform the backup process
+
+    Args:
+    job (typing.Optional[BackupJob]): The job to record progress and stage timings in
+
+    Returns:
+    bool: Whether the backup reached every sink
+
+    """
+
+    job = job or BackupJob("full", "direct")
+
+    with job.stage("prepare"):
+        ENCRYPTION_KEY, sinks = get_backup_sinks()
+
+        timestamp = datetime.now().strftime("%Y-%m-%d %H_%M_%S")
+
+        with get_read_session() as db:
+            number_of_blog_posts = db.query(BlogPostModel).count()
+
+    export_name = f'exported_db_{timestamp}.db'
+    encrypted_path = f'{export_name}.zip.pgp'
+
+    try:
+        ## Snapshot, zip and gpg run as one pipeline, so they are timed as one stage
+        with job.stage("archive"):
+            write_encrypted_backup(DATABASE_PATH, export_name, encrypted_path, ENCRYPTION_KEY, job.progress)
+
+        job.record["size"] = os.path.getsize(encrypted_path)
+
+        with job.stage("send"):
+            return send_backup(
+                sinks,
+                encrypted_path,
+                subject=f'SQLite Database Backup ({timestamp})',
+                body='Please find the attached encrypted and compressed SQLite database backup. This email was sent automatically. Do not reply.\n\nNumber of blog posts: ' + str(number_of_blog_posts)
+            )
+
+    finally:
+        if(os.path.exists(encrypted_path)):
+            os.remove(encrypted_path)
+
+##----------------------------------/----------------------------------##
+
+def perform_incremental_backup(previous_manifest:typing.Optional[typing.Dict[str, typing.Any]], job:typing.Optional[BackupJob] = None) -> typing.Optional[typing.Dict[str, typing.Any]]:
+
+    """
+
+    Perform an incremental backup, only mailing the chunks that changed since previous_manifest.
+
+    Args:
+    previous_manifest (typing.Optional[typing.Dict[str, typing.Any]]): The manifest of the last backup that was sent, or None
+    job (typing.Optional[BackupJob]): The job to record progress and stage timings in
+
+    Returns:
+    typing.Optional[typing.Dict[str, typing.Any]]: The manifest of this backup, or None if it could not be sent
+
+    """
+
+    job = job or BackupJob("scheduled", "direct")
+
+    with job.stage("prepare"):
+        ENCRYPTION_KEY, sinks = get_backup_sinks()
+
+        timestamp = datetime.now().strftime("%Y-%m-%d %H_%M_%S")
+
+        with get_read_session() as db:
+            number_of_blog_posts = db.query(BlogPostModel).count()
+
+    encrypted_path = f'incremental_db_{timestamp}.zip.pgp'
+
+    try:
+        with job.stage("archive"):
+            manifest = write_incremental_backup(DATABASE_PATH, timestamp, encrypted_path, ENCRYPTION_KEY, previous_manifest, job.progress)
+
+        job.record["size"] = os.path.getsize(encrypted_path)
+
+        kind = "Full" if manifest["sequence"] == 0 else "Incremental"
+
+        with job.stage("send"):
+            sent = send_backup(
+                sinks,
+                encrypted_path,
+                subject=f'SQLite Database {kind} Backup ({timestamp})',
+                body=(
+                    f'Please find the attached encrypted {kind.lower()} SQLite database backup. This email was sent automatically. Do not reply.\n\n'
+                    f'Number of blog posts: {number_of_blog_posts}\n'
+                    f'Backup: {manifest["backup_id"]} (#{manifest["sequence"]} since full backup {manifest["base_id"]})\n'
+                    f'Chunks sent: {manifest["new_chunks"]} of {len(manifest["chunks"])}\n\n'
+                    'Restore with restore_backup.py and every backup from the full backup up to this one.'
+                )
+            )
+
+    finally:
+        if(os.path.exists(encrypted_path)):
+            os.remove(encrypted_path)
+
+    ## A delta that did not reach every sink would leave a hole in its chain, so the next one is taken against the last one that did
+    return manifest if sent else None
+
+##----------------------------------/----------------------------------##
+
+def perform_backup_scheduled(job:typing.Optional[BackupJob] = None) -> bool:
+
+    """
+
+    Perform the backup process on a scheduled interval
+
+    Args:
+    job (typing.Optional[BackupJob]): The job to record progress and stage timings in
+
+    Returns:
+    bool: Whether the backup reached every sink
+
+    """
+
+    job = job or BackupJob("scheduled", "direct")
+
+    if(BACKUP_MODE == "incremental"):
+        ## Kept on the job row, so the next delta is taken against the last one that reached every sink
+        job.record["manifest"] = perform_incremental_backup(backup_jobs.get_last_manifest(), job)
+
+        return job.record["manifest"] is not None
+
+    return perform_backup(job)
+
+##----------------------------------/----------------------------------##
+
+def run_backup_job(job:BackupJob) -> str:
+
+    """
+
+    Run a backup job.
+
+    Args:
+    job (BackupJob): The job to run
+
+    Returns:
+    str: "succeeded"
+
+    """
+
+    if(job.kind == "scheduled"):
+        sent = perform_backup_scheduled(job)
+
+    else:
+        sent = perform_backup(job)
+
+    if(not sent):
+        raise RuntimeError("The backup did not reach every backup sink")
+
+    return "succeeded"
+
+backup_jobs = BackupJobRunner(JobsSessionLocal, BACKUP_LOCK_PATH, run_backup_job)
+
+##----------------------------------/----------------------------------##
+
+def start_scheduler() -> BackgroundScheduler:
+
+    """
+
+    Schedule a backup every BACKUP_INTERVAL, the first one due BACKUP_INTERVAL after the last one. Only the scheduler leader calls this.
+
+    Returns:
+    BackgroundScheduler: The running scheduler
+
+    """
+
+    backup_jobs.import_shelve_state(BACKUP_SCHEDULER_SHELVE_PATH)
+
+    last_run = backup_jobs.get_last_run()
+
+    ## A worker that takes over from a dead leader picks up the old schedule instead of restarting the interval
+    next_run_time = max(last_run + BACKUP_INTERVAL, datetime.now(timezone.utc)) if last_run else datetime.now(timezone.utc)
+
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(backup_jobs.submit, 'interval', args=["scheduled", "interval"], seconds=BACKUP_INTERVAL.total_seconds(), next_run_time=next_run_time)
+    scheduler.start()
+
+    print(f"Worker {os.getpid()} is the scheduler leader, next backup at {next_run_time:%Y-%m-%d %H:%M:%S} UTC")
+
+    return scheduler
+
+##----------------------------------/----------------------------------##
+
+class SchedulerLeader:
+
+    """
+
+    Elects the one worker that runs the backup scheduler.
+
+    The leader holds an flock on SCHEDULER_LOCK_PATH for as long as it lives, which is its lease: the kernel renews it for free and drops it the moment the process dies.
+    The other workers retry the lock every retry_interval seconds, so one of them takes over within that long of the leader dying.
+
+    """
+
+    def __init__(self, lock_path:str, retry_interval:float) -> None:
+
+        self.lock_path = lock_path
+        self.retry_interval = retry_interval
+
+        self._lock_fd:typing.Optional[int] = None
+        self._scheduler:typing.Optional[BackgroundScheduler] = None
+        self._stop_event = threading.Event()
+        self._thread:typing.Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._scheduler is not None
+
+    def _try_lead(self) -> bool:
+
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except BlockingIOError:
+            os.close(lock_fd)
+            return False
+
+        try:
+            os.ftruncate(lock_fd, 0)
+            os.pwrite(lock_fd, str(os.getpid()).encode(), 0)
+
+            self._scheduler = start_scheduler()
+            self._lock_fd = lock_fd
+
+            return True
+
+        except Exception as e:
+            ## Give the lease up so another worker can try
+            print(f"Failed to start the scheduler: {e}")
+            os.close(lock_fd)
+
+            return False
+
+    def _run(self) -> None:
+
+        while(not self._stop_event.is_set()):
+            if(self._try_lead()):
+                return
+
+            self._stop_event.wait(self.retry_interval)
+
+    def start(self) -> None:
+
+        """
+
+        Try to become the leader, and keep trying in the background until this worker is the leader.
+
+        """
+
+        if(self._thread is not None):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="scheduler-leader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+
+        """
+
+        Stop the scheduler and give up the lease, so another worker takes over right away.
+
+        """
+
+        self._stop_event.set()
+
+        if(self._thread is not None):
+            self._thread.join(timeout=5)
+            self._thread = None
+
+        if(self._scheduler is not None):
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+
+        if(self._lock_fd is not None):
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+scheduler_leader = SchedulerLeader(SCHEDULER_LOCK_PATH, SCHEDULER_LEADER_RETRY)
+
+##-----------------------------------------start-of-auth----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def create_access_token(data:dict, expires_delta:typing.Optional[timedelta] = None) -> str:
+
+    """
+    
+    Create an access token with the given data and expiration time
+
+    Args:
+    data (dict): The data to encode into the token
+    expires_delta (timedelta): The time until the token expires
+
+    Returns:
+    encoded_jwt (str): The encoded JWT token
+
+    """
+
+    to_encode = data.copy()
+
+    if(expires_delta):
+        expire = datetime.now(timezone.utc) + expires_delta
+    else:
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, ACCESS_TOKEN_SECRET, algorithm=TOKEN_ALGORITHM) # type: ignore
+    return encoded_jwt
+
+def create_refresh_token(data:dict, expires_delta:typing.Optional[timedelta] = None) -> str:
+
+    """
+
+    Create a refresh token with the given data and expiration time
+
+    Args:
+    data (dict): The data to encode into the token
+    expires_delta (timedelta): The time until the token expires
+
+    Returns:
+    encoded_jwt (str): The encoded JWT token
+
+    """
+
+    to_encode = data.copy()
+
+    if(expires_delta):
+        expire = datetime.now(timezone.utc) + expires_delta
+    else:
+        expire = datetime.now(timezone.utc) + timedelta(days=1)
+
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, REFRESH_TOKEN_SECRET, algorithm=TOKEN_ALGORITHM) # type: ignore
+    return encoded_jwt
+
+class TokenCache:
+
+    """
+
+    Bounded LRU of verified tokens, keyed by the SHA-256 of the token so the tokens themselves are not kept.
+
+    An entry is only trusted until the exp claim of its token, so a cached token never outlives the one jwt.decode would accept.
+
+    """
+
+    def __init__(self, max_entries:int) -> None:
+
+        self.max_entries = max_entries
+
+        self._entries:typing.OrderedDict[bytes, typing.Tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token:str) -> typing.Optional[str]:
+
+        """
+
+        Get the username of a token verified earlier.
+
+        Args:
+        token (str): The token
+
+        Returns:
+        typing.Optional[str]: The username, or None if the token has not been verified or has expired since
+
+        """
+
+        key = hashlib.sha256(token.encode()).digest()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if(entry is None):
+                return None
+
+            if(entry[0] <= time.time()):
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+
+            return entry[1]
+
+    def put(self, token:str, expires_at:float, username:str) -> None:
+
+        """
+
+        Remember a verified token.
+
+        Args:
+        token (str): The token
+        expires_at (float): The exp claim of the token
+        username (str): The sub claim of the token
+
+        """
+
+        if(self.max_entries <= 0):
+            return
+
+        key = hashlib.sha256(token.encode()).digest()
+
+        with self._lock:
+            self._entries[key] = (expires_at, username)
+            self._entries.move_to_end(key)
+
+            while(len(self._entries) > self.max_entries):
+                self._entries.popitem(last=False)
+
+token_cache = TokenCache(max_entries=TOKEN_CACHE_SIZE)
+
+def verify_token(token:str) -> TokenData:
+    
+        """
+
+        Verify the given token and return the data
+
+        Args:    
+        token (str): The token to verify
+
+        Returns:
+        TokenData: The data from the token
+
+        """
+
+        username = token_cache.get(token)
+
+        if(username is not None):
+            return TokenData(username=username)
+
+        try:
+            payload = jwt.decode(token, ACCESS_TOKEN_SECRET, algorithms=[TOKEN_ALGORITHM]) # type: ignore
+            username = payload.get("sub")
+
+            if(username is None):
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+            ## Tokens without an exp claim never expire in jwt.decode, so they are not cached rather than cached forever
+            if(isinstance(payload.get("exp"), (int, float))):
+                token_cache.put(token, payload["exp"], username)
+            
+            return TokenData(username=username)
+        
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+        
+        except PyJWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+class LoginThrottle:
+
+    """
+
+    Counts failed logins per key in a sliding window, so /login can turn a client away before paying for bcrypt.
+
+    Each uvicorn worker keeps its own counts, so with two workers a client gets up to twice max_failures attempts per window.
+
+    """
+
+    def __init__(self, max_failures:int, window:float) -> None:
+
+        self.max_failures = max_failures
+        self.window = window
+
+        self._failures:typing.Dict[str, typing.List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, key:str, now:float) -> typing.List[float]:
+
+        ## Caller must hold the lock
+        failures = [failed_at for failed_at in self._failures.get(key, []) if failed_at > now - self.window]
+
+        if(failures):
+            self._failures[key] = failures
+
+        else:
+            self._failures.pop(key, None)
+
+        return failures
+
+    def retry_after(self, keys:typing.Iterable[str]) -> int:
+
+        """
+
+        Get how long the client has to wait before it may try again.
+
+        Args:
+        keys (typing.Iterable[str]): The keys of the attempt, such as its IP and username
+
+        Returns:
+        int: Seconds to wait, 0 if the attempt may go ahead
+
+        """
+
+        now = time.monotonic()
+        wait = 0.0
+
+        with self._lock:
+            for key in keys:
+                failures = self._prune(key, now)
+
+                if(len(failures) >= self.max_failures):
+                    wait = max(wait, failures[-self.max_failures] + self.window - now)
+
+        return int(wait) + 1 if wait > 0 else 0
+
+    def fail(self, keys:typing.Iterable[str]) -> None:
+
+        """
+
+        Record a failed login.
+
+        Args:
+        keys (typing.Iterable[str]): The keys of the attempt
+
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+            for key in keys:
+                failures = self._prune(key, now)
+                failures.append(now)
+                self._failures[key] = failures[-self.max_failures:]
+
+            ## Forget keys that only failed long ago, so a spray of IPs cannot grow this forever
+            if(len(self._failures) > 10000):
+                for key in list(self._failures):
+                    self._prune(key, now)
+
+    def succeed(self, keys:typing.Iterable[str]) -> None:
+
+        """
+
+        Clear the failures of a client that logged in.
+
+        Args:
+        keys (typing.Iterable[str]): The keys of the attempt
+
+        """
+
+        with self._lock:
+            for key in keys:
+                self._failures.pop(key, None)
+
+login_throttle = LoginThrottle(max_failures=LOGIN_MAX_FAILURES, window=LOGIN_FAILURE_WINDOW)
+
+def verify_credentials(credentials:HTTPBasicCredentials) -> None:
+
+    """
+    
+    Verify the given credentials
+
+    Args:
+    credentials (HTTPBasicCredentials): The credentials to verify
+
+    """
+
+    ## bcrypt is only run once the cheap checks pass, so a wrong username or an oversized password costs nothing
+    is_valid = (hmac.compare_digest(credentials.username.encode(), ADMIN_USER.encode()) # type: ignore
+                and len(credentials.password) <= LOGIN_MAX_PASSWORD_LENGTH
+                and pwd_context.verify(credentials.password, ADMIN_PASS_HASH))
+
+    if(not is_valid):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+
+def verify_totp(totp_code:str) -> None:
+
+    """
+
+    Verify the given TOTP code
+
+    Args:
+    totp_code (str): The TOTP code to verify
+
+    """
+
+    totp = pyotp.TOTP(TOTP_SECRET) # type: ignore
+
+    if(not totp.verify(totp_code)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    
+def get_current_user(token:str = Depends(oauth2_scheme)):
+
+    """
+
+    Get the current user from the given token
+
+    Args:
+    token (str): The token to get the user from
+
+    Returns:
+    str: The username of the user
+
+    """
+
+    with trace_span("dependency get_current_user"):
+        try:
+            token_data = verify_token(token)
+            return token_data.username
+        except HTTPException as e:
+            raise e
+
+def get_current_active_user(current_user:str = Depends(get_current_user)):
+
+    """
+
+    Get the current active user
+
+    Args:
+    current_user (str): The current user
+
+    Returns:
+    str: The username of the user
+
+    """
+
+    if(current_user != ADMIN_USER):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    return current_user
+
+def get_metrics_scraper(token:str = Depends(oauth2_scheme)) -> str:
+
+    """
+
+    Let the Prometheus scraper in with METRICS_TOKEN, and the admin with an access token
+
+    Args:
+    token (str): The bearer token
+
+    Returns:
+    str: "metrics" for the scrape token, otherwise the username of the admin
+
+    """
+
+    if(METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())):
+        return "metrics"
+
+    return get_current_active_user(get_current_user(token))
+
+##-----------------------------------------start-of-database----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class DatabaseGate:
+
+    """
+
+    Lets any number of public reads run at once, but none between close_database() and open_database() while the database file is swapped.
+
+    """
+
+    def __init__(self) -> None:
+
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._swapping = False
+
+    def _leave(self) -> None:
+
+        with self._condition:
+            self._readers -= 1
+
+            if(self._readers == 0):
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self) -> typing.Iterator[None]:
+
+        with self._condition:
+            while(self._swapping):
+                self._condition.wait()
+
+            self._readers += 1
+
+        try:
+            yield
+
+        finally:
+            self._leave()
+
+    def begin_swap(self) -> None:
+
+        with self._condition:
+            while(self._swapping):
+                self._condition.wait()
+
+            self._swapping = True
+
+            while(self._readers > 0):
+                self._condition.wait()
+
+    def end_swap(self) -> None:
+
+        with self._condition:
+            self._swapping = False
+            self._condition.notify_all()
+
+database_gate = DatabaseGate()
+
+def close_database() -> None:
+
+    """
+
+    Close every connection this worker has to the database, and hold public reads until open_database().
+
+    Must not be called on the event loop, it waits for in-flight reads to finish.
+
+    """
+
+    ## Buffered views belong to the database being replaced
+    view_count_buffer.flush()
+
+    database_gate.begin_swap()
+
+    close_all_sessions()
+
+    engine.dispose()
+    read_engine.dispose()
+
+def open_database() -> None:
+
+    """
+
+    Reopen the database after close_database(), and let public reads through again.
+
+    """
+
+    global engine, SessionLocal, read_engine, ReadSessionLocal
+
+    try:
+        engine = create_database_engine()
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        ## The read-only engines need the -shm, which only a writer can create
+        with engine.connect():
+            pass
+
+        read_engine = create_database_engine(read_only=True)
+        ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+    finally:
+        database_gate.end_swap()
+
+def swap_database_file(new_db_path:str, current_db_path:str) -> None:
+
+    """
+
+    Atomically replace the database file and migrate the new one. Every worker must have called close_database() first.
+
+    Args:
+    new_db_path (str): The path to the new database, on the same filesystem as the current one
+    current_db_path (str): The path to the current SQLite database
+
+    """
+
+    ## With no other connection open, closing this one checkpoints the -wal into the old file and deletes it, so none of its frames get replayed on top of the new database
+    connection = sqlite3.connect(current_db_path)
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.close()
+
+    for suffix in ("-wal", "-shm"):
+        if(os.path.exists(f"{current_db_path}{suffix}")):
+            os.remove(f"{current_db_path}{suffix}")
+
+    os.replace(new_db_path, current_db_path)
+
+    migration_engine = create_database_engine()
+
+    try:
+        migrate_database(migration_engine)
+
+    finally:
+        migration_engine.dispose()
+
+    blog_post_cache.invalidate()
+
+class MaintenanceCoordinator:
+
+    """
+
+    Puts every uvicorn worker into maintenance while the database file is swapped.
+
+    Each worker runs a watcher thread that heartbeats a file named after its pid in workers_dir and polls maintenance_path.
+    When that file appears the worker answers 503, calls close_database() and acknowledges. When it goes away the worker calls open_database() and serves again.
+    The worker doing the swap waits for every live worker to acknowledge first, so no connection ever sees the file change under it.
+
+    """
+
+    def __init__(self, maintenance_path:str, workers_dir:str, poll_interval:float, timeout:float) -> None:
+
+        self.maintenance_path = maintenance_path
+        self.workers_dir = workers_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self._paused_id:typing.Optional[str] = None
+        self._owned_id:typing.Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread:typing.Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return self._paused_id is not None
+
+    def _heartbeat_path(self, pid:int) -> str:
+        return os.path.join(self.workers_dir, str(pid))
+
+    def _ack_path(self, pid:int) -> str:
+        return os.path.join(self.workers_dir, f"{pid}.ack")
+
+    def _read(self, path:str) -> typing.Optional[str]:
+
+        try:
+            with open(path, "r") as f:
+                return f.read().strip() or None
+
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path:str, value:str) -> None:
+
+        with open(f"{path}.tmp", "w") as f:
+            f.write(value)
+
+        os.replace(f"{path}.tmp", path)
+
+    def _pause(self, maintenance_id:str) -> None:
+
+        with self._lock:
+            if(self._paused_id is not None):
+                return
+
+            self._paused_id = maintenance_id
+
+        try:
+            close_database()
+
+        except Exception:
+            self._paused_id = None
+            raise
+
+    def _resume(self) -> None:
+
+        with self._lock:
+            if(self._paused_id is None):
+                return
+
+        try:
+            open_database()
+
+        finally:
+            self._paused_id = None
+
+    def _run(self) -> None:
+
+        last_heartbeat = 0.0
+
+        while(not self._stop_event.wait(self.poll_interval)):
+            try:
+                if(time.monotonic() - last_heartbeat >= 1):
+                    self._write(self._heartbeat_path(os.getpid()), str(time.time()))
+                    last_heartbeat = time.monotonic()
+
+                maintenance_id = self._read(self.maintenance_path)
+
+                ## The worker doing the swap pauses and resumes itself
+                if(maintenance_id is not None and maintenance_id != self._owned_id):
+                    if(self._paused_id is None):
+                        self._pause(maintenance_id)
+                        print(f"Worker {os.getpid()} entered maintenance for {maintenance_id}")
+
+                    ## Also acknowledges a swap that started before this worker got round to resuming from the last one
+                    if(self._read(self._ack_path(os.getpid())) != maintenance_id):
+                        self._write(self._ack_path(os.getpid()), maintenance_id)
+
+                elif(maintenance_id is None and self._paused_id is not None and self._owned_id is None):
+                    self._resume()
+                    print(f"Worker {os.getpid()} left maintenance")
+
+            except Exception as e:
+                print(f"Maintenance watcher error: {e}")
+
+    def _other_workers(self) -> typing.List[int]:
+
+        workers = []
+
+        for entry in os.scandir(self.workers_dir):
+            if(not entry.name.isdigit() or int(entry.name) == os.getpid()):
+                continue
+
+            try:
+                os.kill(int(entry.name), 0)
+                alive = time.time() - entry.stat().st_mtime < max(5, self.poll_interval * 10)
+
+            except (ProcessLookupError, FileNotFoundError):
+                alive = False
+
+            except PermissionError:
+                alive = True
+
+            if(alive):
+                workers.append(int(entry.name))
+
+            else:
+                for path in (entry.path, self._ack_path(int(entry.name))):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+
+        return workers
+
+    def start(self) -> None:
+
+        """
+
+        Start heartbeating and watching for maintenance.
+
+        """
+
+        if(self._thread is not None):
+            return
+
+        os.makedirs(self.workers_dir, exist_ok=True)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="maintenance-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+
+        """
+
+        Stop watching and drop this worker from the heartbeats, so a swap does not wait for it.
+
+        """
+
+        self._stop_event.set()
+
+        if(self._thread is not None):
+            self._thread.join(timeout=5)
+            self._thread = None
+
+        for path in (self._heartbeat_path(os.getpid()), self._ack_path(os.getpid())):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def run(self, swap:typing.Callable[[], None]) -> None:
+
+        """
+
+        Put every worker into maintenance, call swap once none of them has the database open, then bring them all back.
+
+        Must not be called on the event loop.
+
+        Args:
+        swap (typing.Callable[[], None]): Swaps the database file
+
+        """
+
+        maintenance_id = uuid4().hex
+        self._owned_id = maintenance_id
+
+        try:
+            self._write(self.maintenance_path, maintenance_id)
+
+            try:
+                self._pause(maintenance_id)
+
+                deadline = time.monotonic() + self.timeout
+
+                while(True):
+                    waiting = [pid for pid in self._other_workers() if self._read(self._ack_path(pid)) != maintenance_id]
+
+                    if(not waiting):
+                        break
+
+                    if(time.monotonic() > deadline):
+                        raise RuntimeError(f"Workers {waiting} did not enter maintenance within {self.timeout}s")
+
+                    time.sleep(self.poll_interval)
+
+                swap()
+
+            finally:
+                os.remove(self.maintenance_path)
+                self._resume()
+
+        finally:
+            self._owned_id = None
+
+maintenance = MaintenanceCoordinator(MAINTENANCE_PATH, WORKERS_DIR, MAINTENANCE_POLL_INTERVAL, MAINTENANCE_TIMEOUT)
+
+def restore_database(encrypted_file:typing.BinaryIO, passphrase:str) -> None:
+
+    """
+
+    Replace the database with an encrypted backup.
+
+    The backup is decrypted, unzipped and validated while the old database keeps serving. Every worker is only in maintenance for the swap itself.
+
+    Args:
+    encrypted_file (typing.BinaryIO): The encrypted backup
+    passphrase (str): The passphrase the backup was encrypted with
+
+    """
+
+    ## Shares the backup lock, so a backup never snapshots a file that is being swapped and two restores never race
+    lock_fd = os.open(BACKUP_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except BlockingIOError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A backup or restore is already running")
+
+        try:
+            start = time.perf_counter()
+
+            extract_backup(encrypted_file, RESTORE_DATABASE_PATH, passphrase)
+            validate_database(RESTORE_DATABASE_PATH)
+
+            print(f"Restore extracted and validated in {time.perf_counter() - start:.3f}s")
+
+            maintenance.run(lambda: swap_database_file(RESTORE_DATABASE_PATH, DATABASE_PATH))
+
+            print(f"Restore finished in {time.perf_counter() - start:.3f}s")
+
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        finally:
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(f"{RESTORE_DATABASE_PATH}{suffix}")
+
+    finally:
+        os.close(lock_fd)
+
+def get_db() -> typing.Generator[Session, None, None]:
+    
+    """
+
+    Get the database session.
+
+    Returns:
+    typing.Generator[Session, None, None]: The database session
+
+    """
+
+    with trace_span("dependency get_db"):
+        db:Session = SessionLocal()
+    
+    try:
+        yield db
+    
+    finally:
+        db.close()
+
+@contextlib.contextmanager
+def get_read_session() -> typing.Iterator[Session]:
+
+    """
+
+    Get a session on the read-only engine, for anonymous reads.
+
+    Returns:
+    typing.Iterator[Session]: The read-only database session
+
+    """
+
+    with database_gate.reading():
+        db:Session = ReadSessionLocal()
+
+        try:
+            yield db
+
+        finally:
+            db.close()
+
+def get_read_db() -> typing.Generator[Session, None, None]:
+
+    """
+
+    Get a read-only database session, for endpoints that never write.
+
+    Returns:
+    typing.Generator[Session, None, None]: The read-only database session
+
+    """
+
+    with contextlib.ExitStack() as stack:
+
+        ## Covers the wait while the database file is swapped
+        with trace_span("dependency get_read_db"):
+            db = stack.enter_context(get_read_session())
+
+        yield db
+
+ReadResult = typing.TypeVar("ReadResult")
+
+async def func_run_read(read:typing.Callable[[Session], ReadResult]) -> ReadResult:
+
+    """
+
+    Run a read query on the threadpool, so async endpoints never block the event loop on SQLite.
+
+    Args:
+    read (typing.Callable[[Session], ReadResult]): The query for a read-only session
+
+    Returns:
+    ReadResult: The result of the query
+
+    """
+
+    def run_read() -> ReadResult:
+        with get_read_session() as db:
+            return read(db)
+
+    return await run_in_threadpool(run_read)
+
+def func_get_blog_posts(db:Session, skip:int=0, limit:int=10) -> typing.List[BlogPostModel]:
+    
+    """
+    
+    Get the blog posts from the database with the given skip and limit.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    skip (int): The number of blog posts to skip
+    limit (int): The number of blog posts to get
+
+    Returns:
+    typing.List[BlogPostModel]: The list of blog posts
+
+    """
+
+    return db.query(BlogPostModel).order_by(BlogPostModel.created_at.desc(), BlogPostModel.id.desc()).offset(skip).limit(limit).all()
+
+def func_get_all_blog_posts(db:Session) -> typing.List[BlogPostModel]:
+
+    """
+
+    Get all the blog posts from the database in descending order.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    skip (int): The number of blog posts to skip
+    limit (int): The number of blog posts to get
+
+    Returns:
+    typing.List[BlogPostModel]: The list of blog posts
+
+    """
+
+    return db.query(BlogPostModel).order_by(BlogPostModel.created_at.desc(), BlogPostModel.id.desc()).all()
+
+def func_get_all_blog_post_summaries(db:Session) -> typing.List[BlogPostModel]:
+
+    """
+
+    Get all the blog posts from the database in descending order, loading only the summary columns.
+
+    Args:
+    db (Session): The SQLAlchemy session
+
+    Returns:
+    typing.List[BlogPostModel]: The list of blog posts, without content
+
+    """
+
+    return db.query(BlogPostModel).options(summary_columns).order_by(BlogPostModel.created_at.desc(), BlogPostModel.id.desc()).all()
+
+def func_get_recent_blog_posts(db:Session, skip:int=0, limit:int=10) -> typing.List[BlogPostModel]:
+
+    """
+
+    Get the recent blog posts from the database with the given skip and limit.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    skip (int): The number of blog posts to skip
+    limit (int): The number of blog posts to get
+
+    Returns:
+    typing.List[BlogPostModel]: The list of blog posts
+
+    """
+
+    return db.query(BlogPostModel).order_by(BlogPostModel.created_at.desc(), BlogPostModel.id.desc()).offset(skip).limit(limit).all()
+
+def select_blog_posts_after(cursor:typing.Optional[str], limit:int, summary_only:bool) -> Select:
+
+    """
+
+    Build the keyset query for the blog posts that come after the given cursor, newest first.
+
+    One extra row is selected so the caller can tell whether there is a next page.
+
+    Args:
+    cursor (str): The cursor returned with the previous page, or None for the first page
+    limit (int): The number of blog posts to get
+    summary_only (bool): Whether to load only the summary columns, skipping content
+
+    Returns:
+    Select: The query
+
+    """
+
+    statement = select(BlogPostModel)
+
+    if(summary_only):
+        statement = statement.options(summary_columns)
+
+    if(cursor):
+        created_at, blog_post_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            BlogPostModel.created_at < created_at,
+            and_(BlogPostModel.created_at == created_at, BlogPostModel.id < blog_post_id)
+        ))
+
+    return statement.order_by(BlogPostModel.created_at.desc(), BlogPostModel.id.desc()).limit(limit + 1)
+
+def split_blog_post_page(blog_posts:typing.List[BlogPostModel], limit:int) -> typing.Tuple[typing.List[BlogPostModel], typing.Optional[str]]:
+
+    """
+
+    Trim the extra row selected by select_blog_posts_after and create the cursor for the next page.
+
+    Args:
+    blog_posts (typing.List[BlogPostModel]): Up to limit + 1 blog posts
+    limit (int): The number of blog posts in a page
+
+    Returns:
+    typing.List[BlogPostModel]: The blog posts of the page
+    typing.Optional[str]: The cursor for the next page, or None if this is the last page
+
+    """
+
+    if(len(blog_posts) <= limit):
+        return blog_posts, None
+
+    blog_posts = blog_posts[:limit]
+
+    return blog_posts, encode_cursor(blog_posts[-1])
+
+def func_get_blog_posts_after(db:Session, cursor:typing.Optional[str] = None, limit:int=10, summary_only:bool=False) -> typing.Tuple[typing.List[BlogPostModel], typing.Optional[str]]:
+
+    """
+
+    Get the blog posts that come after the given cursor, newest first, using the (created_at, id) index.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    cursor (str): The cursor returned with the previous page, or None for the first page
+    limit (int): The number of blog posts to get
+    summary_only (bool): Whether to load only the summary columns, skipping content
+
+    Returns:
+    typing.List[BlogPostModel]: The list of blog posts
+    typing.Optional[str]: The cursor for the next page, or None if this is the last page
+
+    """
+
+    limit = max(limit, 1)
+    blog_posts = list(db.execute(select_blog_posts_after(cursor, limit, summary_only)).scalars().all())
+
+    return split_blog_post_page(blog_posts, limit)
+
+def func_search_blog_posts(db:Session, query:str, skip:int=0, limit:int=10) -> typing.Tuple[typing.List[BlogPostSearchResult], int]:
+
+    """
+
+    Search the blog posts with the blog_posts_fts full-text index, best match first.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    query (str): The search terms, every term must match and the last one may be a prefix
+    skip (int): The number of results to skip
+    limit (int): The number of results to get
+
+    Returns:
+    typing.List[BlogPostSearchResult]: The matching blog posts with a snippet of the matched text
+    int: The total number of matches
+
+    """
+
+    match_query = create_match_query(query)
+
+    if(not match_query):
+        return [], 0
+
+    ## Title matches weigh the most, then author, then content
+    matches = db.execute(text(
+        "SELECT rowid, snippet(blog_posts_fts, -1, '**', '**', '...', 24) AS snippet, bm25(blog_posts_fts, 10.0, 1.0, 2.0) AS rank "
+        "FROM blog_posts_fts WHERE blog_posts_fts MATCH :query ORDER BY rank LIMIT :limit OFFSET :skip"
+    ), {"query": match_query, "limit": limit, "skip": skip}).fetchall()
+
+    total = db.execute(text("SELECT count(*) FROM blog_posts_fts WHERE blog_posts_fts MATCH :query"), {"query": match_query}).scalar() or 0
+
+    if(not matches):
+        return [], total
+
+    rowid_column = literal_column("blog_posts.rowid")
+
+    db_blog_posts = {
+        rowid: db_blog_post
+        for db_blog_post, rowid in db.query(BlogPostModel, rowid_column).options(summary_columns).filter(rowid_column.in_([match.rowid for match in matches])).all()
+    }
+
+    results = [
+        BlogPostSearchResult(**BlogPostSummary.model_validate(db_blog_posts[match.rowid]).model_dump(), snippet=match.snippet, rank=match.rank)
+        for match in matches if match.rowid in db_blog_posts
+    ]
+
+    return results, total
+
+def func_get_blog_post(db:Session, blog_post_id:schemaUUID) -> BlogPostModel:
+
+    """
+
+    Get the blog post from the database with the given ID.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    blog_post_id (UUID): The ID of the blog post
+
+    Returns:
+    BlogPostModel: The blog post
+
+    """
+
+    return db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
+
+def func_get_blog_post_by_slug(db:Session, slug:str) -> typing.Optional[BlogPostModel]:
+
+    """
+
+    Get the blog post from the database with the given slug.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    slug (str): The slug of the blog post
+
+    Returns:
+    typing.Optional[BlogPostModel]: The blog post or None if not found
+
+    """
+
+    return db.query(BlogPostModel).filter(BlogPostModel.slug == slug).first()
+
+def func_get_blog_count(db:Session) -> int:
+
+    """
+
+    Get the number of blog posts in the database.
+
+    Args:
+    db (Session): The SQLAlchemy session
+
+    Returns:
+    int: The number of blog posts
+
+    """
+
+    return db.query(BlogPostModel).count()
+
+def func_get_unique_slug(db:Session, title:str, blog_post_id:typing.Optional[schemaUUID] = None) -> str:
+
+    """
+
+    Get a slug for the given title that is not used by any other blog post.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    title (str): The title of the blog post
+    blog_post_id (UUID): The ID of the blog post being updated, if any
+
+    Returns:
+    str: The unique slug
+
+    """
+
+    base_slug = create_base_slug(title)
+
+    query = db.query(BlogPostModel.slug).filter((BlogPostModel.slug == base_slug) | (BlogPostModel.slug.like(f"{base_slug}-%")))
+
+    if(blog_post_id is not None):
+        query = query.filter(BlogPostModel.id != blog_post_id)
+
+    return create_unique_slug(title, [row.slug for row in query.all()])
+
+def func_create_blog_post(db:Session, db_blog_post:BlogPostModel) -> BlogPostModel:
+
+    """
+
+    Create a blog post in the database.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    db_blog_post (BlogPostModel): The blog post to create
+
+    Returns:
+    BlogPostModel: The created blog post
+
+    """
+
+    db_blog_post.slug = func_get_unique_slug(db, str(db_blog_post.title)) # type: ignore
+    db_blog_post.excerpt = create_excerpt(str(db_blog_post.content)) # type: ignore
+    db_blog_post.word_count = count_words(str(db_blog_post.content)) # type: ignore
+
+    db.add(db_blog_post)
+    db.commit()
+    db.refresh(db_blog_post)
+
+    func_invalidate_blog_post(db_blog_post.id) # type: ignore
+
+    return db_blog_post
+
+def func_update_blog_post(db:Session, blog_post_id:schemaUUID, blog_post:BlogPostUpdate) -> BlogPostModel:
+
+    """
+
+    Update the blog post in the database with the given ID.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    blog_post_id (UUID): The ID of the blog post
+    blog_post (schemas.BlogPostUpdate): The blog post to update
+
+    Returns:
+    BlogPostModel: The updated blog post
+
+    """
+
+    db_blog_post = db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
+
+    if(db_blog_post):
+        for key, value in blog_post.model_dump().items():
+            setattr(db_blog_post, key, value)
+
+        if(db_blog_post.title is not None):
+            db_blog_post.slug = func_get_unique_slug(db, str(db_blog_post.title), blog_post_id) # type: ignore
+
+        if(db_blog_post.content is not None):
+            db_blog_post.excerpt = create_excerpt(str(db_blog_post.content)) # type: ignore
+            db_blog_post.word_count = count_words(str(db_blog_post.content)) # type: ignore
+
+        db.commit()
+        db.refresh(db_blog_post)
+
+        func_invalidate_blog_post(blog_post_id)
+
+    return db_blog_post
+
+def func_delete_blog_post(db:Session, blog_post_id:schemaUUID) -> BlogPostModel:
+
+    """
+
+    Delete the blog post in the database with the given ID.
+
+    Args:
+    db (Session): The SQLAlchemy session
+    blog_post_id (UUID): The ID of the blog post
+    
+    Returns:
+    BlogPostModel: The deleted blog post
+
+    """
+
+    db_blog_post = db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
+    if(db_blog_post):
+        db.delete(db_blog_post)
+        db.commit()
+
+        func_invalidate_blog_post(blog_post_id)
+
+    return db_blog_post
+
+def func_invalidate_blog_post(blog_post_id:schemaUUID) -> None:
+
+    """
+
+    Invalidate the read cache on every worker and rebuild the stored list responses after a blog post was written.
+
+    Args:
+    blog_post_id (UUID): The ID of the created, updated or deleted blog post
+
+    """
+
+    blog_post_cache.invalidate()
+    response_store.schedule()
+
+def func_increment_view_count(blog_post_id:schemaUUID) -> None:
+
+    """
+    
+    Increment the view count of the blog post with the given ID.
+
+    The increment is buffered in memory and written to the database by the view count flusher.
+
+    Args:
+    blog_post_id (UUID): The ID of the blog post 
+
+    Returns:
+    None
+
+    """
+
+    view_count_buffer.increment(blog_post_id)
+
+ReadSchema = typing.TypeVar("ReadSchema", BlogPostRead, BlogPostSummary)
+
+def func_get_blog_post_read(db_blog_post:BlogPostModel, read_schema:typing.Type[ReadSchema] = BlogPostRead) -> ReadSchema:
+
+    """
+
+    Convert the blog post to its read schema, including view count increments that have not been flushed yet.
+
+    Args:
+    db_blog_post (BlogPostModel): The blog post
+    read_schema (typing.Type[BaseModel]): BlogPostRead or BlogPostSummary
+
+    Returns:
+    ReadSchema: The blog post with its pending views applied
+
+    """
+
+    return func_apply_pending_views(read_schema.model_validate(db_blog_post))
+
+def func_apply_pending_views(blog_post_read:ReadSchema) -> ReadSchema:
+
+    """
+
+    Add the view count increments that have not been flushed yet to the given blog post.
+
+    Args:
+    blog_post_read (ReadSchema): The blog post as read from the database or the cache
+
+    Returns:
+    ReadSchema: A copy of the blog post with its pending views applied, or the same object if there are none
+
+    """
+
+    pending = view_count_buffer.get_pending(blog_post_read.id)
+
+    if(pending):
+        blog_post_read = blog_post_read.model_copy(update={"view_count": blog_post_read.view_count + pending})
+
+    return blog_post_read
+
+##-----------------------------------------start-of-view-counts----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ViewCountBuffer:
+
+    """
+
+    Write-behind buffer for blog post view counts, shared by every uvicorn worker.
+
+    Increments are kept as per-post deltas in a memory-mapped table, found by the post ID and a few probed slots, so
+    every worker reports the same pending views for a post. Whichever worker flushes next writes all of them in a single
+    batched UPDATE. A post that finds every probed slot busy is counted by its worker alone until that worker flushes.
+
+    Each slot also counts the views flushed from it, and collect_flushed() hands a worker the ones flushed since it last
+    asked, so its cache can add them to the posts it holds. A drained slot is only taken over once its last flush is
+    older than reuse_after, when no cached copy can still be missing those views.
+    An flock on the table serialises the workers, a second one their flushes, and a thread lock the threads of one worker.
+
+    """
+
+    ## Flushes so far, slots taken so far
+    HEADER = struct.Struct("<QQ")
+    ## Post ID, pending views, views being flushed, views flushed, the number the slot was taken as (0 if free), last flush
+    SLOT = struct.Struct("<16sqqqQd")
+    PROBES = 8
+
+    def __init__(self, path:str, slots:int, flush_interval:float, flush_threshold:int, generation_path:str, reuse_after:float) -> None:
+
+        self.path = path
+        self.slots = slots
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.generation_path = generation_path
+        self.reuse_after = reuse_after
+
+        self._size = self.HEADER.size + self.SLOT.size * slots
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        if(os.fstat(self._fd).st_size < self._size):
+            os.ftruncate(self._fd, self._size)
+
+        self._map = mmap.mmap(self._fd, self._size)
+        ## Flushes lock a file of their own, so increments never wait on a flush
+        self._flush_fd = os.open(f"{path}.flush", os.O_RDWR | os.O_CREAT, 0o644)
+
+        ## Posts that found no free slot, counted by this worker alone
+        self._local_pending:typing.Dict[schemaUUID, int] = {}
+        self._local_flushing:typing.Dict[schemaUUID, int] = {}
+        self._local_flushed:typing.Dict[schemaUUID, int] = {}
+        ## Increments made by this worker since it last flushed, to wake its flusher early
+        self._increments = 0
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread:typing.Optional[threading.Thread] = None
+
+        ## The flushed views already handed to the cache, per slot offset: (the number the slot was taken as, views flushed)
+        self._applied:typing.Dict[int, typing.Tuple[int, int]] = {}
+        self._flush_count = 0
+
+        ## Views flushed before this worker started are in the database already
+        self.collect_flushed()
+
+    @contextlib.contextmanager
+    def _locked(self) -> typing.Iterator[None]:
+
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+            try:
+                yield
+
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _iter_slots(self) -> typing.Iterator[typing.Tuple[int, typing.Tuple[bytes, int, int, int, int, float]]]:
+
+        ## Caller must hold the lock
+        for index, slot in enumerate(self.SLOT.iter_unpack(self._map[self.HEADER.size:self._size])):
+            yield self.HEADER.size + index * self.SLOT.size, slot
+
+    def _find(self, blog_post_id:schemaUUID, take:bool) -> typing.Optional[int]:
+
+        ## Caller must hold the lock
+        post_bytes = blog_post_id.bytes
+        free_offset = None
+        reuse_before = time.time() - self.reuse_after
+
+        for probe in range(self.PROBES):
+            offset = self.HEADER.size + ((blog_post_id.int + probe) % self.slots) * self.SLOT.size
+            slot_post, pending, flushing, _, number, flushed_at = self.SLOT.unpack_from(self._map, offset)
+
+            if(number != 0 and slot_post == post_bytes):
+                return offset
+
+            if(free_offset is None and (number == 0 or (pending == 0 and flushing == 0 and flushed_at < reuse_before))):
+                free_offset = offset
+
+        if(not take or free_offset is None):
+            return None
+
+        flush_count, taken_count = self.HEADER.unpack_from(self._map, 0)
+        self.HEADER.pack_into(self._map, 0, flush_count, taken_count + 1)
+        self.SLOT.pack_into(self._map, free_offset, post_bytes, 0, 0, 0, taken_count + 1, time.time())
+
+        return free_offset
+
+    def _add_to_slot(self, offset:int, pending:int = 0, flushing:int = 0, flushed:int = 0) -> None:
+
+        ## Caller must hold the lock
+        slot_post, slot_pending, slot_flushing, slot_flushed, number, flushed_at = self.SLOT.unpack_from(self._map, offset)
+
+        if(flushed):
+            flushed_at = time.time()
+
+        self.SLOT.pack_into(self._map, offset, slot_post, slot_pending + pending, slot_flushing + flushing, slot_flushed + flushed, number, flushed_at)
+
+    @property
+    def pending_total(self) -> int:
+
+        with self._locked():
+            total = sum(pending + flushing for _, (_, pending, flushing, _, number, _) in self._iter_slots() if number != 0)
+
+            return total + sum(self._local_pending.values()) + sum(self._local_flushing.values())
+
+    def current_generation(self) -> typing.Optional[typing.Tuple[int, int]]:
+
+        """
+
+        Get the view generation, which every worker moves after it flushed views, for the validators of the list endpoints.
+
+        Returns:
+        typing.Optional[typing.Tuple[int, int]]: The inode and mtime of the generation file, or None if no views were flushed yet
+
+        """
+
+        try:
+            stat_result = os.stat(self.generation_path)
+            return stat_result.st_ino, stat_result.st_mtime_ns
+
+        except FileNotFoundError:
+            return None
+
+    def _move_generation(self) -> None:
+
+        temp_path = f"{self.generation_path}.{os.getpid()}.tmp"
+
+        try:
+            with open(temp_path, "w") as f:
+                f.write(str(time.time_ns()))
+
+            os.replace(temp_path, self.generation_path)
+
+        except Exception as e:
+            print(f"Error updating view generation: {e}")
+
+    def increment(self, blog_post_id:schemaUUID, amount:int = 1) -> None:
+
+        """
+
+        Buffer a view count increment for the blog post.
+
+        Args:
+        blog_post_id (UUID): The ID of the blog post
+        amount (int): The number of views to add
+
+        """
+
+        with self._locked():
+            offset = self._find(blog_post_id, take=True)
+
+            if(offset is None):
+                self._local_pending[blog_post_id] = self._local_pending.get(blog_post_id, 0) + amount
+
+            else:
+                self._add_to_slot(offset, pending=amount)
+
+            self._increments += amount
+            should_wake = self._increments >= self.flush_threshold
+
+        if(should_wake):
+            self._wake_event.set()
+
+    def get_pending(self, blog_post_id:schemaUUID) -> int:
+
+        """
+
+        Get the number of buffered views for the blog post, from every worker.
+
+        Args:
+        blog_post_id (UUID): The ID of the blog post
+
+        Returns:
+        int: The number of views not yet written to the database
+
+        """
+
+        with self._locked():
+            pending = self._local_pending.get(blog_post_id, 0) + self._local_flushing.get(blog_post_id, 0)
+            offset = self._find(blog_post_id, take=False)
+
+            if(offset is not None):
+                _, slot_pending, slot_flushing, _, _, _ = self.SLOT.unpack_from(self._map, offset)
+                pending += slot_pending + slot_flushing
+
+            return pending
+
+    def collect_flushed(self) -> typing.Dict[schemaUUID, int]:
+
+        """
+
+        Get the views that were flushed, by any worker, since this worker last asked.
+
+        Returns:
+        typing.Dict[UUID, int]: The flushed views per blog post ID, empty if nothing was flushed since
+
+        """
+
+        ## Read without the lock, a flush that is just being counted is picked up on the next call
+        if(self.HEADER.unpack_from(self._map, 0)[0] == self._flush_count):
+            return {}
+
+        deltas:typing.Dict[schemaUUID, int] = {}
+
+        with self._locked():
+            self._flush_count = self.HEADER.unpack_from(self._map, 0)[0]
+
+            for offset, (slot_post, _, _, flushed, number, _) in self._iter_slots():
+                applied_number, applied = self._applied.get(offset, (0, 0))
+
+                if(number == 0 or flushed == 0):
+                    continue
+
+                ## The slot was taken over since, and every view flushed from it before has expired from the cache
+                if(applied_number != number):
+                    applied = 0
+
+                if(flushed > applied):
+                    blog_post_id = schemaUUID(bytes=slot_post)
+                    deltas[blog_post_id] = deltas.get(blog_post_id, 0) + flushed - applied
+                    self._applied[offset] = (number, flushed)
+
+            for blog_post_id, delta in self._local_flushed.items():
+                deltas[blog_post_id] = deltas.get(blog_post_id, 0) + delta
+
+            self._local_flushed = {}
+
+        return deltas
+
+    def flush(self) -> int:
+
+        """
+
+        Write the buffered view counts of every worker to the database in one transaction.
+
+        Returns:
+        int: The number of posts updated
+
+        """
+
+        with self._flush_lock:
+            fcntl.flock(self._flush_fd, fcntl.LOCK_EX)
+
+            try:
+                return self._flush()
+
+            finally:
+                fcntl.flock(self._flush_fd, fcntl.LOCK_UN)
+
+    def _flush(self) -> int:
+
+        ## Caller must hold the flush lock
+        taken:typing.List[typing.Tuple[int, int]] = []
+        pending:typing.Dict[schemaUUID, int] = {}
+
+        with self._locked():
+            for offset, (slot_post, slot_pending, slot_flushing, _, number, _) in self._iter_slots():
+                ## Flushes never overlap, so views already being flushed were left by a worker that died while flushing them
+                if(number == 0 or slot_pending + slot_flushing == 0):
+                    continue
+
+                self._add_to_slot(offset, pending=-slot_pending, flushing=slot_pending)
+                taken.append((offset, slot_pending + slot_flushing))
+
+                blog_post_id = schemaUUID(bytes=slot_post)
+                pending[blog_post_id] = pending.get(blog_post_id, 0) + slot_pending + slot_flushing
+
+            local_pending = self._local_pending
+            self._local_pending = {}
+            self._local_flushing = local_pending
+            self._increments = 0
+
+        for blog_post_id, delta in local_pending.items():
+            pending[blog_post_id] = pending.get(blog_post_id, 0) + delta
+
+        if(not pending):
+            return 0
+
+        statement = (
+            update(BlogPostModel)
+            .where(BlogPostModel.id == bindparam("b_id"))
+            ## updated_at is set to itself so its onupdate does not fire for view counts
+            .values(view_count=func.coalesce(BlogPostModel.view_count, 0) + bindparam("b_delta"), updated_at=BlogPostModel.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+        start = time.perf_counter()
+
+        try:
+            ## Held off while the database file is swapped
+            with database_gate.reading(), engine.begin() as connection:
+                connection.execute(statement, [{"b_id": blog_post_id, "b_delta": delta} for blog_post_id, delta in pending.items()])
+
+        except Exception as e:
+            print(f"Error flushing view counts: {e}")
+            metrics.inc("view_count_flush_errors_total")
+
+            ## Put the deltas back so they are retried on the next flush
+            with self._locked():
+                for offset, delta in taken:
+                    self._add_to_slot(offset, pending=delta, flushing=-delta)
+
+                for blog_post_id, delta in local_pending.items():
+                    self._local_pending[blog_post_id] = self._local_pending.get(blog_post_id, 0) + delta
+
+                self._local_flushing = {}
+
+            return 0
+
+        metrics.observe("view_count_flush_duration_seconds", time.perf_counter() - start)
+        metrics.inc("view_count_flushes_total")
+        metrics.inc("view_count_flushed_views_total", amount=sum(pending.values()))
+
+        ## The views stop being pending and become flushed in one step, which the caches of every worker pick up through collect_flushed()
+        with self._locked():
+            for offset, delta in taken:
+                self._add_to_slot(offset, flushing=-delta, flushed=delta)
+
+            for blog_post_id, delta in local_pending.items():
+                self._local_flushed[blog_post_id] = self._local_flushed.get(blog_post_id, 0) + delta
+
+            self._local_flushing = {}
+
+            flush_count, taken_count = self.HEADER.unpack_from(self._map, 0)
+            self.HEADER.pack_into(self._map, 0, flush_count + 1, taken_count)
+
+        self._move_generation()
+        response_store.schedule()
+
+        return len(pending)
+
+    def _run(self) -> None:
+
+        while(not self._stop_event.is_set()):
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+            self.flush()
+
+    def start(self) -> None:
+
+        """
+
+        Start the background flusher thread.
+
+        """
+
+        if(self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="view-count-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+
+        """
+
+        Stop the background flusher thread and flush whatever is left.
+
+        """
+
+        self._stop_event.set()
+        self._wake_event.set()
+
+        if(self._thread is not None):
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+
+        self.flush()
+
+## Slots are only taken over once the cache can no longer hold a post without the views flushed from them
+view_count_buffer = ViewCountBuffer(VIEW_COUNTS_PATH, VIEW_COUNT_SLOTS, flush_interval=VIEW_COUNT_FLUSH_INTERVAL, flush_threshold=VIEW_COUNT_FLUSH_THRESHOLD, generation_path=VIEW_GENERATION_PATH, reuse_after=BLOG_CACHE_TTL)
+
+##-----------------------------------------start-of-cache----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class BlogPostCache:
+
+    """
+
+    Bounded LRU cache with a TTL for public blog post reads.
+
+    Writes call invalidate(), which clears the local entries and replaces the shared generation file. Every lookup
+    stats that file, so the other uvicorn worker drops its entries as soon as it sees the file change.
+
+    Values are stored as read from the database, without pending view counts, and are never None.
+    View count flushes do not invalidate anything, every lookup adds the views flushed since the last one to the cached posts instead.
+
+    """
+
+    def __init__(self, max_entries:int, ttl:float, generation_path:str, view_counts:ViewCountBuffer) -> None:
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation_path = generation_path
+        self.view_counts = view_counts
+
+        self._entries:typing.OrderedDict[typing.Hashable, typing.Tuple[float, typing.Any]] = OrderedDict()
+        self._generation = self._read_generation()
+        ## Moved when flushed views are added, so values loaded while a flush was being written are not cached with its views counted twice
+        self._view_epoch = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _read_generation(self) -> typing.Optional[typing.Tuple[int, int]]:
+
+        try:
+            stat_result = os.stat(self.generation_path)
+            return stat_result.st_ino, stat_result.st_mtime_ns
+
+        except FileNotFoundError:
+            return None
+
+    def _sync_generation(self) -> typing.Optional[typing.Tuple[int, int]]:
+
+        ## Caller must hold the lock
+        generation = self._read_generation()
+
+        if(generation != self._generation):
+            self._entries.clear()
+            self._generation = generation
+            self.invalidations += 1
+
+        self._sync_views()
+
+        return generation
+
+    def _sync_views(self) -> None:
+
+        ## Caller must hold the lock
+        deltas = self.view_counts.collect_flushed()
+
+        if(not deltas):
+            return
+
+        for key, (expires_at, value) in list(self._entries.items()):
+            updated = self._add_views_to_value(value, deltas)
+
+            if(updated is not value):
+                self._entries[key] = (expires_at, updated)
+
+        self._view_epoch += 1
+
+    def current_generation(self) -> typing.Optional[typing.Tuple[int, int]]:
+
+        """
+
+        Get the current cache generation. Pass it to put() so that values loaded across a write are not stored.
+
+        Returns:
+        typing.Optional[typing.Tuple[int, int]]: The generation
+
+        """
+
+        with self._lock:
+            return self._sync_generation()
+
+    def get(self, key:typing.Hashable) -> typing.Any:
+
+        """
+
+        Get the cached value for the key.
+
+        Args:
+        key (typing.Hashable): The cache key
+
+        Returns:
+        typing.Any: The value, or None if it is not cached or has expired
+
+        """
+
+        if(self.max_entries <= 0):
+            return None
+
+        with self._lock:
+            self._sync_generation()
+
+            entry = self._entries.get(key)
+
+            if(entry is None or entry[0] < time.monotonic()):
+                if(entry is not None):
+                    del self._entries[key]
+
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+    def put(self, key:typing.Hashable, value:typing.Any, generation:typing.Optional[typing.Tuple[int, int]], view_epoch:typing.Optional[int] = None) -> None:
+
+        """
+
+        Cache the value for the key, unless the cache was invalidated or views were flushed since the value was loaded.
+
+        Args:
+        key (typing.Hashable): The cache key
+        value (typing.Any): The value, must not be None
+        generation (typing.Optional[typing.Tuple[int, int]]): The generation from before the value was loaded
+        view_epoch (typing.Optional[int]): The view_epoch from before the value was loaded, None to not check it
+
+        """
+
+        if(self.max_entries <= 0 or value is None):
+            return
+
+        with self._lock:
+            if(self._sync_generation() != generation or (view_epoch is not None and view_epoch != self._view_epoch)):
+                return
+
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while(len(self._entries) > self.max_entries):
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_load(self, key:typing.Hashable, loader:typing.Callable[[], typing.Awaitable[typing.Any]]) -> typing.Any:
+
+        """
+
+        Get the cached value for the key, awaiting the loader and caching its result on a miss.
+
+        Args:
+        key (typing.Hashable): The cache key
+        loader (typing.Callable[[], typing.Awaitable[typing.Any]]): Loads the value from the database
+
+        Returns:
+        typing.Any: The value
+
+        """
+
+        value = self.get(key)
+
+        if(value is not None):
+            return value
+
+        generation = self.current_generation()
+        view_epoch = self._view_epoch
+        value = await loader()
+        self.put(key, value, generation, view_epoch)
+
+        return value
+
+    def _add_views_to_value(self, value:typing.Any, deltas:typing.Dict[schemaUUID, int]) -> typing.Any:
+
+        if(isinstance(value, (BlogPostRead, BlogPostSummary))):
+            delta = deltas.get(value.id)
+            return value.model_copy(update={"view_count": value.view_count + delta}) if delta else value
+
+        ## A keyset page, (items, next_cursor)
+        if(isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], list)):
+            items = [self._add_views_to_value(item, deltas) for item in value[0]]
+
+            if(any(item is not original for item, original in zip(items, value[0]))):
+                return items, value[1]
+
+        return value
+
+    def invalidate(self) -> None:
+
+        """
+
+        Drop the cached entries of every worker by replacing the generation file.
+
+        """
+
+        temp_path = f"{self.generation_path}.{os.getpid()}.tmp"
+
+        try:
+            with open(temp_path, "w") as f:
+                f.write(str(time.time_ns()))
+
+            os.replace(temp_path, self.generation_path)
+
+        except Exception as e:
+            print(f"Error updating cache generation: {e}")
+
+        with self._lock:
+            self._sync_generation()
+            self._entries.clear()
+
+    def get_stats(self) -> typing.Dict[str, int]:
+
+        """
+
+        Get the counters of this worker's cache.
+
+        Returns:
+        typing.Dict[str, int]: The hit, miss, eviction and invalidation counts and the current size
+
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+blog_post_cache = BlogPostCache(max_entries=BLOG_CACHE_SIZE, ttl=BLOG_CACHE_TTL, generation_path=CACHE_GENERATION_PATH, view_counts=view_count_buffer)
+
+## The generation file doubles as the Last-Modified of the list endpoints, so it has to exist
+if(not os.path.exists(CACHE_GENERATION_PATH)):
+    blog_post_cache.invalidate()
+
+async def func_get_cached_blog_post(blog_post_id:schemaUUID) -> typing.Optional[BlogPostRead]:
+
+    """
+
+    Get the blog post with the given ID through the cache.
+
+    Args:
+    blog_post_id (UUID): The ID of the blog post
+
+    Returns:
+    typing.Optional[BlogPostRead]: The blog post, without pending views, or None if not found
+
+    """
+
+    def read(db:Session) -> typing.Optional[BlogPostRead]:
+        db_blog_post = func_get_blog_post(db, blog_post_id=blog_post_id)
+        return BlogPostRead.model_validate(db_blog_post) if db_blog_post else None
+
+
+    return await blog_post_cache.get_or_load(("post", blog_post_id), lambda: func_run_read(read))
+
+async def func_get_cached_blog_post_by_slug(slug:str) -> typing.Optional[BlogPostRead]:
+
+    """
+
+    Get the blog post with the given slug through the cache.
+
+    Args:
+    slug (str): The slug of the blog post
+
+    Returns:
+    typing.Optional[BlogPostRead]: The blog post, without pending views, or None if not found
+
+    """
+
+    def read(db:Session) -> typing.Optional[BlogPostRead]:
+        db_blog_post = func_get_blog_post_by_slug(db, slug=slug)
+        return BlogPostRead.model_validate(db_blog_post) if db_blog_post else None
+
+
+    return await blog_post_cache.get_or_load(("slug", slug), lambda: func_run_read(read))
+
+async def func_get_cached_blog_post_page(cursor:typing.Optional[str], limit:int, summary_only:bool=False) -> typing.Tuple[list, typing.Optional[str]]:
+
+    """
+
+    Get a keyset page of blog posts through the cache.
+
+    Args:
+    cursor (str): The cursor returned with the previous page, or None for the first page
+    limit (int): The number of blog posts to get
+    summary_only (bool): Whether to get BlogPostSummary objects instead of full posts
+
+    Returns:
+    list: The blog posts, without pending views
+    typing.Optional[str]: The cursor for the next page, or None if this is the last page
+
+    """
+
+    read_schema = BlogPostSummary if summary_only else BlogPostRead
+
+    def read(db:Session) -> typing.Tuple[list, typing.Optional[str]]:
+        blog_posts, next_cursor = func_get_blog_posts_after(db, cursor=cursor, limit=limit, summary_only=summary_only)
+        return [read_schema.model_validate(db_blog_post) for db_blog_post in blog_posts], next_cursor
+
+
+    return await blog_post_cache.get_or_load(("page", summary_only, cursor or None, limit), lambda: func_run_read(read))
+
+async def func_get_cached_blog_count() -> int:
+
+    """
+
+    Get the number of blog posts through the cache.
+
+    Returns:
+    int: The number of blog posts
+
+    """
+
+    return await blog_post_cache.get_or_load(("count",), lambda: func_run_read(func_get_blog_count))
+
+##-----------------------------------------start-of-response-store----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+## The encoded variants of a list body, with the cache and view generations it was built from
+StoredBody = typing.Tuple[typing.Dict[str, bytes], typing.Optional[typing.Tuple[int, int]], typing.Optional[typing.Tuple[int, int]]]
+
+class ResponseStore:
+
+    """
+
+    Pre-encoded JSON bodies, with gzip and brotli variants, for the list endpoints.
+
+    Every post is encoded once as a BlogPostRead fragment and once as a BlogPostSummary fragment, and the bodies for the
+    canonical limits are joined from them and compressed by a builder thread, never on the request path. Requests get
+    the last bodies that were built while the next ones are being built, and nothing when there are none yet.
+
+    The builder reads every post again when the cache generation moved, since a post was written on some worker. When
+    only the view generation moved it reads the view counts and re-encodes just the posts whose count changed, and
+    bodies whose bytes did not change keep their compressed variants.
+
+    """
+
+    def __init__(self, limits:typing.Tuple[typing.Optional[int], ...], max_body_size:int, check_interval:float) -> None:
+
+        self.limits = limits
+        self.max_body_size = max_body_size
+        self.check_interval = check_interval
+
+        self._fragments:typing.Dict[bool, typing.Dict[schemaUUID, bytes]] = {False: {}, True: {}}
+        self._view_counts:typing.Dict[schemaUUID, int] = {}
+        self._order:typing.List[schemaUUID] = []
+        self._bodies:typing.Dict[typing.Tuple[bool, typing.Optional[int]], StoredBody] = {}
+
+        self._generation:typing.Optional[typing.Tuple[int, int]] = None
+        self._view_generation:typing.Optional[typing.Tuple[int, int]] = None
+        self._is_built = False
+
+        ## _lock only guards swapping in a finished build, _build_lock keeps two builds from running at once
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread:typing.Optional[threading.Thread] = None
+
+    def _encode_post(self, fragments:typing.Dict[bool, typing.Dict[schemaUUID, bytes]], view_counts:typing.Dict[schemaUUID, int], db_blog_post:BlogPostModel) -> None:
+
+        blog_post_id:schemaUUID = db_blog_post.id # type: ignore
+
+        fragments[False][blog_post_id] = BlogPostRead.model_validate(db_blog_post).model_dump_json().encode()
+        fragments[True][blog_post_id] = BlogPostSummary.model_validate(db_blog_post).model_dump_json().encode()
+        view_counts[blog_post_id] = db_blog_post.view_count or 0 # type: ignore
+
+    def is_stale(self) -> bool:
+
+        """
+
+        Check whether the stored bodies were built from older generations than the current ones.
+
+        Returns:
+        bool: Whether the builder has work to do
+
+        """
+
+        generation = blog_post_cache.current_generation()
+        view_generation = view_count_buffer.current_generation()
+
+        with self._lock:
+            return (not self._is_built or self._generation != generation or self._view_generation != view_generation)
+
+    def build(self) -> bool:
+
+        """
+
+        Bring the stored bodies up to date with the database, if they are stale.
+
+        Returns:
+        bool: Whether anything was built
+
+        """
+
+        with self._build_lock:
+            if(not self.is_stale()):
+                return False
+
+            start = time.perf_counter()
+
+            ## Read before the database, so a write that lands during the build leaves the store stale instead of hiding it
+            generation = blog_post_cache.current_generation()
+            view_generation = view_count_buffer.current_generation()
+
+            with self._lock:
+                is_full = (not self._is_built or self._generation != generation)
+                previous_bodies = self._bodies
+
+            with get_read_session() as db:
+                if(is_full):
+                    fragments:typing.Dict[bool, typing.Dict[schemaUUID, bytes]] = {False: {}, True: {}}
+                    view_counts:typing.Dict[schemaUUID, int] = {}
+
+                    db_blog_posts = func_get_all_blog_posts(db)
+
+                    for db_blog_post in db_blog_posts:
+                        self._encode_post(fragments, view_counts, db_blog_post)
+
+                    order = [db_blog_post.id for db_blog_post in db_blog_posts]
+
+                else:
+                    fragments = {False: dict(self._fragments[False]), True: dict(self._fragments[True])}
+                    view_counts = dict(self._view_counts)
+                    order = self._order
+
+                    changed_ids = [blog_post_id for blog_post_id, view_count in db.execute(select(BlogPostModel.id, BlogPostModel.view_count)).all()
+                                   if blog_post_id in view_counts and view_counts[blog_post_id] != (view_count or 0)]
+
+                    if(changed_ids):
+                        for db_blog_post in db.query(BlogPostModel).filter(BlogPostModel.id.in_(changed_ids)).all():
+                            self._encode_post(fragments, view_counts, db_blog_post)
+
+            bodies:typing.Dict[typing.Tuple[bool, typing.Optional[int]], StoredBody] = {}
+
+            for summary_only in (False, True):
+                for limit in self.limits:
+                    ids = order if limit is None else order[:limit]
+                    body = b"[" + b",".join(fragments[summary_only][blog_post_id] for blog_post_id in ids) + b"]"
+
+                    if(len(body) > self.max_body_size):
+                        continue
+
+                    key = (summary_only, limit)
+                    previous = previous_bodies.get(key)
+
+                    if(previous is not None and previous[0]["identity"] == body):
+                        bodies[key] = (previous[0], generation, view_generation)
+
+                    else:
+                        bodies[key] = (encode_variants(body), generation, view_generation)
+
+            with self._lock:
+                self._fragments = fragments
+                self._view_counts = view_counts
+                self._order = order
+                self._bodies = bodies
+                self._generation = generation
+                self._view_generation = view_generation
+                self._is_built = True
+
+            kind = "full" if is_full else "views"
+            metrics.inc("response_store_builds_total", {"kind": kind})
+            metrics.observe("response_store_build_duration_seconds", time.perf_counter() - start, {"kind": kind})
+
+            return True
+
+    def get(self, summary_only:bool, limit:typing.Optional[int] = None) -> typing.Optional[StoredBody]:
+
+        """
+
+        Get a stored list body without blocking, waking the builder if it is stale.
+
+        Args:
+        summary_only (bool): Whether to list BlogPostSummary objects instead of full posts
+        limit (int): The number of posts to list, or None for all of them
+
+        Returns:
+        typing.Optional[StoredBody]: The body and the generations it was built from, or None if the limit is not stored, nothing was built yet or the body is too large
+
+        """
+
+        if(limit not in self.limits):
+            return None
+
+        with self._lock:
+            stored = self._bodies.get((summary_only, limit))
+
+        if(self._thread is not None and self.is_stale()):
+            self._wake_event.set()
+
+        return stored
+
+    def schedule(self) -> None:
+
+        """
+
+        Wake the builder, after something changed that it should pick up without waiting for a request.
+
+        """
+
+        self._wake_event.set()
+
+    def _run(self) -> None:
+
+        while(not self._stop_event.is_set()):
+            try:
+                self.build()
+
+            except Exception as e:
+                print(f"Error building stored responses: {e}")
+
+            self._wake_event.wait(self.check_interval)
+            self._wake_event.clear()
+
+    def start(self) -> None:
+
+        """
+
+        Start the background builder thread, which builds the bodies right away.
+
+        """
+
+        if(self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="response-store-builder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+
+        """
+
+        Stop the background builder thread.
+
+        """
+
+        self._stop_event.set()
+        self._wake_event.set()
+
+        if(self._thread is not None):
+            self._thread.join(timeout=30)
+            self._thread = None
+
+response_store = ResponseStore(limits=RESPONSE_STORE_LIMITS, max_body_size=RESPONSE_STORE_MAX_BODY_SIZE, check_interval=RESPONSE_STORE_CHECK_INTERVAL)
+
+def normalize_list_limit(limit:int) -> int:
+
+    """
+
+    Clamp the limit of a list endpoint, so clients cannot ask for arbitrarily large pages or fill the caches with one entry per limit.
+
+    Args:
+    limit (int): The requested number of posts
+
+    Returns:
+    int: The limit, between 1 and ALL_BLOGS_PAGE_SIZE
+
+    """
+
+    return min(max(limit, 1), ALL_BLOGS_PAGE_SIZE)
+
+def stream_blog_posts(summary_only:bool, page_size:int) -> typing.Iterator[bytes]:
+
+    """
+
+    Stream every blog post as a JSON array, reading one keyset page at a time, for when the response store has no body.
+
+    Each page uses its own short-lived session so the stream never holds a read transaction open.
+
+    Args:
+    summary_only (bool): Whether to stream BlogPostSummary objects instead of full posts
+    page_size (int): The number of blog posts to read per query
+
+    Returns:
+    typing.Iterator[bytes]: The chunks of the JSON array
+
+    """
+
+    read_schema = BlogPostSummary if summary_only else BlogPostRead
+
+    yield b"["
+
+    cursor:typing.Optional[str] = None
+    is_first = True
+
+    while(True):
+        with get_read_session() as db:
+            blog_posts, cursor = func_get_blog_posts_after(db, cursor=cursor, limit=page_size, summary_only=summary_only)
+            blog_post_reads = [func_get_blog_post_read(db_blog_post, read_schema) for db_blog_post in blog_posts]
+
+        if(blog_post_reads):
+            yield (b"" if is_first else b",") + b",".join(blog_post_read.model_dump_json().encode() for blog_post_read in blog_post_reads)
+            is_first = False
+
+        if(cursor is None):
+            break
+
+    yield b"]"
+
+##-----------------------------------------start-of-documents----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def build_sitemap(db_blog_posts:typing.List[BlogPostModel]) -> bytes:
+
+    """
+
+    Build the sitemap for both domains, with each page linking its counterpart on the other domain.
+
+    Args:
+    db_blog_posts (typing.List[BlogPostModel]): The blog posts, newest first
+
+    Returns:
+    bytes: The sitemap XML
+
+    """
+
+    dates = [(db_blog_post.updated_at or db_blog_post.created_at) for db_blog_post in db_blog_posts]
+    site_lastmod = max(dates).strftime("%Y-%m-%d") if dates else datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    pages = [(path, site_lastmod, changefreq, priority) for path, priority, changefreq in SITEMAP_STATIC_PAGES]
+
+    for db_blog_post, date in zip(db_blog_posts, dates):
+        pages.append((f"/blog/{db_blog_post.slug or create_slug(str(db_blog_post.title))}", date.strftime("%Y-%m-%d"), "monthly", "0.6"))
+
+    entries = []
+
+    for path, lastmod, changefreq, priority in pages:
+        for domain in SITE_DOMAINS:
+            alternates = "\n".join(
+                f'    <xhtml:link rel="alternate" hreflang="x-default" href="{xml_escape(alternate + path)}"/>'
+                for alternate in SITE_DOMAINS if alternate != domain
+            )
+
+            entries.append(
+                f"  <url>\n"
+                f"    <loc>{xml_escape(domain + path)}</loc>\n"
+                f"    <lastmod>{lastmod}</lastmod>\n"
+                f"    <changefreq>{changefreq}</changefreq>\n"
+                f"    <priority>{priority}</priority>\n"
+                f"{alternates}\n"
+                f"  </url>"
+            )
+
+    entries_xml = "\n".join(entries)
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
+        f"{entries_xml}\n"
+        "</urlset>"
+    ).encode()
+
+def build_feed(db_blog_posts:typing.List[BlogPostModel]) -> bytes:
+
+    """
+
+    Build the RSS 2.0 feed of the most recent blog posts.
+
+    Args:
+    db_blog_posts (typing.List[BlogPostModel]): The blog posts, newest first
+
+    Returns:
+    bytes: The feed XML
+
+    """
+
+    site_url = SITE_DOMAINS[0]
+    items = []
+
+    for db_blog_post in db_blog_posts[:FEED_ITEM_LIMIT]:
+        link = xml_escape(f"{site_url}/blog/{db_blog_post.slug or create_slug(str(db_blog_post.title))}")
+        published = format_datetime(db_blog_post.created_at.replace(tzinfo=timezone.utc), usegmt=True) # type: ignore
+
+        items.append(
+            "    <item>\n"
+            f"      <title>{xml_escape(str(db_blog_post.title))}</title>\n"
+            f"      <link>{link}</link>\n"
+            f'      <guid isPermaLink="false">{db_blog_post.id}</guid>\n'
+            f"      <pubDate>{published}</pubDate>\n"
+            f"      <dc:creator>{xml_escape(str(db_blog_post.author))}</dc:creator>\n"
+            f"      <description>{xml_escape(str(db_blog_post.excerpt or ''))}</description>\n"
+            "    </item>"
+        )
+
+    last_build = max((db_blog_post.updated_at or db_blog_post.created_at) for db_blog_post in db_blog_posts) if db_blog_posts else datetime.now(timezone.utc)
+    items_xml = "\n".join(items)
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+        "  <channel>\n"
+        f"    <title>{xml_escape(FEED_TITLE)}</title>\n"
+        f"    <link>{site_url}/blog</link>\n"
+        f"    <description>{xml_escape(FEED_DESCRIPTION)}</description>\n"
+        f'    <atom:link href="{get_url()}/feed.xml" rel="self" type="application/rss+xml"/>\n'
+        f"    <lastBuildDate>{format_datetime(last_build.replace(tzinfo=timezone.utc), usegmt=True)}</lastBuildDate>\n"
+        f"{items_xml}\n"
+        "  </channel>\n"
+        "</rss>"
+    ).encode()
+
+class DocumentStore:
+
+    """
+
+    Generated documents (the sitemap and the feed), kept as encoded bytes with their compressed variants.
+
+    A document is only rebuilt when the cache generation has moved since it was built, which happens when a post
+    is created, updated or deleted on any worker, or the database is replaced.
+
+    """
+
+    def __init__(self, builders:typing.Dict[str, typing.Callable[[typing.List[BlogPostModel]], bytes]]) -> None:
+
+        self.builders = builders
+
+        self._documents:typing.Dict[str, typing.Tuple[typing.Optional[typing.Tuple[int, int]], typing.Dict[str, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name:str) -> typing.Dict[str, bytes]:
+
+        """
+
+        Get the document, rebuilding it from the blog post metadata if posts changed.
+
+        Args:
+        name (str): The name of the document
+
+        Returns:
+        typing.Dict[str, bytes]: The document keyed by content encoding
+
+        """
+
+        with self._lock:
+            generation = blog_post_cache.current_generation()
+            document = self._documents.get(name)
+
+            if(document is not None and document[0] == generation):
+                return document[1]
+
+            with get_read_session() as db:
+                db_blog_posts = func_get_all_blog_post_summaries(db)
+
+            variants = encode_variants(self.builders[name](db_blog_posts))
+            self._documents[name] = (generation, variants)
+
+            return variants
+
+document_store = DocumentStore(builders={"sitemap": build_sitemap, "feed": build_feed})
+
+##-----------------------------------------start-of-utility-functions----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def encode_cursor(db_blog_post:BlogPostModel) -> str:
+
+    """
+
+    Encode the position of the given blog post into an opaque pagination cursor.
+
+    Args:
+    db_blog_post (BlogPostModel): The last blog post of the current page
+
+    Returns:
+    str: The cursor
+
+    """
+
+    position = [db_blog_post.created_at.isoformat(), db_blog_post.id.hex] # type: ignore
+
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor:str) -> typing.Tuple[datetime, schemaUUID]:
+
+    """
+
+    Decode a pagination cursor created by encode_cursor.
+
+    Args:
+    cursor (str): The cursor
+
+    Returns:
+    datetime: The created_at of the last blog post of the previous page
+    UUID: The ID of the last blog post of the previous page
+
+    """
+
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        created_at, blog_post_id = json.loads(base64.urlsafe_b64decode(padded_cursor))
+
+        return datetime.fromisoformat(created_at), schemaUUID(hex=blog_post_id)
+
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def get_blog_post_validators(blog_post_read:BlogPostRead) -> typing.Tuple[str, datetime]:
+
+    """
+
+    Get the HTTP validators of a single blog post.
+
+    The ETag is weak because the body also carries the view count, which every view changes without the post itself changing.
+
+    Args:
+    blog_post_read (BlogPostRead): The blog post
+
+    Returns:
+    str: The weak ETag, derived from the ID and updated_at
+    datetime: The Last-Modified time
+
+    """
+
+    last_modified = blog_post_read.updated_at.replace(tzinfo=timezone.utc)
+    etag = f'W/"{blog_post_read.id.hex}-{int(last_modified.timestamp() * 1_000_000):x}"'
+
+    return etag, last_modified
+
+def get_generation_validators(request:Request, stored:typing.Optional[StoredBody] = None, include_views:bool = True) -> typing.Optional[typing.Tuple[str, datetime]]:
+
+    """
+
+    Get the HTTP validators of a list endpoint, derived from the cache and view generations so no query is needed.
+
+    The ETag is weak, a worker may still serve the previous view counts for a moment after the other one flushed.
+
+    Args:
+    request (Request): The request, whose path and query are part of the ETag
+    stored (typing.Optional[StoredBody]): The stored body about to be sent, whose generations are used instead of the current ones
+    include_views (bool): Whether the body has view counts, bodies without them keep their validators across view flushes
+
+    Returns:
+    typing.Optional[typing.Tuple[str, datetime]]: The weak ETag and Last-Modified time, or None if there is no generation yet
+
+    """
+
+    if(stored is not None):
+        _, generation, view_generation = stored
+
+    else:
+        generation = blog_post_cache.current_generation()
+        view_generation = view_count_buffer.current_generation()
+
+    if(generation is None):
+        return None
+
+    inode, mtime_ns = generation
+    view_inode, view_mtime_ns = (view_generation if include_views else None) or (0, 0)
+    digest = hashlib.sha1(f"{inode}-{mtime_ns}-{view_inode}-{view_mtime_ns}-{request.url.path}?{request.url.query}".encode()).hexdigest()[:32]
+
+    return f'W/"{digest}"', datetime.fromtimestamp(max(mtime_ns, view_mtime_ns) / 1_000_000_000, timezone.utc)
+
+def get_encoded_etag(etag:str, encoding:str) -> str:
+
+    """
+
+    Get the ETag of a compressed representation. A strong ETag promises identical bytes, so every content encoding gets
+    its own by suffixing the encoding. Weak ETags only promise an equivalent representation and are kept as they are.
+
+    Args:
+    etag (str): The ETag of the uncompressed body
+    encoding (str): The content encoding of the body being sent
+
+    Returns:
+    str: The ETag to send
+
+    """
+
+    if(encoding == "identity" or etag.startswith("W/") or not etag.endswith('"')):
+        return etag
+
+    return f'{etag[:-1]}-{encoding}"'
+
+def get_identity_etag(etag:str) -> str:
+
+    """
+
+    Undo get_encoded_etag, so a client that cached a compressed representation can still be answered with a 304.
+
+    Args:
+    etag (str): An ETag from If-None-Match
+
+    Returns:
+    str: The ETag of the uncompressed body
+
+    """
+
+    for encoding in ("br", "gzip"):
+        if(not etag.startswith("W/") and etag.endswith(f'-{encoding}"')):
+            return f'{etag[:-len(encoding) - 2]}"'
+
+    return etag
+
+def is_not_modified(request:Request, etag:str, last_modified:datetime) -> bool:
+
+    """
+
+    Check the conditional headers of the request against the validators. If-None-Match takes precedence over If-Modified-Since
+    and uses the weak comparison, as RFC 9110 requires for GET.
+
+    Args:
+    request (Request): The request
+    etag (str): The current ETag
+    last_modified (datetime): The current Last-Modified time
+
+    Returns:
+    bool: Whether a 304 Not Modified should be returned
+
+    """
+
+    if_none_match = request.headers.get("if-none-match")
+
+    if(if_none_match is not None):
+        candidates = [get_identity_etag(candidate.strip()).removeprefix("W/") for candidate in if_none_match.split(",")]
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+
+    if(if_modified_since is None):
+        return False
+
+    try:
+        return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+
+    except (TypeError, ValueError):
+        return False
+
+def get_validator_headers(validators:typing.Optional[typing.Tuple[str, datetime]], cache_control:str) -> typing.Dict[str, str]:
+
+    """
+
+    Get the ETag, Last-Modified and Cache-Control headers for a response.
+
+    Args:
+    validators (typing.Optional[typing.Tuple[str, datetime]]): The ETag and Last-Modified time, if any
+    cache_control (str): The Cache-Control header value
+
+    Returns:
+    typing.Dict[str, str]: The headers
+
+    """
+
+    headers = {"Cache-Control": cache_control}
+
+    if(validators is not None):
+        etag, last_modified = validators
+        headers["ETag"] = etag
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    return headers
+
+def compress_body(body:bytes, encoding:str, level:int) -> bytes:
+
+    """
+
+    Compress a body with one content encoding.
+
+    Args:
+    body (bytes): The uncompressed body
+    encoding (str): "gzip" or "br"
+    level (int): The gzip level or brotli quality
+
+    Returns:
+    bytes: The compressed body
+
+    """
+
+    if(encoding == "br"):
+        return brotli.compress(body, quality=level)
+
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+async def compress_chunks(chunks:typing.AsyncIterator[bytes], encoding:str, level:int) -> typing.AsyncIterator[bytes]:
+
+    """
+
+    Compress a streamed body chunk by chunk, flushing after every chunk so the client gets each one as it is produced.
+
+    Args:
+    chunks (typing.AsyncIterator[bytes]): The uncompressed chunks
+    encoding (str): "gzip" or "br"
+    level (int): The gzip level or brotli quality
+
+    Returns:
+    typing.AsyncIterator[bytes]: The compressed chunks
+
+    """
+
+    if(encoding == "br"):
+        brotli_compressor = brotli.Compressor(quality=level)
+
+        def compress(chunk:bytes) -> bytes:
+            return brotli_compressor.process(chunk) + brotli_compressor.flush()
+
+        finish = brotli_compressor.finish
+
+    else:
+        ## wbits 31 writes the gzip header and trailer, with a zero mtime like compress_body
+        gzip_compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+        def compress(chunk:bytes) -> bytes:
+            return gzip_compressor.compress(chunk) + gzip_compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        finish = gzip_compressor.flush
+
+    async for chunk in chunks:
+        if(len(chunk) >= COMPRESSION_THREADPOOL_SIZE):
+            yield await run_in_threadpool(compress, chunk)
+
+        elif(chunk):
+            yield compress(chunk)
+
+    yield finish()
+
+def get_available_encodings() -> typing.Tuple[str, ...]:
+
+    """
+
+    Get the content encodings this server can produce.
+
+    Returns:
+    typing.Tuple[str, ...]: The encodings, brotli only if it is installed
+
+    """
+
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def encode_variants(body:bytes) -> typing.Dict[str, bytes]:
+
+    """
+
+    Compress the body with every supported content encoding. Bodies under COMPRESSION_MIN_SIZE are left uncompressed.
+
+    Args:
+    body (bytes): The uncompressed body
+
+    Returns:
+    typing.Dict[str, bytes]: The body keyed by content encoding
+
+    """
+
+    variants = {"identity": body}
+
+    if(len(body) < COMPRESSION_MIN_SIZE):
+        return variants
+
+    variants["gzip"] = compress_body(body, "gzip", COMPRESSION_STORED_GZIP_LEVEL)
+
+    if(brotli is not None):
+        variants["br"] = compress_body(body, "br", COMPRESSION_STORED_BROTLI_QUALITY)
+
+    return variants
+
+def get_preferred_encoding(accept_encoding:str, available:typing.Iterable[str]) -> str:
+
+    """
+
+    Pick the content encoding to send, preferring brotli over gzip.
+
+    Args:
+    accept_encoding (str): The Accept-Encoding header of the request
+    available (typing.Iterable[str]): The encodings the body is available in
+
+    Returns:
+    str: The chosen encoding, "identity" if nothing better is accepted
+
+    """
+
+    accepted = set()
+
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+
+        if(params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000")):
+            continue
+
+        accepted.add(coding.strip())
+
+    for encoding in ("br", "gzip"):
+        if(encoding in available and (encoding in accepted or "*" in accepted)):
+            return encoding
+
+    return "identity"
+
+def get_stored_response(request:Request, variants:typing.Dict[str, bytes], headers:typing.Dict[str, str], media_type:str = "application/json") -> Response:
+
+    """
+
+    Build a raw response from pre-encoded variants, negotiated against the Accept-Encoding header.
+
+    Args:
+    request (Request): The request
+    variants (typing.Dict[str, bytes]): The body keyed by content encoding
+    headers (typing.Dict[str, str]): Additional response headers
+    media_type (str): The media type of the body
+
+    Returns:
+    Response: The response
+
+    """
+
+    encoding = get_preferred_encoding(request.headers.get("accept-encoding", ""), variants)
+    response_headers = {**headers, "Vary": "Accept-Encoding"}
+
+    if(encoding != "identity"):
+        response_headers["Content-Encoding"] = encoding
+
+        if("ETag" in response_headers):
+            response_headers["ETag"] = get_encoded_etag(response_headers["ETag"], encoding)
+
+    return Response(content=variants[encoding], media_type=media_type, headers=response_headers)
+
+def create_match_query(query:str) -> str:
+
+    """
+
+    Turn free text into a safe FTS5 MATCH expression. Every term is quoted so user input cannot use the query syntax,
+    and the last term matches as a prefix so results show up while typing.
+
+    Args:
+    query (str): The search terms
+
+    Returns:
+    str: The MATCH expression, empty if there are no terms
+
+    """
+
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+
+    if(not terms):
+        return ""
+
+    terms[-1] += "*"
+
+    return " ".join(terms)
+
+def get_url() -> str:
+    if(ENVIRONMENT == "development"):
+        return "http://api.localhost:5000"
+    
+    return "https://api.kadenbilyeu.com"
+
+##-----------------------------------------start-of-admission----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class SharedRateLimiter:
+
+    """
+
+    Token buckets kept in a memory-mapped file, so both uvicorn workers draw from the same budget for a client.
+
+    The file is a row of counters followed by a fixed table of buckets, found by hashing the key and probing a few slots.
+    When the probed slots all belong to other keys, the least recently used one is taken over, which only ever hands a client a fresh, full bucket.
+    An flock on the file serialises the workers, and a thread lock the threads of one worker, since they share the flock.
+
+    """
+
+    COUNTERS = ("admitted", "rate_limited", "shed")
+    HEADER = struct.Struct("<" + "Q" * 8)
+    SLOT = struct.Struct("<Qdd")
+    PROBES = 8
+
+    def __init__(self, path:str, slots:int) -> None:
+
+        self.path = path
+        self.slots = slots
+
+        size = self.HEADER.size + self.SLOT.size * slots
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        if(os.fstat(self._fd).st_size < size):
+            os.ftruncate(self._fd, size)
+
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _locked(self) -> typing.Iterator[None]:
+
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+            try:
+                yield
+
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _count(self, name:str) -> None:
+
+        ## Caller must hold the lock
+        offset = self.COUNTERS.index(name) * 8
+        struct.pack_into("<Q", self._map, offset, struct.unpack_from("<Q", self._map, offset)[0] + 1)
+
+    def _find(self, key_hash:int, now:float, rate:float, burst:float) -> typing.Tuple[int, float]:
+
+        ## Caller must hold the lock
+        oldest_offset = None
+        oldest_updated = float("inf")
+
+        for probe in range(self.PROBES):
+            offset = self.HEADER.size + ((key_hash + probe) % self.slots) * self.SLOT.size
+            slot_hash, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+
+            if(slot_hash == key_hash):
+                return offset, min(burst, tokens + max(0.0, now - updated) * rate)
+
+            if(slot_hash == 0):
+                return offset, burst
+
+            if(updated < oldest_updated):
+                oldest_offset, oldest_updated = offset, updated
+
+        return oldest_offset, burst # type: ignore
+
+    def take(self, buckets:typing.List[typing.Tuple[str, float, float]]) -> float:
+
+        """
+
+        Take a token from every bucket, or from none of them if any is empty.
+
+        Args:
+        buckets (typing.List[typing.Tuple[str, float, float]]): The key, tokens added per second and capacity of each bucket
+
+        Returns:
+        float: 0 if the request may go on, otherwise the seconds until it would be
+
+        """
+
+        now = time.time()
+        wait = 0.0
+        slots = []
+
+        with self._locked():
+            for key, rate, burst in buckets:
+                ## 0 marks an empty slot
+                key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+                offset, tokens = self._find(key_hash, now, rate, burst)
+
+                if(tokens < 1):
+                    wait = max(wait, (1 - tokens) / rate)
+
+                slots.append((offset, key_hash, tokens))
+
+            for offset, key_hash, tokens in slots:
+                self.SLOT.pack_into(self._map, offset, key_hash, tokens - 1 if wait == 0 else tokens, now)
+
+            if(wait > 0):
+                self._count("rate_limited")
+
+        return wait
+
+    def admit(self) -> None:
+
+        """
+
+        Count a request that got past both the rate limit and the concurrency limit.
+
+        """
+
+        with self._locked():
+            self._count("admitted")
+
+    def shed(self) -> None:
+
+        """
+
+        Count a request turned away by the concurrency limit.
+
+        """
+
+        with self._locked():
+            self._count("shed")
+
+    def get_stats(self) -> typing.Dict[str, int]:
+
+        """
+
+        Get the counters of every worker together.
+
+        Returns:
+        typing.Dict[str, int]: The number of admitted, rate limited and shed requests
+
+        """
+
+        with self._locked():
+            counters = self.HEADER.unpack_from(self._map, 0)
+
+        return {name: counters[index] for index, name in enumerate(self.COUNTERS)}
+
+class AdmissionLimiter:
+
+    """
+
+    Caps the requests one worker works on at once. Up to max_queued more wait for a slot for at most queue_timeout seconds, the rest are shed straight away.
+
+    """
+
+    def __init__(self, max_in_flight:int, max_queued:int, queue_timeout:float) -> None:
+
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self.queued = 0
+
+        self._semaphore:typing.Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+
+        """
+
+        Wait for a slot.
+
+        Returns:
+        bool: Whether the request got one, if not it must be shed and release() must not be called
+
+        """
+
+        if(self._semaphore is None):
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        if(self._semaphore.locked()):
+            if(self.queued >= self.max_queued):
+                return False
+
+            self.queued += 1
+
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+
+            except asyncio.TimeoutError:
+                return False
+
+            finally:
+                self.queued -= 1
+
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+
+        return True
+
+    def release(self) -> None:
+
+        self.in_flight -= 1
+        self._semaphore.release() # type: ignore
+
+def get_client_ip(request:Request) -> str:
+
+    """
+
+    Get the IP of the client, as Cloudflare saw it if the request came through Cloudflare.
+
+    CF-Connecting-IP is trusted as is, so the origin must only be reachable through Cloudflare or a client can pick its own budget.
+
+    Args:
+    request (Request): The request
+
+    Returns:
+    str: The client IP
+
+    """
+
+    return request.headers.get("cf-connecting-ip") or (request.client.host if request.client else "unknown")
+
+def get_rate_limit_buckets(path:str, client_ip:str) -> typing.List[typing.Tuple[str, float, float]]:
+
+    """
+
+    Get the buckets a request draws from: the client's overall budget, and the budget of the first rule its path matches.
+
+    Args:
+    path (str): The request path
+    client_ip (str): The client IP
+
+    Returns:
+    typing.List[typing.Tuple[str, float, float]]: The key, tokens added per second and capacity of each bucket
+
+    """
+
+    buckets = [(f"ip:{client_ip}", RATE_LIMIT_RATE, RATE_LIMIT_BURST)]
+
+    for name, prefix, rate, burst in RATE_LIMIT_RULES:
+        if(path.startswith(prefix)):
+            buckets.append((f"{name}:{client_ip}", rate, burst))
+            break
+
+    return buckets
+
+rate_limiter = SharedRateLimiter(RATE_LIMIT_PATH, RATE_LIMIT_SLOTS)
+admission_limiter = AdmissionLimiter(max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_queued=ADMISSION_MAX_QUEUED, queue_timeout=ADMISSION_QUEUE_TIMEOUT)
+
+##-----------------------------------------start-of-metrics-collection----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def collect_worker_metrics() -> None:
+
+    """
+
+    Sample the counters and sizes this worker keeps elsewhere into the metrics registry, before each snapshot.
+
+    """
+
+    cache_stats = blog_post_cache.get_stats()
+
+    metrics.set("blog_cache_hits_total", cache_stats["hits"])
+    metrics.set("blog_cache_misses_total", cache_stats["misses"])
+    metrics.set("blog_cache_evictions_total", cache_stats["evictions"])
+    metrics.set("blog_cache_invalidations_total", cache_stats["invalidations"])
+    metrics.set("blog_cache_entries", cache_stats["size"])
+    metrics.set("token_cache_entries", len(token_cache))
+    metrics.set("http_requests_queued", admission_limiter.queued)
+    metrics.set("process_cpu_seconds_total", time.process_time())
+    ## Summed over the workers that wrote recently, so the total is the number of live workers
+    metrics.set("process_workers", 1)
+
+def collect_shared_metrics(values:typing.Dict[MetricKey, float]) -> None:
+
+    """
+
+    Add the metrics every worker already shares, which would be counted twice if each worker reported them.
+
+    Args:
+    values (typing.Dict[MetricKey, float]): The added up worker values, updated in place
+
+    """
+
+    rate_limit_stats = rate_limiter.get_stats()
+
+    values[("rate_limit_admitted_total", ())] = rate_limit_stats["admitted"]
+    values[("rate_limit_limited_total", ())] = rate_limit_stats["rate_limited"]
+    values[("admission_shed_total", ())] = rate_limit_stats["shed"]
+    values[("view_count_pending", ())] = view_count_buffer.pending_total
+
+    with JobsSessionLocal() as db:
+        rows = db.execute(
+            select(BackupJobModel.kind, func.max(BackupJobModel.finished_at))
+            .where(BackupJobModel.status == "succeeded")
+            .group_by(BackupJobModel.kind)
+        ).all()
+
+    for kind, finished_at in rows:
+        values[("backup_last_success_timestamp_seconds", (("kind", kind),))] = finished_at.replace(tzinfo=timezone.utc).timestamp()
+
+route_templates:typing.Dict[typing.Callable, str] = {}
+
+def get_route_template(request:Request) -> str:
+
+    """
+
+    Get the path template of the route that handled the request, so the route label does not grow with every post ID.
+
+    Args:
+    request (Request): The request, after it went through the router
+
+    Returns:
+    str: The path template, or "unmatched" for requests no route handled
+
+    """
+
+    endpoint = request.scope.get("endpoint")
+
+    if(not route_templates):
+        for route in request.app.routes:
+            route_templates.setdefault(getattr(route, "endpoint", None), getattr(route, "path", "unmatched"))
+
+    return route_templates.get(endpoint, "unmatched") if endpoint is not None else "unmatched"
+
+metrics.add_collector(collect_worker_metrics)
+
+##-----------------------------------------start-of-main----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+app = FastAPI()
+
+@app.on_event("startup")
+async def startup_event():
+    maintenance.start()
+    view_count_buffer.start()
+    scheduler_leader.start()
+    response_store.start()
+    metrics.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    scheduler_leader.stop()
+    view_count_buffer.stop()
+    response_store.stop()
+    maintenance.stop()
+    metrics.stop()
+
+##-----------------------------------------start-of-middleware----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def finish_after_body(response:Response, finish:typing.Callable[[], None]) -> None:
+
+    """
+
+    Call finish once the response body was sent or the client went away, rather than when call_next returned the headers.
+
+    Streamed bodies are produced while the response is being sent, long after call_next returned.
+
+    Args:
+    response (Response): The response returned by call_next
+    finish (typing.Callable[[], None]): Called exactly once, when the body is done
+
+    """
+
+    body_iterator = response.body_iterator # type: ignore
+
+    async def send_body() -> typing.AsyncIterator[bytes]:
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+
+        finally:
+            finish()
+
+    response.body_iterator = send_body() # type: ignore
+
+## Added first so it runs innermost, compression counts against admission and rejections go out as they are
+@app.middleware("http")
+@traced_middleware("compression")
+async def compression_middleware(request:Request, call_next):
+    response = await call_next(request)
+
+    if(response.status_code < 200 or response.status_code in (204, 304) or "content-encoding" in response.headers):
+        return response
+
+    ## Stored responses were already negotiated against their pre-compressed variants
+    if("accept-encoding" in response.headers.get("vary", "").lower()):
+        return response
+
+    if(not response.headers.get("content-type", "").startswith(COMPRESSIBLE_MEDIA_TYPES)):
+        return response
+
+    ## Streamed responses have no length up front, they are compressed as they go instead of being buffered
+    if("content-length" not in response.headers):
+        response.headers.add_vary_header("Accept-Encoding")
+        encoding = get_preferred_encoding(request.headers.get("accept-encoding", ""), get_available_encodings())
+
+        if(encoding != "identity"):
+            level = COMPRESSION_BROTLI_QUALITY if encoding == "br" else COMPRESSION_GZIP_LEVEL
+            response.headers["Content-Encoding"] = encoding
+            response.body_iterator = compress_chunks(response.body_iterator, encoding, level)
+
+            if("etag" in response.headers):
+                response.headers["ETag"] = get_encoded_etag(response.headers["etag"], encoding)
+
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+
+    if(len(body) >= COMPRESSION_MIN_SIZE):
+        response.headers.add_vary_header("Accept-Encoding")
+        encoding = get_preferred_encoding(request.headers.get("accept-encoding", ""), get_available_encodings())
+
+        if(encoding != "identity"):
+            level = COMPRESSION_BROTLI_QUALITY if encoding == "br" else COMPRESSION_GZIP_LEVEL
+
+            if(len(body) >= COMPRESSION_THREADPOOL_SIZE):
+                body = await run_in_threadpool(compress_body, body, encoding, level)
+
+            else:
+                body = compress_body(body, encoding, level)
+
+            response.headers["Content-Encoding"] = encoding
+            response.headers["Content-Length"] = str(len(body))
+
+            if("etag" in response.headers):
+                response.headers["ETag"] = get_encoded_etag(response.headers["etag"], encoding)
+
+    async def send_body() -> typing.AsyncIterator[bytes]:
+        yield body
+
+    response.body_iterator = send_body()
+
+    return response
+
+@app.middleware("http")
+@traced_middleware("maintenance")
+async def maintenance_middleware(request:Request, call_next):
+    if(maintenance.active):
+        return JSONResponse(status_code=503, content={"message": "Server is in maintenance mode"})
+    
+    response = await call_next(request)
+    
+    return response
+
+## Added after maintenance_middleware so it runs first, and inside CORS so rejections still carry the CORS headers
+@app.middleware("http")
+@traced_middleware("admission")
+async def admission_middleware(request:Request, call_next):
+    if(request.method == "OPTIONS"):
+        return await call_next(request)
 
-    Update the blog post in the database with the given ID.
+    retry_after = rate_limiter.take(get_rate_limit_buckets(request.url.path, get_client_ip(request)))
 
-    Args:
-    db (Session): The SQLAlchemy session
-    blog_post_id (UUID): The ID of the blog post
-    blog_post (schemas.BlogPostUpdate): The blog post to update
+    if(retry_after > 0):
+        return JSONResponse(status_code=429, content={"message": "Too many requests"}, headers={"Retry-After": str(math.ceil(retry_after))})
 
-    Returns:
-    BlogPostModel: The updated blog post
+    if(not await admission_limiter.acquire()):
+        rate_limiter.shed()
+        return JSONResponse(status_code=503, content={"message": "Server is overloaded"}, headers={"Retry-After": "1"})
 
-    """
+    rate_limiter.admit()
 
-    db_blog_post = db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
+    try:
+        response = await call_next(request)
 
-    if(db_blog_post):
-        for key, value in blog_post.model_dump().items():
-            setattr(db_blog_post, key, value)
-        db.commit()
-        db.refresh(db_blog_post)
+    except BaseException:
+        admission_limiter.release()
+        raise
 
-    return db_blog_post
+    ## The slot is held until the body is sent, a streamed archive is most of the work of its request
+    finish_after_body(response, admission_limiter.release)
 
-def func_delete_blog_post(db:Session, blog_post_id:schemaUUID) -> BlogPostModel:
+    return response
 
-    """
+## Added last so it runs outermost, its latency covers the other middleware and their rejections are counted
+@app.middleware("http")
+@traced_middleware("metrics")
+async def metrics_middleware(request:Request, call_next):
+    metrics.inc("http_requests_in_flight")
+    start = time.perf_counter()
 
-    Delete the blog post in the database with the given ID.
+    def finish(status_code:int) -> None:
+        labels = {"method": request.method, "route": get_route_template(request)}
 
-    Args:
-    db (Session): The SQLAlchemy session
-    blog_post_id (UUID): The ID of the blog post
-    
-    Returns:
-    BlogPostModel: The deleted blog post
+        metrics.inc("http_requests_in_flight", amount=-1)
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start, labels)
+        metrics.inc("http_requests_total", {**labels, "status": str(status_code)})
 
-    """
+    try:
+        response = await call_next(request)
 
-    db_blog_post = db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
-    if(db_blog_post):
-        db.delete(db_blog_post)
-        db.commit()
-    return db_blog_post
+    except BaseException:
+        finish(500)
+        raise
 
-def func_increment_view_count(db:Session, blog_post_id:schemaUUID):
+    ## Measured up to the end of the body, which for a streamed list is most of the request
+    finish_after_body(response, lambda: finish(response.status_code))
 
-    """
-    
-    Increment the view count of the blog post with the given ID.
+    return response
 
-    Args:
-    db (Session): The SQLAlchemy session
-    blog_post_id (UUID): The ID of the blog post 
+async def tracing_middleware(request:Request, call_next):
+    trace = RequestTrace(f"{request.method} {request.url.path}", {"http.method": request.method, "http.target": request.url.path, "client.address": get_client_ip(request)})
+    trace_token = current_trace.set(trace)
+    span_token = current_span_id.set(trace.root["spanId"])
 
-    Returns:
-    None
+    try:
+        response = await call_next(request)
+        trace.root["attributes"]["http.status_code"] = response.status_code
+        response.headers["X-Trace-Id"] = trace.trace_id
 
-    """
+        return response
 
-    db_blog_post = db.query(BlogPostModel).filter(BlogPostModel.id == blog_post_id).first()
-    if(db_blog_post):
-        db_blog_post.view_count = db_blog_post.view_count + 1 # type: ignore
-        db.commit()
+    except Exception as e:
+        trace.root["error"] = repr(e)
+        raise
 
-##-----------------------------------------start-of-utility-functions----------------------------------------------------------------------------------------------------------------------------------------------------------
+    finally:
+        current_span_id.reset(span_token)
+        current_trace.reset(trace_token)
 
-def get_url() -> str:
-    if(ENVIRONMENT == "development"):
-        return "http://api.localhost:5000"
-    
-    return "https://api.kadenbilyeu.com"
+        route = get_route_template(request)
+        trace.root["end"] = time.time_ns()
+        trace.root["name"] = f"{request.method} {route}"
+        trace.root["attributes"]["http.route"] = route
 
-##-----------------------------------------start-of-main----------------------------------------------------------------------------------------------------------------------------------------------------------
+        is_slow = trace.duration >= TRACE_SLOW_THRESHOLD
 
-app = FastAPI()
+        if(is_slow):
+            print(f"Slow request {request.method} {request.url.path} took {trace.duration * 1000:.1f} ms, trace {trace.trace_id}")
 
-@app.on_event("startup")
-async def startup_event():
-    start_scheduler()
+        if(is_slow or random.random() < TRACE_SAMPLE_RATE):
+            try:
+                await run_in_threadpool(write_trace, trace)
 
-##-----------------------------------------start-of-middleware----------------------------------------------------------------------------------------------------------------------------------------------------------
+            except Exception as e:
+                print(f"Error writing trace: {e}")
 
-@app.middleware("http")
-async def maintenance_middleware(request:Request, call_next):
-    global maintenance_mode
-    if(maintenance_mode):
-        return JSONResponse(status_code=503, content={"message": "Server is in maintenance mode"})
-    
-    response = await call_next(request)
-    
-    return response
+## Added after metrics_middleware so its root span covers every other middleware, and not at all unless tracing is on
+if(TRACING_ENABLED):
+    app.middleware("http")(tracing_middleware)
 
 ## CORS setup
 origins = [
@@ -998,7 +6391,7 @@ async def api_home():
     return {"message": "API is running"}
 
 @app.post("/login", response_model=LoginToken)
-def login(data:LoginModel) -> typing.Dict[str, str]:
+def login(data:LoginModel, request:Request) -> typing.Dict[str, str]:
     
     """
     
@@ -1006,15 +6399,44 @@ def login(data:LoginModel) -> typing.Dict[str, str]:
 
     Args:
     data (LoginModel): The data required to login
+    request (Request): The request, for the client IP
 
     Returns:
     typing.Dict[str, str]: The access token and token type
 
     """
 
+    ip_key = f"ip:{get_client_ip(request)}"
+    retry_after = login_throttle.retry_after([ip_key])
+
+    if(retry_after > 0):
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many failed logins", headers={"Retry-After": str(retry_after)})
+
+    ## The TOTP check is an HMAC, so a wrong code is turned away before bcrypt runs and only counts against the IP
+    try:
+        verify_totp(data.totp)
+
+    except HTTPException:
+        login_throttle.fail([ip_key])
+        raise
+
+    ## Only attempts that knew the TOTP code count against the username, so guessing at it cannot lock the admin out
+    user_key = f"user:{data.username[:128]}"
+    retry_after = login_throttle.retry_after([user_key])
+
+    if(retry_after > 0):
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many failed logins", headers={"Retry-After": str(retry_after)})
+
     credentials = HTTPBasicCredentials(username=data.username, password=data.password)
-    verify_credentials(credentials)
-    verify_totp(data.totp)
+
+    try:
+        verify_credentials(credentials)
+
+    except HTTPException:
+        login_throttle.fail([ip_key, user_key])
+        raise
+
+    login_throttle.succeed([ip_key, user_key])
 
     access_token_expires = timedelta(minutes=TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -1094,24 +6516,57 @@ def create_blog_post(blog_post:BlogPostCreate, db:Session = Depends(get_db), cur
 
     return func_create_blog_post(db=db, db_blog_post=db_blog_post)
 
-@app.get("/blog", response_model=list[BlogPostRead])
-def read_blog_posts(skip:int = 0, limit:int = 10, db:Session = Depends(get_db)):
+@app.get("/blog", response_model=typing.Union[list[BlogPostRead], BlogPostPage])
+def read_blog_posts(skip:int = 0, limit:int = 10, cursor:typing.Optional[str] = None, db:Session = Depends(get_read_db)):
     
     """
     
-    Read blog posts from the database
+    Read blog posts from the database, newest first
+
+    Passing cursor (empty for the first page) switches to keyset pagination and returns a BlogPostPage.
 
     Args:
     skip (int): The number of posts to skip
     limit (int): The number of posts to return
+    cursor (str): The next_cursor of the previous page
     db (Session): The database session
 
     """
 
-    return func_get_blog_posts(db, skip=skip, limit=limit)
+    if(cursor is not None):
+        blog_posts, next_cursor = func_get_blog_posts_after(db, cursor=cursor, limit=limit)
+        return BlogPostPage(items=[func_get_blog_post_read(db_blog_post) for db_blog_post in blog_posts], next_cursor=next_cursor)
+
+    return [func_get_blog_post_read(db_blog_post) for db_blog_post in func_get_blog_posts(db, skip=skip, limit=limit)]
+
+@app.get("/blog/search", response_model=BlogPostSearchResults)
+def search_blog_posts(q:str, skip:int = 0, limit:int = 10, db:Session = Depends(get_read_db)) -> BlogPostSearchResults:
+
+    """
+
+    Search the blog posts by title, content and author
+
+    Args:
+    q (str): The search terms
+    skip (int): The number of results to skip
+    limit (int): The number of results to return
+    db (Session): The database session
+
+    Returns:
+    BlogPostSearchResults: The matching blog posts, best match first
+
+    """
+
+    try:
+        results, total = func_search_blog_posts(db, query=q, skip=max(skip, 0), limit=max(min(limit, 50), 1))
+
+    except OperationalError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Search is unavailable")
+
+    return BlogPostSearchResults(query=q, total=total, items=[func_apply_pending_views(result) for result in results])
 
 @app.get("/blog/{blog_post_id}", response_model=BlogPostRead)
-def read_blog_post(blog_post_id:schemaUUID, db:Session = Depends(get_db), authorization: str = Header(None)) -> BlogPostRead:
+async def read_blog_post(blog_post_id:schemaUUID, request:Request, response:Response, authorization: str = Header(None)) -> BlogPostRead:
 
     """
     
@@ -1119,16 +6574,17 @@ def read_blog_post(blog_post_id:schemaUUID, db:Session = Depends(get_db), author
 
     Args:
     blog_post_id (UUID): The ID of the blog post
-    db (Session): The database session
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
     
     Returns:
     BlogPostRead: The blog post
 
     """
 
-    db_blog_post = func_get_blog_post(db, blog_post_id=blog_post_id)
+    blog_post_read = await func_get_cached_blog_post(blog_post_id=blog_post_id)
 
-    if(db_blog_post is None):
+    if(blog_post_read is None):
         raise HTTPException(status_code=404, detail="Blog post not found")
     
     ## I'm the only one who can login and there's no point and logging at my own views
@@ -1142,12 +6598,21 @@ def read_blog_post(blog_post_id:schemaUUID, db:Session = Depends(get_db), author
             pass
 
     if(not is_logged_in):
-        func_increment_view_count(db, db_blog_post.id)  # type: ignore
+        func_increment_view_count(blog_post_read.id)
 
-    return db_blog_post
+    validators = get_blog_post_validators(blog_post_read)
+    headers = get_validator_headers(validators, POST_CACHE_CONTROL)
+
+    ## A revalidated view is still a view, so this comes after the increment
+    if(is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+
+    return func_apply_pending_views(blog_post_read)
 
 @app.get("/blog/slug/{slug}", response_model=BlogPostRead)
-def read_blog_post_by_slug(slug:str, db:Session = Depends(get_db), authorization: str = Header(None)) -> BlogPostRead:
+async def read_blog_post_by_slug(slug:str, request:Request, response:Response, authorization: str = Header(None)) -> BlogPostRead:
 
     """
     
@@ -1155,16 +6620,17 @@ def read_blog_post_by_slug(slug:str, db:Session = Depends(get_db), authorization
 
     Args:
     slug (str): The slug of the blog post
-    db (Session): The database session
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
     
     Returns:
     BlogPostRead: The blog post
 
     """
 
-    db_blog_post = func_get_blog_post_by_slug(db, slug=slug)
+    blog_post_read = await func_get_cached_blog_post_by_slug(slug=slug)
 
-    if(db_blog_post is None):
+    if(blog_post_read is None):
         raise HTTPException(status_code=404, detail="Blog post not found")
     
     ## I'm the only one who can login and there's no point and logging at my own views
@@ -1178,9 +6644,18 @@ def read_blog_post_by_slug(slug:str, db:Session = Depends(get_db), authorization
             pass
 
     if(not is_logged_in):
-        func_increment_view_count(db, db_blog_post.id)  # type: ignore
+        func_increment_view_count(blog_post_read.id)
 
-    return db_blog_post
+    validators = get_blog_post_validators(blog_post_read)
+    headers = get_validator_headers(validators, POST_CACHE_CONTROL)
+
+    ## A revalidated view is still a view, so this comes after the increment
+    if(is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+
+    return func_apply_pending_views(blog_post_read)
 
 @app.put("/blog/{blog_post_id}", response_model=BlogPostRead)
 def update_blog_post(blog_post_id:schemaUUID, blog_post:BlogPostUpdate, db:Session = Depends(get_db)) -> BlogPostRead:
@@ -1230,52 +6705,285 @@ def delete_blog_post(blog_post_id:schemaUUID, db:Session = Depends(get_db), curr
     
     return db_blog_post
 
-@app.get("/latest-blogs", response_model=list[BlogPostRead])
-def read_latest_blog_posts(limit:int = 5, db:Session = Depends(get_db)):
+@app.get("/latest-blogs", response_model=typing.Union[list[BlogPostRead], BlogPostPage])
+async def read_latest_blog_posts(request:Request, response:Response, limit:int = 5, cursor:typing.Optional[str] = None):
     
     """
 
     Read the latest blog posts
 
+    Passing cursor (empty for the first page) switches to keyset pagination and returns a BlogPostPage.
+
     Args:
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
     limit (int): The number of posts to return
-    db (Session): The database session
+    cursor (str): The next_cursor of the previous page
 
     """
 
-    return func_get_recent_blog_posts(db, skip=0, limit=limit)
+    limit = normalize_list_limit(limit)
+    stored = response_store.get(summary_only=False, limit=limit) if cursor is None else None
+
+    validators = get_generation_validators(request, stored)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+
+    if(stored is not None):
+        return get_stored_response(request, stored[0], headers)
+
+    blog_posts, next_cursor = await func_get_cached_blog_post_page(cursor=cursor, limit=limit)
+    items = [func_apply_pending_views(blog_post_read) for blog_post_read in blog_posts]
+
+    return BlogPostPage(items=items, next_cursor=next_cursor) if cursor is not None else items
 
 @app.get("/blog-count", response_model=int)
-def get_blog_count(db: Session = Depends(get_db)) -> int:
+async def get_blog_count(request:Request, response:Response) -> int:
 
     """
     
     Get the number of blog posts in the database
 
     Args:
-    db (Session): The database session
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
 
     Returns:
     int: The number of blog posts in the database
 
     """
 
-    
-    return db.query(BlogPostModel).count()
+    validators = get_generation_validators(request, include_views=False)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-@app.get("/all-blogs", response_model=list[BlogPostRead])
-def read_all_blog_posts(db:Session = Depends(get_db)):
+    response.headers.update(headers)
+
+    return await func_get_cached_blog_count()
+
+@app.get("/all-blogs", response_model=typing.Union[list[BlogPostRead], BlogPostPage])
+async def read_all_blog_posts(request:Request, response:Response, limit:int = ALL_BLOGS_PAGE_SIZE, cursor:typing.Optional[str] = None):
 
     """
 
-    Read all blog posts from the database
+    Read all blog posts from the database, newest first
+
+    Without a cursor the whole archive is served pre-encoded from the response store, or streamed from the database
+    until the store has it. Passing cursor (empty for the first page) returns a single BlogPostPage instead.
 
     Args:
-    db (Session): The database session
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
+    limit (int): The number of posts per page
+    cursor (str): The next_cursor of the previous page
+
+    """
+
+    limit = normalize_list_limit(limit)
+    stored = response_store.get(summary_only=False) if cursor is None else None
+
+    validators = get_generation_validators(request, stored)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+
+    if(stored is not None):
+        return get_stored_response(request, stored[0], headers)
+
+    if(cursor is None):
+        return StreamingResponse(stream_blog_posts(summary_only=False, page_size=limit), media_type="application/json", headers=headers)
+
+    blog_posts, next_cursor = await func_get_cached_blog_post_page(cursor=cursor, limit=limit)
+
+    return BlogPostPage(items=[func_apply_pending_views(blog_post_read) for blog_post_read in blog_posts], next_cursor=next_cursor)
+
+@app.get("/latest-blog-summaries", response_model=typing.Union[list[BlogPostSummary], BlogPostSummaryPage])
+async def read_latest_blog_summaries(request:Request, response:Response, limit:int = 5, cursor:typing.Optional[str] = None):
+
+    """
+
+    Read the latest blog posts without their content
+
+    Passing cursor (empty for the first page) switches to keyset pagination and returns a BlogPostSummaryPage.
+
+    Args:
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
+    limit (int): The number of posts to return
+    cursor (str): The next_cursor of the previous page
+
+    """
+
+    limit = normalize_list_limit(limit)
+    stored = response_store.get(summary_only=True, limit=limit) if cursor is None else None
+
+    validators = get_generation_validators(request, stored)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+
+    if(stored is not None):
+        return get_stored_response(request, stored[0], headers)
+
+    blog_posts, next_cursor = await func_get_cached_blog_post_page(cursor=cursor, limit=limit, summary_only=True)
+    items = [func_apply_pending_views(blog_post_summary) for blog_post_summary in blog_posts]
+
+    return BlogPostSummaryPage(items=items, next_cursor=next_cursor) if cursor is not None else items
+
+@app.get("/all-blog-summaries", response_model=typing.Union[list[BlogPostSummary], BlogPostSummaryPage])
+async def read_all_blog_summaries(request:Request, response:Response, limit:int = ALL_BLOGS_PAGE_SIZE, cursor:typing.Optional[str] = None):
+
+    """
+
+    Read all blog posts without their content, newest first
+
+    Without a cursor the whole archive is served pre-encoded from the response store, or streamed from the database
+    until the store has it. Passing cursor (empty for the first page) returns a single BlogPostSummaryPage instead.
+
+    Args:
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+    response (Response): The response, given the ETag, Last-Modified and Cache-Control headers
+    limit (int): The number of posts per page
+    cursor (str): The next_cursor of the previous page
+
+    """
+
+    limit = normalize_list_limit(limit)
+    stored = response_store.get(summary_only=True) if cursor is None else None
+
+    validators = get_generation_validators(request, stored)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+
+    if(stored is not None):
+        return get_stored_response(request, stored[0], headers)
+
+    if(cursor is None):
+        return StreamingResponse(stream_blog_posts(summary_only=True, page_size=limit), media_type="application/json", headers=headers)
+
+    blog_posts, next_cursor = await func_get_cached_blog_post_page(cursor=cursor, limit=limit, summary_only=True)
+
+    return BlogPostSummaryPage(items=[func_apply_pending_views(blog_post_summary) for blog_post_summary in blog_posts], next_cursor=next_cursor)
+
+@app.get("/sitemap.xml")
+def read_sitemap(request:Request) -> Response:
+
+    """
+
+    Read the sitemap of both domains, including every blog post
+
+    Args:
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+
+    Returns:
+    Response: The sitemap XML
+
+    """
+
+    validators = get_generation_validators(request, include_views=False)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return get_stored_response(request, document_store.get("sitemap"), headers, media_type="application/xml")
+
+@app.get("/feed.xml")
+def read_feed(request:Request) -> Response:
+
+    """
+
+    Read the RSS feed of the latest blog posts
+
+    Args:
+    request (Request): The request, checked for If-None-Match and If-Modified-Since
+
+    Returns:
+    Response: The feed XML
+
+    """
+
+    validators = get_generation_validators(request, include_views=False)
+    headers = get_validator_headers(validators, LIST_CACHE_CONTROL)
+
+    if(validators is not None and is_not_modified(request, *validators)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return get_stored_response(request, document_store.get("feed"), headers, media_type="application/rss+xml")
+
+@app.get("/cache-stats")
+def get_cache_stats(current_user:str = Depends(get_current_active_user)) -> typing.Dict[str, int]:
+
+    """
+
+    Get the read cache counters of the worker that serves the request
+
+    Args:
+    current_user (str): The current user
+
+    Returns:
+    typing.Dict[str, int]: The cache counters
+
+    """
+
+    return blog_post_cache.get_stats()
+
+@app.get("/admission-stats")
+def get_admission_stats(current_user:str = Depends(get_current_active_user)) -> typing.Dict[str, int]:
+
+    """
+
+    Get the admitted, rate limited and shed request counters of every worker, and the in-flight and queued requests of the worker that serves the request
+
+    Args:
+    current_user (str): The current user
+
+    Returns:
+    typing.Dict[str, int]: The admission counters
+
+    """
+
+    return {
+        **rate_limiter.get_stats(),
+        "in_flight": admission_limiter.in_flight,
+        "queued": admission_limiter.queued
+    }
+
+@app.get("/metrics")
+def get_metrics(scraper:str = Depends(get_metrics_scraper)) -> Response:
+
+    """
+
+    Get the metrics of every worker, added up, in the Prometheus text format
+
+    Args:
+    scraper (str): The scraper or admin making the request
+
+    Returns:
+    Response: The exposition
 
     """
 
-    return func_get_all_blog_posts(db)
+    values, histograms = metrics.collect()
+    collect_shared_metrics(values)
+
+    return Response(content=metrics.render(values, histograms), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.post("/replace-database")
 @app.post("/replace-database/")
@@ -1298,51 +7006,81 @@ async def upload_backup(file: UploadFile = File(...),current_user:str = Depends(
     """
 
     try:
-        global maintenance_mode
-        with maintenance_lock:
-            maintenance_mode = True
+        ## The upload is already spooled to a temporary file, the restore streams it from there off the event loop
+        await run_in_threadpool(restore_database, file.file, ENCRYPTION_KEY) # type: ignore
 
-        with open("backup.zip.pgp", "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        return {"message": "Database replaced successfully"}
 
-        with open("backup.zip.pgp", "rb") as f:
-            decrypted_file = decrypt_file("backup.zip.pgp", ENCRYPTION_KEY) # type: ignore
+    except HTTPException:
+        raise
 
-        with open(decrypted_file, "rb") as f:
-            decompressed_file = decompress_file(decrypted_file, "backup.db")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        replace_sqlite_db(decompressed_file, DATABASE_PATH)
+@app.post('/force-backup', status_code=status.HTTP_202_ACCEPTED)
+def force_backup(current_user:str = Depends(get_current_active_user)) -> typing.Dict[str, typing.Optional[str]]:
 
-        os.remove("backup.zip.pgp")
-        os.remove(decrypted_file)
+    """
 
-        return {"message": "Database replaced successfully"}
+    Force a backup. It runs in the background, poll /jobs/{job_id} for its status
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    Args:
+    current_user (str): The current user
 
-    finally:
-        with maintenance_lock:
-            maintenance_mode = False
+    Returns:
+    typing.Dict[str, typing.Optional[str]]: The result of the operation and the ID of the backup job
+
+    """
 
-@app.post('/force-backup')
-def force_backup(current_user:str = Depends(get_current_active_user), db:Session = Depends(get_db)) -> typing.Dict[str, str]:
+    job, started = backup_jobs.submit("full", "manual")
+
+    return {
+        "message": "Backup started" if started else "Backup already running",
+        "job_id": job["id"] if job else None
+    }
+
+@app.get('/jobs', response_model=typing.List[JobRead])
+def get_jobs(kind:typing.Optional[str] = None, status:typing.Optional[str] = None, limit:int = 50, current_user:str = Depends(get_current_active_user)) -> typing.List[typing.Dict[str, typing.Any]]:
 
     """
 
-    Force a backup
+    Get the backup job history, newest first
 
     Args:
+    kind (typing.Optional[str]): Only jobs of this kind, "full" or "scheduled"
+    status (typing.Optional[str]): Only jobs with this status
+    limit (int): The number of jobs to get
     current_user (str): The current user
 
     Returns:
-    typing.Dict[str, str]: The result of the operation
+    typing.List[typing.Dict[str, typing.Any]]: The jobs
+
+    """
+
+    return backup_jobs.history(kind=kind, status=status, limit=max(1, min(limit, 500)))
+
+@app.get('/jobs/{job_id}', response_model=JobRead)
+def get_job(job_id:str, current_user:str = Depends(get_current_active_user)) -> typing.Dict[str, typing.Any]:
+
+    """
+
+    Get the status, progress and stage timings of a backup job
+
+    Args:
+    job_id (str): The ID of the job
+    current_user (str): The current user
+
+    Returns:
+    typing.Dict[str, typing.Any]: The job
 
     """
 
-    perform_backup()
+    job = backup_jobs.get(job_id)
+
+    if(job is None):
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    return {"message": "Backup started"}
+    return job
 
 @app.options("/{rest_of_path:path}")
 async def any_options(rest_of_path: str):
@@ -0,0 +1,197 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/kadenbilyeu.com) (https://kadenbilyeu.com)
+## Use of this source code is governed by an GNU Affero General Public License v3.0
+## license that can be found in the LICENSE file.
+
+## Rebuilds a SQLite database from incremental backups (BACKUP_MODE=incremental). Pass every backup from the full
+## backup up to the one to restore, in any order, as the emailed .zip.pgp files or already decrypted .zip files:
+## python restore_backup.py --output blog.db incremental_db_*.zip.pgp
+## The passphrase is read from --passphrase, the ENCRYPTION_KEY environment variable or the .env file.
+
+## built-in libraries
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import typing
+import zipfile
+
+## third-party libraries
+from gnupg import GPG
+
+##-------------------start-of-load-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def get_passphrase(passphrase:typing.Optional[str]) -> str:
+
+    if(passphrase):
+        return passphrase
+
+    if(os.environ.get("ENCRYPTION_KEY")):
+        return os.environ["ENCRYPTION_KEY"]
+
+    if(os.path.exists(".env")):
+        with open(".env", "r") as f:
+            for line in f:
+                key, _, value = line.strip().partition("=")
+
+                if(key == "ENCRYPTION_KEY" and value):
+                    return value
+
+    raise SystemExit("No passphrase given, pass --passphrase or set ENCRYPTION_KEY")
+
+def open_archive(path:str, passphrase:str, temp_dir:str) -> zipfile.ZipFile:
+
+    """
+
+    Open a backup archive, decrypting it into temp_dir first if it is a .pgp file.
+
+    Args:
+    path (str): The path to the backup
+    passphrase (str): The passphrase the backup was encrypted with
+    temp_dir (str): Where to put the decrypted archive
+
+    Returns:
+    zipfile.ZipFile: The archive
+
+    """
+
+    if(path.endswith(".pgp")):
+        decrypted_path = os.path.join(temp_dir, os.path.basename(path)[:-len(".pgp")])
+
+        with open(path, "rb") as f:
+            status = GPG().decrypt_file(f, passphrase=passphrase, output=decrypted_path)
+
+        if(not status.ok):
+            raise SystemExit(f"Failed to decrypt {path}: {status.status}")
+
+        path = decrypted_path
+
+    return zipfile.ZipFile(path, "r")
+
+##-------------------start-of-restore-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def restore(archives:typing.List[zipfile.ZipFile], output_path:str, backup_id:typing.Optional[str]) -> typing.Dict[str, typing.Any]:
+
+    """
+
+    Rebuild the database of one backup from the chunks in the given archives.
+
+    Args:
+    archives (typing.List[zipfile.ZipFile]): The base backup and its deltas, in any order
+    output_path (str): Where to write the database
+    backup_id (typing.Optional[str]): The backup to restore, or None for the newest one
+
+    Returns:
+    typing.Dict[str, typing.Any]: The manifest of the restored backup
+
+    """
+
+    manifests:typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    chunk_sources:typing.Dict[str, zipfile.ZipFile] = {}
+
+    for archive in archives:
+        manifest = json.loads(archive.read("manifest.json"))
+
+        if(manifest.get("format") != "sqlite-chunks-1"):
+            raise SystemExit(f"{archive.filename} is not an incremental backup")
+
+        manifests[manifest["backup_id"]] = manifest
+
+        for name in archive.namelist():
+            if(name.startswith("chunks/")):
+                chunk_sources[name[len("chunks/"):]] = archive
+
+    if(backup_id is None):
+        backup_id = max(manifests, key=lambda key: (manifests[key]["base_id"], manifests[key]["sequence"]))
+
+    if(backup_id not in manifests):
+        raise SystemExit(f"Backup {backup_id} is not among the given archives")
+
+    target = manifests[backup_id]
+
+    ## Walk back to the base so a missing delta is named instead of just reported as missing chunks
+    previous_id = target["previous_id"]
+
+    while(previous_id is not None):
+        if(previous_id not in manifests):
+            raise SystemExit(f"Backup {previous_id} is missing, pass every backup from {target['base_id']} up to {backup_id}")
+
+        previous_id = manifests[previous_id]["previous_id"]
+
+    missing = [chunk_hash for chunk_hash in set(target["chunks"]) if chunk_hash not in chunk_sources]
+
+    if(missing):
+        raise SystemExit(f"{len(missing)} chunks of {backup_id} are missing from the given archives")
+
+    digest = hashlib.sha256()
+
+    ## Rebuilt next to the output and only moved there once it passed every check, so a failed restore leaves nothing behind and can be retried
+    fd, temp_path = tempfile.mkstemp(prefix=f"{os.path.basename(output_path)}.", suffix=".tmp", dir=os.path.dirname(os.path.abspath(output_path)))
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk_hash in target["chunks"]:
+                data = chunk_sources[chunk_hash].read(f"chunks/{chunk_hash}")
+
+                if(hashlib.sha256(data).hexdigest() != chunk_hash):
+                    raise SystemExit(f"Chunk {chunk_hash} is corrupt")
+
+                digest.update(data)
+                f.write(data)
+
+        if(digest.hexdigest() != target["sha256"]):
+            raise SystemExit("The rebuilt database does not match the backup checksum")
+
+        connection = sqlite3.connect(temp_path)
+
+        try:
+            result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+
+        finally:
+            connection.close()
+
+        if(result != "ok"):
+            raise SystemExit(f"The rebuilt database failed the integrity check: {result}")
+
+        os.replace(temp_path, output_path)
+
+    except BaseException:
+        if(os.path.exists(temp_path)):
+            os.remove(temp_path)
+
+        raise
+
+    return target
+
+##-------------------start-of-main()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Rebuild a SQLite database from incremental backups")
+    parser.add_argument("archives", nargs="+", help="The full backup and its deltas, .zip.pgp or decrypted .zip")
+    parser.add_argument("--output", required=True, help="Where to write the rebuilt database")
+    parser.add_argument("--backup-id", default=None, help="The backup to restore, defaults to the newest one")
+    parser.add_argument("--passphrase", default=None, help="The backup passphrase, defaults to ENCRYPTION_KEY")
+
+    args = parser.parse_args()
+
+    if(os.path.exists(args.output)):
+        raise SystemExit(f"{args.output} already exists")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        passphrase = get_passphrase(args.passphrase) if any(path.endswith(".pgp") for path in args.archives) else ""
+        archives = [open_archive(path, passphrase, temp_dir) for path in args.archives]
+
+        try:
+            manifest = restore(archives, args.output, args.backup_id)
+
+        finally:
+            for archive in archives:
+                archive.close()
+
+    print(f"Restored backup {manifest['backup_id']} ({manifest['page_count']} pages) to {args.output}")
+
+if(__name__ == "__main__"):
+    main()
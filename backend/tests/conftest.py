@@ -0,0 +1,34 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/kadenbilyeu.com) (https://kadenbilyeu.com)
+## Use of this source code is governed by an GNU Affero General Public License v3.0
+## license that can be found in the LICENSE file.
+
+## Importing main creates the database and its log directories relative to the working directory and reads its settings
+## from the environment, so both are set up here before any test module imports it
+
+## built-in libraries
+import os
+import sys
+import tempfile
+
+TEST_ENV = {
+    "ADMIN_USER": "admin",
+    "ADMIN_PASS_HASH": "$2b$12$MlPMcgDvVCU.s10xcB2fneIjZ/ymgz5O52yH5pshAFF5.bwPq4SMq",
+    "TOTP_SECRET": "JBSWY3DPEHPK3PXP",
+    "ENVIRONMENT": "development",
+    "ACCESS_TOKEN_SECRET": "secret",
+    "REFRESH_TOKEN_SECRET": "secret",
+    "ENCRYPTION_KEY": "password",
+    "SMTP_SERVER": "localhost",
+    "SMTP_PORT": "1",
+    "SMTP_USER": "none",
+    "SMTP_PASSWORD": "none",
+    "FROM_EMAIL": "none",
+    "TO_EMAIL": "none"
+}
+
+for key, value in TEST_ENV.items():
+    os.environ.setdefault(key, value)
+
+os.chdir(tempfile.mkdtemp(prefix="blog-tests-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
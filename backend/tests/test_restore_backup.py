@@ -0,0 +1,140 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/kadenbilyeu.com) (https://kadenbilyeu.com)
+## Use of this source code is governed by an GNU Affero General Public License v3.0
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import contextlib
+import os
+import sqlite3
+import tempfile
+import typing
+import zipfile
+
+## third-party libraries
+import pytest
+
+from sqlalchemy import text
+
+## custom modules
+import main
+import restore_backup
+
+PASSPHRASE = "password"
+
+## Enough rows to span several chunks, so the delta can leave most of them out
+ROWS = 64
+ROW_SIZE = 16 * 1024
+
+def read_rows(db_path:str) -> typing.List[typing.Tuple[int, bytes]]:
+
+    connection = sqlite3.connect(db_path)
+
+    try:
+        return connection.execute("SELECT id, data FROM restore_test ORDER BY id").fetchall()
+
+    finally:
+        connection.close()
+
+@pytest.fixture(scope="module")
+def backups(tmp_path_factory:pytest.TempPathFactory) -> typing.Dict[str, typing.Any]:
+
+    directory = tmp_path_factory.mktemp("backups")
+
+    with main.engine.begin() as connection:
+        connection.execute(text("CREATE TABLE restore_test (id INTEGER PRIMARY KEY, data BLOB)"))
+
+        for row_id in range(ROWS):
+            connection.execute(text("INSERT INTO restore_test (id, data) VALUES (:id, randomblob(:size))"), {"id": row_id, "size": ROW_SIZE})
+
+    base_path = str(directory / "base.zip.pgp")
+    base_manifest = main.write_incremental_backup(main.DATABASE_PATH, "base", base_path, PASSPHRASE, None)
+    base_rows = read_rows(main.DATABASE_PATH)
+
+    with main.engine.begin() as connection:
+        connection.execute(text("UPDATE restore_test SET data = randomblob(:size) WHERE id = :id"), {"id": ROWS - 1, "size": ROW_SIZE})
+
+    delta_path = str(directory / "delta.zip.pgp")
+    delta_manifest = main.write_incremental_backup(main.DATABASE_PATH, "delta", delta_path, PASSPHRASE, base_manifest)
+
+    return {
+        "directory": directory,
+        "base": (base_path, base_manifest, base_rows),
+        "delta": (delta_path, delta_manifest, read_rows(main.DATABASE_PATH))
+    }
+
+@contextlib.contextmanager
+def open_archives(*paths:str) -> typing.Iterator[typing.List[zipfile.ZipFile]]:
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archives = [restore_backup.open_archive(path, PASSPHRASE, temp_dir) for path in paths]
+
+        try:
+            yield archives
+
+        finally:
+            for archive in archives:
+                archive.close()
+
+def test_delta_only_sends_changed_chunks(backups:typing.Dict[str, typing.Any]):
+
+    _, base_manifest, _ = backups["base"]
+    _, delta_manifest, _ = backups["delta"]
+
+    assert base_manifest["new_chunks"] == len(set(base_manifest["chunks"]))
+    assert delta_manifest["previous_id"] == "base" and delta_manifest["base_id"] == "base"
+    assert 0 < delta_manifest["new_chunks"] < len(delta_manifest["chunks"])
+
+def test_restore_newest_backup(backups:typing.Dict[str, typing.Any], tmp_path:typing.Any):
+
+    delta_path, delta_manifest, delta_rows = backups["delta"]
+    output_path = str(tmp_path / "restored.db")
+
+    with open_archives(delta_path, backups["base"][0]) as archives:
+        manifest = restore_backup.restore(archives, output_path, None)
+
+    assert manifest["backup_id"] == delta_manifest["backup_id"]
+    assert read_rows(output_path) == delta_rows
+
+def test_restore_older_backup(backups:typing.Dict[str, typing.Any], tmp_path:typing.Any):
+
+    base_path, _, base_rows = backups["base"]
+    output_path = str(tmp_path / "restored.db")
+
+    with open_archives(base_path, backups["delta"][0]) as archives:
+        restore_backup.restore(archives, output_path, "base")
+
+    assert read_rows(output_path) == base_rows
+
+def test_missing_base_is_named(backups:typing.Dict[str, typing.Any], tmp_path:typing.Any):
+
+    output_path = str(tmp_path / "restored.db")
+
+    with open_archives(backups["delta"][0]) as archives:
+        with pytest.raises(SystemExit, match="Backup base is missing"):
+            restore_backup.restore(archives, output_path, None)
+
+    assert os.listdir(tmp_path) == []
+
+def test_corrupt_chunk_leaves_nothing_behind(backups:typing.Dict[str, typing.Any], tmp_path:typing.Any):
+
+    base_path, base_manifest, base_rows = backups["base"]
+    output_path = str(tmp_path / "restored.db")
+    corrupt_path = str(backups["directory"] / "corrupt.zip")
+
+    ## Rewrite the decrypted base with the last chunk's bytes flipped, so the chunks before it are already written when it fails
+    with open_archives(base_path) as (archive,), zipfile.ZipFile(corrupt_path, "w") as corrupt:
+        for name in archive.namelist():
+            data = archive.read(name)
+            corrupt.writestr(name, bytes(byte ^ 0xFF for byte in data) if name == f"chunks/{base_manifest['chunks'][-1]}" else data)
+
+    with open_archives(corrupt_path) as archives:
+        with pytest.raises(SystemExit, match="is corrupt"):
+            restore_backup.restore(archives, output_path, None)
+
+    assert os.listdir(tmp_path) == []
+
+    ## Nothing is left in the way of trying again with a good copy
+    with open_archives(base_path) as archives:
+        restore_backup.restore(archives, output_path, None)
+
+    assert read_rows(output_path) == base_rows
@@ -0,0 +1,130 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/kadenbilyeu.com) (https://kadenbilyeu.com)
+## Use of this source code is governed by an GNU Affero General Public License v3.0
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import io
+import os
+import zipfile
+
+## third-party libraries
+import pytest
+
+## custom modules
+import main
+
+PAYLOAD = os.urandom(64 * 1024) + b"SQLite format 3\x00" * 4096
+
+class UnseekableBuffer(io.BytesIO):
+
+    """
+
+    A buffer that cannot seek or tell, like the gpg pipe backups are written to, so zipfile falls back to data descriptors.
+
+    """
+
+    def seekable(self) -> bool:
+        return False
+
+    def seek(self, *args) -> int:
+        raise io.UnsupportedOperation("seek")
+
+    def tell(self) -> int:
+        raise io.UnsupportedOperation("tell")
+
+def create_archive(compression:int, seekable:bool = True, force_zip64:bool = False, name:str = "blog.db", payload:bytes = PAYLOAD) -> bytes:
+
+    buffer = io.BytesIO() if seekable else UnseekableBuffer()
+
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        with archive.open(name, "w", force_zip64=force_zip64) as entry:
+            entry.write(payload)
+
+    return buffer.getvalue()
+
+def extract(archive:bytes, chunk_size:int = 4096) -> bytes:
+
+    output = io.BytesIO()
+    extractor = main.ZipEntryExtractor(output)
+
+    for start in range(0, len(archive), chunk_size):
+        assert extractor.feed(archive[start:start + chunk_size]) is False
+
+    extractor.feed(b"")
+    extractor.check()
+
+    return output.getvalue()
+
+def test_deflated_entry_with_data_descriptor():
+
+    archive = create_archive(zipfile.ZIP_DEFLATED, seekable=False)
+
+    ## The flag bit for a data descriptor, the header itself has no CRC
+    assert archive[6] & 0x8
+
+    assert extract(archive) == PAYLOAD
+
+def test_deflated_zip64_entry_with_data_descriptor():
+
+    archive = create_archive(zipfile.ZIP_DEFLATED, seekable=False, force_zip64=True)
+
+    assert extract(archive) == PAYLOAD
+
+def test_stored_entry():
+
+    archive = create_archive(zipfile.ZIP_STORED)
+
+    assert extract(archive) == PAYLOAD
+
+def test_stored_zip64_entry():
+
+    archive = create_archive(zipfile.ZIP_STORED, force_zip64=True)
+
+    assert extract(archive) == PAYLOAD
+
+def test_single_byte_chunks():
+
+    archive = create_archive(zipfile.ZIP_DEFLATED, seekable=False, payload=PAYLOAD[:2048])
+
+    assert extract(archive, chunk_size=1) == PAYLOAD[:2048]
+
+@pytest.mark.parametrize("compression, seekable", [(zipfile.ZIP_DEFLATED, False), (zipfile.ZIP_STORED, True)])
+def test_truncated_archive(compression:int, seekable:bool):
+
+    archive = create_archive(compression, seekable=seekable)
+
+    with pytest.raises(ValueError, match="ended before"):
+        extract(archive[:len(archive) // 2])
+
+def test_crc_mismatch_in_data_descriptor():
+
+    archive = bytearray(create_archive(zipfile.ZIP_DEFLATED, seekable=False))
+
+    ## The descriptor comes right before the central directory, after its own signature
+    descriptor = archive.rindex(b"PK\x07\x08")
+    archive[descriptor + 4] ^= 0xFF
+
+    with pytest.raises(ValueError, match="CRC"):
+        extract(bytes(archive))
+
+def test_crc_mismatch_in_stored_data():
+
+    archive = bytearray(create_archive(zipfile.ZIP_STORED))
+
+    ## Flip a byte of the payload itself, the header still has the original CRC
+    archive[30 + len("blog.db") + 100] ^= 0xFF
+
+    with pytest.raises(ValueError, match="CRC"):
+        extract(bytes(archive))
+
+def test_not_a_zip_archive():
+
+    with pytest.raises(ValueError, match="not a zip archive"):
+        extract(b"\x00" * 64)
+
+def test_incremental_backup_is_refused():
+
+    archive = create_archive(zipfile.ZIP_DEFLATED, name="manifest.json", payload=b"{}")
+
+    with pytest.raises(ValueError, match="restore_backup.py"):
+        extract(archive)
@@ -21,7 +21,7 @@ import EditPost from "../components/EditPost";
 import EmbedSEO from "../components/EmbedSEO";
 
 // utils
-import { getURL, formatDate, createSlug } from '../utils';
+import { getURL, formatDate } from '../utils';
 
 // context
 import { useTheme } from '../contexts/ThemeContext';
@@ -29,6 +29,7 @@ import { useTheme } from '../contexts/ThemeContext';
 interface BlogPost {
     id: string;
     title: string;
+    slug?: string;
     created_at: string;
     author: string;
     content: string;
@@ -213,7 +214,7 @@ const BlogDirectoryPage: React.FC = () => {
                         {blogPosts.length > 0 ? (
                             blogPosts.map(post => (
                                 <Link
-                                    to={`/blog/${createSlug(post.title)}`}
+                                    to={`/blog/${post.slug || post.id}`}
                                     key={post.id}
                                     style={{ width: '100%' }}
                                     state={{ from: location.pathname }}
@@ -19,7 +19,7 @@ import EditPost from "../components/EditPost";
 import EmbedSEO from '../components/EmbedSEO';
 
 // utils
-import { getURL, formatDate, createSlug } from '../utils';
+import { getURL, formatDate } from '../utils';
 
 // contexts
 import { useTheme } from '../contexts/ThemeContext';
@@ -28,6 +28,7 @@ interface BlogPost
 {
     id: string;
     title: string;
+    slug?: string;
     created_at: string;
     author: string;
     content: string;
@@ -364,7 +365,7 @@ const BlogPage: React.FC = () =>
                             {blogPosts.length > 0 ? (
                                 blogPosts.map(post => (
                                     <Link
-                                        to={`/blog/${createSlug(post.title)}`}
+                                        to={`/blog/${post.slug || post.id}`}
                                         key={post.id}
                                         style={{ width: '100%' }}
                                         state={{ from: location.pathname }}
@@ -15,7 +15,7 @@ import { ArrowBackIcon, EditIcon, DeleteIcon } from '@chakra-ui/icons';
 // components
 import BlogBackground from "../components/BlogBackground";
 import EditPost from "../components/EditPost";
-import { getURL, parseSlugOrId, createSlug } from '../utils';
+import { getURL, parseSlugOrId } from '../utils';
 import EmbedSEO from '../components/EmbedSEO';
 
 // markdown
@@ -31,6 +31,7 @@ import { useTheme } from '../contexts/ThemeContext';
 interface BlogPost {
     id: string;
     title: string;
+    slug?: string;
     content: string;
     author: string;
     view_count: number;
@@ -170,7 +171,7 @@ const BlogPostPage: React.FC = () => {
                 <EmbedSEO
                     title={`${blogPost.title} | Kaden Bilyeu's Blog`}
                     description={blogPost.content.replace(/[#*`\[\]]/g, '').substring(0, 160).trim() + (blogPost.content.length > 160 ? '...' : '')}
-                    url={`${window.location.origin}/blog/${createSlug(blogPost.title)}`}
+                    url={`${window.location.origin}/blog/${blogPost.slug || blogPost.id}`}
                     image={`${window.location.origin}/kb.webp`}
                     imageAlt="Kaden Bilyeu (Bikatr7) Profile Picture"
                     type="article"